@@ -2,12 +2,16 @@
 import argparse
 import pandas as pd
 import numpy as np
-from tqdm import tqdm
 import json
 from pathlib import Path
 import shutil
+import time
+import joblib
+
+from window_dataset import SeriesWindows, window_starts, save_series, load_windows
 
 def make_windows_for_cell(df_cell, lookback, horizon, feature_cols, target_col):
+    """Ruta anterior, celda a celda; se mantiene como referencia para el benchmark"""
     df_cell = df_cell.sort_values("time_bin")
     data = df_cell[feature_cols + [target_col]].values
     X_cell, y_cell = [], []
@@ -19,11 +23,82 @@ def make_windows_for_cell(df_cell, lookback, horizon, feature_cols, target_col):
         y_cell.append(y_window)
     return np.array(X_cell), np.array(y_cell)
 
+def make_windows(df, lookback, horizon, feature_cols, target_col):
+    """
+    Ventanas de todas las celdas a la vez. `df` debe venir ordenado por
+    (cell_id, time_bin) y sin nulos en las columnas usadas. Las ventanas son
+    vistas (sliding_window_view) sobre un único array; la única copia es la
+    selección final de las que no cruzan de una celda a otra. Mismo orden y
+    mismos valores que make_windows_for_cell celda a celda.
+    """
+    data = df[feature_cols + [target_col]].values
+    starts = window_starts(df["cell_id"].to_numpy(), lookback + horizon)
+    return SeriesWindows(data, starts, lookback, horizon)[:]
+
+def sort_for_windows(df, feature_cols, target_col):
+    """Un solo sort por (cell_id, time_bin), sin las filas con nulos en las columnas usadas"""
+    df = df.dropna(subset=feature_cols + [target_col])
+    return df.sort_values(["cell_id", "time_bin"], kind="stable").reset_index(drop=True)
+
+def benchmark_windows(cell_size_deg=0.1, n_minutes=24 * 60, occupancy=0.3, lookback=6, horizon=3, seed=42):
+    """
+    Compara el bucle por celda con make_windows sobre datos sintéticos: las
+    celdas de cell_size_deg de un área de 10° x 10°, un día a 1 min, con una
+    fracción `occupancy` de los minutos ocupados en cada celda.
+    """
+    rng = np.random.default_rng(seed)
+    n_cells = int(round(10 / cell_size_deg)) * int(round(10 / cell_size_deg))
+    rows_per_cell = int(n_minutes * occupancy)
+    cell_id = np.repeat(np.arange(n_cells, dtype=np.int32), rows_per_cell)
+    minutes = np.sort(rng.random((n_cells, n_minutes)).argsort(axis=1)[:, :rows_per_cell], axis=1).ravel()
+    feature_cols = ["congestion_count", "mean_velocity", "mean_altitude", "hour_sin", "hour_cos"]
+    df = pd.DataFrame(rng.normal(size=(len(cell_id), len(feature_cols))), columns=feature_cols)
+    df.insert(0, "cell_id", cell_id)
+    df.insert(1, "time_bin", pd.Timestamp("2025-01-01", tz="UTC") + pd.to_timedelta(minutes, unit="min"))
+    print(f"➡️  {n_cells} cells of {cell_size_deg} deg, {len(df)} rows")
+
+    start_time = time.time()
+    X_list, y_list = [], []
+    for cell, df_cell in df.groupby("cell_id", sort=False):
+        X_cell, y_cell = make_windows_for_cell(df_cell, lookback, horizon, feature_cols, "congestion_count")
+        if len(X_cell):
+            X_list.append(X_cell)
+            y_list.append(y_cell)
+    X_ref, y_ref = np.vstack(X_list), np.vstack(y_list)
+    loop_sec = time.time() - start_time
+
+    start_time = time.time()
+    X, y = make_windows(sort_for_windows(df, feature_cols, "congestion_count"),
+                        lookback, horizon, feature_cols, "congestion_count")
+    vectorized_sec = time.time() - start_time
+
+    identical = X.tobytes() == X_ref.tobytes() and y.tobytes() == y_ref.tobytes() and X.shape == X_ref.shape
+    print(f"✅ Windows: {len(X)}")
+    print(f"⏱️  Per-cell loop: {loop_sec:.2f} s")
+    print(f"⏱️  Vectorized: {vectorized_sec:.2f} s ({loop_sec / vectorized_sec:.1f}x)")
+    print(f"✅ Identical bytes: {identical}")
+    return loop_sec, vectorized_sec, identical
+
 def main(args):
     print(f"📌 Creating windows from {args.input_file}")
+    # Un Parquet o la carpeta con un Parquet por día que escribe prepare_dataset
     df = pd.read_parquet(args.input_file)
     print(f"✅ Loaded {len(df)} rows")
 
+    # meta.json de prepare_dataset: rejilla de celdas y columnas guardadas sin escalar
+    grid_meta_path = os.path.join(os.path.dirname(os.path.normpath(args.input_file)), "meta.json")
+    grid_meta = {}
+    if os.path.exists(grid_meta_path):
+        with open(grid_meta_path) as f:
+            grid_meta = json.load(f)
+    unscaled = grid_meta.get("unscaled_columns", [])
+    if unscaled:
+        if not args.scaler_file:
+            raise ValueError(f"{args.input_file} stores {unscaled} unscaled; pass the --scaler_file written by prepare_dataset.py")
+        scaler = joblib.load(args.scaler_file)
+        df[unscaled] = scaler.transform(df[unscaled])
+        print(f"✅ Scaled {unscaled} with {args.scaler_file}")
+
     all_columns = df.columns.tolist()
     print(f"➡️  Columns available: {all_columns}")
 
@@ -34,50 +109,27 @@ def main(args):
 
     Path(args.out_dir).mkdir(parents=True, exist_ok=True)
 
-    X_list, y_list = [], []
-    cell_ids = df["cell_id"].unique()
-    print(f"➡️  Found {len(cell_ids)} unique cells")
-
-    for cell in tqdm(cell_ids, desc="Processing cells"):
-        df_cell = df[df["cell_id"] == cell].copy()
-        df_cell = df_cell.sort_values("time_bin").reset_index(drop=True)
-        df_cell = df_cell.dropna(subset=features_cols + [target_col])
-        if len(df_cell) < args.lookback + args.horizon:
-            continue
-
-        X_cell, y_cell = make_windows_for_cell(
-            df_cell, args.lookback, args.horizon, features_cols, target_col
-        )
-        if len(X_cell) == 0:
-            continue
-
-        X_list.append(X_cell)
-        y_list.append(y_cell)
-
-    X_all = np.vstack(X_list)
-    y_all = np.vstack(y_list)
-    print(f"✅ Total samples: {X_all.shape[0]}")
-    print(f"✅ X shape: {X_all.shape}, y shape: {y_all.shape}")
-
-    n_samples = X_all.shape[0]
-    n_train = int(n_samples * (1 - args.test_frac))
-    X_train, X_val = X_all[:n_train], X_all[n_train:]
-    y_train, y_val = y_all[:n_train], y_all[n_train:]
-
-    np.savez_compressed(os.path.join(args.out_dir, "X_train.npz"), X_train)
-    np.savez_compressed(os.path.join(args.out_dir, "y_train.npz"), y_train)
-    np.savez_compressed(os.path.join(args.out_dir, "X_val.npz"), X_val)
-    np.savez_compressed(os.path.join(args.out_dir, "y_val.npz"), y_val)
+    df = sort_for_windows(df, features_cols, target_col)
+    print(f"➡️  Found {df['cell_id'].nunique()} unique cells")
 
     meta = {
+        "format": "series",
         "lookback": args.lookback,
         "horizon": args.horizon,
-        "n_features": X_train.shape[2],
+        "n_features": len(features_cols),
         "features_used": features_cols,
-        "target_column": target_col
+        "target_column": target_col,
+        "test_frac": args.test_frac,
     }
-    with open(os.path.join(args.out_dir, "meta.json"), "w") as f:
-        json.dump(meta, f, indent=2)
+    # Rejilla de celdas de prepare_dataset, para decodificar cell_id a lat/lon
+    if "cell_grid" in grid_meta:
+        meta["cell_grid"] = grid_meta["cell_grid"]
+
+    # Solo la serie de cada celda; las ventanas se cortan al entrenar (window_dataset.load_windows)
+    save_series(args.out_dir, df[features_cols + [target_col]].values, df["cell_id"].to_numpy(), meta)
+    train, val, _ = load_windows(args.out_dir)
+    print(f"✅ Series: {len(df)} rows x {len(features_cols) + 1} columns")
+    print(f"✅ Windows (lookback={args.lookback}, horizon={args.horizon}): {len(train)} train, {len(val)} val")
 
     if args.scaler_file:
         print(f"✅ Copying scaler from {args.scaler_file}")
@@ -89,11 +141,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Create LSTM windows from aggregated congestion data")
     parser.add_argument("--input_file", default="data/processed/aggregated_congestion.parquet")
     parser.add_argument("--out_dir", default="data/processed/windows")
-    parser.add_argument("--lookback", type=int, default=6)
-    parser.add_argument("--horizon", type=int, default=3)
+    parser.add_argument("--lookback", type=int, default=6, help="Default lookback stored in meta.json (can be overridden when training)")
+    parser.add_argument("--horizon", type=int, default=3, help="Default horizon stored in meta.json (can be overridden when training)")
     parser.add_argument("--test_frac", type=float, default=0.2)
     parser.add_argument("--features_columns", default="congestion_count,mean_velocity,mean_altitude,hour_sin,hour_cos")
     parser.add_argument("--target_column", default="congestion_count")
-    parser.add_argument("--scaler_file", default="data/processed/scaler.pkl", help="Path to the scaler to copy")
+    parser.add_argument("--scaler_file", default="data/processed/scaler.pkl", help="Scaler from prepare_dataset: applied to its unscaled columns and copied next to the windows")
+    parser.add_argument("--benchmark", action="store_true", help="Compare the per-cell loop with the vectorized windows on a synthetic 0.1 deg grid")
     args = parser.parse_args()
-    main(args)
+    if args.benchmark:
+        benchmark_windows(lookback=args.lookback, horizon=args.horizon)
+    else:
+        main(args)
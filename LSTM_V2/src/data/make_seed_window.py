@@ -2,20 +2,22 @@
 import argparse
 import numpy as np
 
+from window_dataset import load_windows
+
 def main(args):
     print(f"📌 Loading windows from {args.windows_dir}")
 
-    # Carga arrays
-    X_val = np.load(os.path.join(args.windows_dir, "X_val.npz"))["arr_0"]
-    print(f"✅ Loaded X_val with shape {X_val.shape}")
+    # Solo se corta la ventana pedida de la serie mapeada
+    _, val, meta = load_windows(args.windows_dir, args.lookback)
+    print(f"✅ Validation set has {len(val)} windows (lookback={meta['lookback']})")
 
     if args.index == -1:
-        window = X_val[-1]
+        window, _ = val[-1]
         print(f"✅ Using last window in validation set")
     else:
-        if args.index >= X_val.shape[0]:
-            raise ValueError(f"Index {args.index} out of bounds for X_val with {X_val.shape[0]} samples.")
-        window = X_val[args.index]
+        if args.index >= len(val):
+            raise ValueError(f"Index {args.index} out of bounds for validation set with {len(val)} windows.")
+        window, _ = val[args.index]
         print(f"✅ Using window at index {args.index}")
 
     print(f"➡️  Window shape: {window.shape}")
@@ -29,8 +31,9 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract a seed window (e.g., last validation window) to use for rolling forecast.")
-    parser.add_argument("--windows_dir", default="data/processed/windows", help="Folder with X_val.npz")
+    parser.add_argument("--windows_dir", default="data/processed/windows", help="Folder with the series written by create_windows.py")
     parser.add_argument("--index", type=int, default=-1, help="Index of window to use (-1 for last)")
+    parser.add_argument("--lookback", type=int, default=None, help="Window length (default: meta.json)")
     parser.add_argument("--out_file", default="my_start_window.npy", help="Output .npy file path")
     args = parser.parse_args()
     main(args)
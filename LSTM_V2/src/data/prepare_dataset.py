@@ -1,28 +1,85 @@
 ﻿import os
+import shutil
+import hashlib
 import argparse
+import json
 import pandas as pd
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 import joblib
 from sklearn.preprocessing import StandardScaler
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
 
-def load_all_files(input_dir):
-    """Carga todos los CSV o Parquet del directorio dado"""
-    dfs = []
-    files = [f for f in os.listdir(input_dir) if f.endswith((".csv", ".parquet"))]
+from distinct_counts import exact_distinct_pairs, HyperLogLog, HLL_PRECISION
+
+# Columnas que usa el resto del script; el resto no se lee
+USED_COLUMNS = ["icao24", "callsign", "latitude", "longitude", "baro_altitude", "on_ground", "velocity", "timestamp_ingest"]
+COLUMN_TYPES = {
+    "icao24": pa.string(),
+    "callsign": pa.string(),
+    "latitude": pa.float64(),
+    "longitude": pa.float64(),
+    "baro_altitude": pa.float64(),
+    "on_ground": pa.bool_(),
+    "velocity": pa.float64(),
+    "timestamp_ingest": pa.string(),
+}
+
+def scan_filter():
+    """Filtros de clean_data que se pueden aplicar durante la lectura"""
+    return (
+        (ds.field("on_ground") == False)
+        & (ds.field("latitude") >= -90) & (ds.field("latitude") <= 90)
+        & (ds.field("longitude") >= -180) & (ds.field("longitude") <= 180)
+    )
+
+def read_csv_file(path):
+    table = pv.read_csv(
+        path,
+        convert_options=pv.ConvertOptions(
+            include_columns=USED_COLUMNS,
+            include_missing_columns=True,
+            column_types=COLUMN_TYPES,
+            strings_can_be_null=True,  # como pandas: "" -> nulo
+        ),
+    )
+    return ds.dataset(table).to_table(filter=scan_filter())
+
+def list_input_files(input_dir):
+    """Nombres de los CSV o Parquet del directorio, ordenados"""
+    files = sorted(f for f in os.listdir(input_dir) if f.endswith((".csv", ".parquet")))
     if not files:
         raise ValueError(f"No CSV or Parquet files found in {input_dir}")
+    return files
 
+def load_files(paths, n_workers=None):
+    """
+    Carga los CSV o Parquet dados, solo con USED_COLUMNS y aplicando ya los
+    filtros de on_ground y lat/lon. Los Parquet se leen como un dataset de
+    Arrow (filtro y columnas empujados al escaneo); los CSV, en paralelo con
+    un pool de hilos (el lector de Arrow libera el GIL).
+    """
+    csv_paths = [p for p in paths if p.endswith(".csv")]
+    parquet_paths = [p for p in paths if p.endswith(".parquet")]
+
+    tables = []
+    if parquet_paths:
+        dataset = ds.dataset(parquet_paths, format="parquet")
+        tables.append(dataset.to_table(columns=USED_COLUMNS, filter=scan_filter()).cast(pa.schema(COLUMN_TYPES)))
+    if csv_paths:
+        with ThreadPoolExecutor(max_workers=n_workers or os.cpu_count()) as pool:
+            tables.extend(tqdm(pool.map(read_csv_file, csv_paths), total=len(csv_paths), desc="Reading files"))
+    return pa.concat_tables(tables).to_pandas()
+
+def load_all_files(input_dir, n_workers=None):
+    """Carga todos los CSV o Parquet del directorio dado (ver load_files)"""
+    files = list_input_files(input_dir)
     print(f"🗂️  Loading {len(files)} files from {input_dir}")
-    for file in tqdm(files, desc="Reading files"):
-        path = os.path.join(input_dir, file)
-        if file.endswith(".csv"):
-            df = pd.read_csv(path)
-        else:
-            df = pd.read_parquet(path)
-        dfs.append(df)
-    return pd.concat(dfs, ignore_index=True)
+    return load_files([os.path.join(input_dir, f) for f in files], n_workers)
 
 def clean_data(df):
     """Limpieza básica de datos: nulos, formatos"""
@@ -35,11 +92,51 @@ def clean_data(df):
     print(f"✅ Cleaned data: {initial_len} → {len(df)} rows")
     return df
 
+def cell_bins(values, cell_size_deg):
+    """
+    floor(valor / cell_size_deg) tolerante a errores de coma flotante: el
+    cociente se redondea a 9 decimales antes del floor, para que p. ej.
+    0.3 / 0.1 = 2.9999999999999996 caiga en el bin 3 y no en el 2. Así un
+    bin grueso es siempre el floor-division del bin fino (ver derive_state).
+    """
+    return np.floor(np.round(np.asarray(values, dtype=np.float64) / cell_size_deg, 9)).astype(np.int64)
+
+def cell_grid(cell_size_deg):
+    """
+    Rejilla global fija para codificar celdas como enteros: el codigo de
+    (lat_bin, lon_bin) es (lat_bin - lat_min_bin) * n_lon + (lon_bin - lon_min_bin).
+    No depende de los datos, asi que el mismo codigo es la misma celda en
+    cualquier ejecucion con el mismo cell_size_deg.
+    """
+    lat_min_bin, lat_max_bin = (int(b) for b in cell_bins([-90, 90], cell_size_deg))
+    lon_min_bin, lon_max_bin = (int(b) for b in cell_bins([-180, 180], cell_size_deg))
+    n_lat = lat_max_bin - lat_min_bin + 1
+    n_lon = lon_max_bin - lon_min_bin + 1
+    return {
+        "cell_size_deg": cell_size_deg,
+        "lat_min_bin": lat_min_bin,
+        "lon_min_bin": lon_min_bin,
+        "n_lat": n_lat,
+        "n_lon": n_lon,
+    }
+
+def cell_dtype(grid):
+    """int32 para los códigos de celda salvo que la rejilla no quepa (celdas muy finas)"""
+    return np.int32 if grid["n_lat"] * grid["n_lon"] <= np.iinfo(np.int32).max else np.int64
+
+def decode_cells(cell_ids, grid):
+    """Codigos de celda -> (lat_bin, lon_bin, lat_min, lon_min) de la esquina suroeste"""
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    lat_bin = cell_ids // grid["n_lon"] + grid["lat_min_bin"]
+    lon_bin = cell_ids % grid["n_lon"] + grid["lon_min_bin"]
+    return lat_bin, lon_bin, lat_bin * grid["cell_size_deg"], lon_bin * grid["cell_size_deg"]
+
 def assign_cells(df, cell_size_deg):
-    """Asigna grid cell_id por lat/lon"""
-    df["lat_bin"] = (df["latitude"] // cell_size_deg).astype(int)
-    df["lon_bin"] = (df["longitude"] // cell_size_deg).astype(int)
-    df["cell_id"] = df["lat_bin"].astype(str) + "_" + df["lon_bin"].astype(str)
+    """Asigna grid cell_id (entero, ver cell_grid) por lat/lon"""
+    grid = cell_grid(cell_size_deg)
+    lat_bin = cell_bins(df["latitude"].to_numpy(), cell_size_deg)
+    lon_bin = cell_bins(df["longitude"].to_numpy(), cell_size_deg)
+    df["cell_id"] = ((lat_bin - grid["lat_min_bin"]) * grid["n_lon"] + (lon_bin - grid["lon_min_bin"])).astype(cell_dtype(grid))
     return df
 
 def bin_time(df, time_bin):
@@ -53,16 +150,144 @@ def bin_time(df, time_bin):
     df["time_bin"] = df["timestamp"].dt.floor(time_bin)
     return df
 
-def aggregate_features(df):
-    """Agrega métricas por cell_id y time_bin"""
-    agg = df.groupby(["cell_id", "time_bin"]).agg(
-        congestion_count=("icao24", "nunique"),
-        mean_velocity=("velocity", "mean"),
-        std_velocity=("velocity", "std"),
-        mean_altitude=("baro_altitude", "mean"),
-        std_altitude=("baro_altitude", "std"),
-        n_callsigns=("callsign", "nunique"),
-    ).reset_index()
+KEYS = ["cell_id", "time_bin"]
+# Columna de origen de cada conteo de valores distintos y de cada media/std
+DISTINCT_COLUMNS = {"congestion_count": "icao24", "n_callsigns": "callsign"}
+MOMENT_COLUMNS = {"velocity": "velocity", "altitude": "baro_altitude"}
+
+def partial_aggregate(df, distinct="exact", precision=HLL_PRECISION):
+    """
+    Estado combinable de aggregate_features por (cell_id, time_bin): para
+    velocidad y altitud, los momentos (n, media, M2); para cada conteo de
+    distintos, los pares (grupo, valor) únicos (distinct="exact") o un
+    sketch HyperLogLog (distinct="hll"). "group" indexa las filas de moments.
+    """
+    groups = df.groupby(KEYS, sort=True)
+    spec = {}
+    for name, column in MOMENT_COLUMNS.items():
+        spec[f"n_{name}"] = (column, "count")
+        spec[f"mean_{name}"] = (column, "mean")
+        spec[f"std_{name}"] = (column, "std")
+    moments = groups.agg(**spec).reset_index()
+    for name in MOMENT_COLUMNS:
+        std = moments.pop(f"std_{name}")
+        moments[f"m2_{name}"] = (std ** 2 * (moments[f"n_{name}"] - 1)).fillna(0)
+
+    group_ids = groups.ngroup().to_numpy()
+    sets = {}
+    for name, column in DISTINCT_COLUMNS.items():
+        if distinct == "hll":
+            sets[name] = HyperLogLog.from_values(group_ids, df[column], groups.ngroups, precision)
+        else:
+            pair_groups, pair_values = exact_distinct_pairs(group_ids, df[column])
+            sets[name] = pd.DataFrame({"group": pair_groups, "value": pair_values})
+    return {"distinct": distinct, "precision": precision, "moments": moments, "sets": sets}
+
+def _regroup(state, keys):
+    """
+    Combina las filas del estado que comparten clave en keys (DataFrame con
+    KEYS, alineado con state["moments"]): momentos con la fórmula de Chan,
+    pares únicos por unión y sketches HLL por máximo de registros.
+    """
+    stacked = state["moments"]
+    groups = keys.groupby(KEYS, sort=True)
+    group_ids = groups.ngroup().to_numpy()
+    n_groups = groups.ngroups
+    moments = groups.size().reset_index()[KEYS]
+    for name in MOMENT_COLUMNS:
+        n = stacked[f"n_{name}"].to_numpy()
+        mean = np.nan_to_num(stacked[f"mean_{name}"].to_numpy())
+        total = np.bincount(group_ids, weights=n, minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            merged_mean = np.bincount(group_ids, weights=n * mean, minlength=n_groups) / total
+        spread = n * (mean - np.nan_to_num(merged_mean)[group_ids]) ** 2
+        moments[f"n_{name}"] = total.astype(np.int64)
+        moments[f"mean_{name}"] = merged_mean
+        moments[f"m2_{name}"] = (np.bincount(group_ids, weights=stacked[f"m2_{name}"].to_numpy(), minlength=n_groups)
+                                 + np.bincount(group_ids, weights=spread, minlength=n_groups))
+
+    sets = {}
+    for name, sketch in state["sets"].items():
+        if state["distinct"] == "hll":
+            sets[name] = sketch.rollup(group_ids, n_groups)
+        else:
+            pair_groups, pair_values = exact_distinct_pairs(group_ids[sketch["group"].to_numpy()], sketch["value"])
+            sets[name] = pd.DataFrame({"group": pair_groups, "value": pair_values})
+    return {"distinct": state["distinct"], "precision": state["precision"], "moments": moments, "sets": sets}
+
+def merge_partials(states):
+    """
+    Combina estados de partial_aggregate de forma exacta. Sirve para filas
+    de un mismo time_bin repartidas entre varios archivos, ejecuciones o procesos.
+    """
+    states = list(states)
+    distinct, precision = states[0]["distinct"], states[0]["precision"]
+    if any((s["distinct"], s["precision"]) != (distinct, precision) for s in states):
+        raise ValueError("Cannot merge aggregation states with different distinct settings")
+
+    # Se apilan los estados (desplazando los índices de grupo) y se reagrupa por clave
+    offsets = np.cumsum([0] + [len(s["moments"]) for s in states])
+    sets = {}
+    for name in DISTINCT_COLUMNS:
+        if distinct == "hll":
+            sets[name] = HyperLogLog(
+                np.concatenate([s["sets"][name].group + offset for s, offset in zip(states, offsets)]),
+                np.concatenate([s["sets"][name].register for s in states]),
+                np.concatenate([s["sets"][name].rank for s in states]),
+                offsets[-1], precision,
+            )
+        else:
+            sets[name] = pd.concat([
+                s["sets"][name].assign(group=s["sets"][name]["group"] + offset)
+                for s, offset in zip(states, offsets)
+            ], ignore_index=True)
+    moments = pd.concat([s["moments"] for s in states], ignore_index=True)
+    stacked = {"distinct": distinct, "precision": precision, "moments": moments, "sets": sets}
+    return _regroup(stacked, moments[KEYS])
+
+def derive_state(state, base_cell_size_deg, base_time_bin, cell_size_deg=None, time_bin=None):
+    """
+    Estado a una resolución más gruesa a partir de uno más fino (el "cubo"):
+    cell_size_deg debe ser múltiplo entero de base_cell_size_deg y time_bin
+    múltiplo entero de base_time_bin. No se leen datos crudos.
+    """
+    keys = state["moments"][KEYS].copy()
+    if cell_size_deg is not None and cell_size_deg != base_cell_size_deg:
+        factor = cell_size_deg / base_cell_size_deg
+        if abs(factor - round(factor)) > 1e-9 or round(factor) < 1:
+            raise ValueError(f"cell_size_deg {cell_size_deg} is not a multiple of the base {base_cell_size_deg}")
+        factor = int(round(factor))
+        base_grid, grid = cell_grid(base_cell_size_deg), cell_grid(cell_size_deg)
+        lat_bin, lon_bin, _, _ = decode_cells(keys["cell_id"], base_grid)
+        # floor(floor(x / base) / k) == floor(x / (base * k)) con k entero; vale porque
+        # cell_bins redondea el cociente antes del floor (con // a secas no siempre)
+        lat_bin, lon_bin = lat_bin // factor, lon_bin // factor
+        keys["cell_id"] = ((lat_bin - grid["lat_min_bin"]) * grid["n_lon"]
+                           + (lon_bin - grid["lon_min_bin"])).astype(cell_dtype(grid))
+    if time_bin is not None and pd.Timedelta(time_bin) != pd.Timedelta(base_time_bin):
+        step, base_step = pd.Timedelta(time_bin), pd.Timedelta(base_time_bin)
+        if step < base_step or step % base_step != pd.Timedelta(0):
+            raise ValueError(f"time_bin {time_bin} is not a multiple of the base {base_time_bin}")
+        keys["time_bin"] = keys["time_bin"].dt.floor(time_bin)
+    return _regroup(state, keys)
+
+def distinct_counts(state, name):
+    n_groups = len(state["moments"])
+    if state["distinct"] == "hll":
+        return np.rint(state["sets"][name].estimate()).astype(np.int64)
+    return np.bincount(state["sets"][name]["group"].to_numpy(), minlength=n_groups)
+
+def finalize_aggregate(state):
+    """Tabla agregada (mismas columnas que aggregate_features) a partir de un estado"""
+    moments = state["moments"]
+    agg = moments[KEYS].copy()
+    agg["congestion_count"] = distinct_counts(state, "congestion_count")
+    for name in MOMENT_COLUMNS:
+        n = moments[f"n_{name}"].to_numpy()
+        agg[f"mean_{name}"] = moments[f"mean_{name}"].to_numpy()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            agg[f"std_{name}"] = np.where(n > 1, np.sqrt(moments[f"m2_{name}"].to_numpy() / (n - 1)), np.nan)
+    agg["n_callsigns"] = distinct_counts(state, "n_callsigns")
 
     # Features horarias
     agg["hour"] = agg["time_bin"].dt.hour + agg["time_bin"].dt.minute / 60
@@ -75,44 +300,330 @@ def aggregate_features(df):
 
     return agg
 
-def save_outputs(df, out_dir, base_name):
-    """Guarda DataFrame en Parquet y opcional CSV"""
-    Path(out_dir).mkdir(parents=True, exist_ok=True)
-    parquet_path = os.path.join(out_dir, f"{base_name}.parquet")
-    csv_path = os.path.join(out_dir, f"{base_name}.csv")
-    df.to_parquet(parquet_path, index=False)
-    df.to_csv(csv_path, index=False)
-    print(f"💾 Saved: {parquet_path}")
-    print(f"💾 Saved: {csv_path}")
-
-def main(args):
-    print("📌 Starting dataset preparation")
-    print(f"➡️  Input: {args.input_dir}")
-    print(f"➡️  Output: {args.out_dir}")
-    print(f"➡️  Cell size: {args.cell_size_deg} deg")
-    print(f"➡️  Time bin: {args.time_bin}")
+def aggregate_features(df, distinct="exact", precision=HLL_PRECISION):
+    """
+    Agrega métricas por cell_id y time_bin. Los conteos de valores distintos
+    se calculan con distinct_counts: distinct="exact" (pares enteros únicos,
+    mismo resultado que nunique) o "hll" (HyperLogLog, error ~1.04/sqrt(2^precision)).
+    """
+    return finalize_aggregate(partial_aggregate(df, distinct, precision))
 
-    raw = load_all_files(args.input_dir)
+def aggregate_files(paths, cell_size_deg, time_bin, distinct="exact", precision=HLL_PRECISION, n_workers=None):
+    """clean_data → assign_cells → bin_time → partial_aggregate sobre los archivos dados"""
+    raw = load_files(paths, n_workers)
     print(f"✅ Loaded {len(raw)} rows total")
 
     clean = clean_data(raw)
 
-    cells = assign_cells(clean, args.cell_size_deg)
+    cells = assign_cells(clean, cell_size_deg)
 
-    binned = bin_time(cells, args.time_bin)
+    binned = bin_time(cells, time_bin)
 
-    agg = aggregate_features(binned)
-    print(f"✅ Aggregated to {len(agg)} rows (cell_id x time_bin)")
+    return partial_aggregate(binned, distinct, precision)
 
+def make_shards(paths, n_shards):
+    """Reparte los archivos en n_shards grupos de tamaño parecido (el mayor, al grupo más ligero)"""
+    shards = [[] for _ in range(min(n_shards, len(paths)))]
+    loads = [0] * len(shards)
+    for path in sorted(paths, key=os.path.getsize, reverse=True):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(path)
+        loads[lightest] += os.path.getsize(path)
+    return shards
+
+def sharded_aggregate(paths, cell_size_deg, time_bin, distinct="exact", precision=HLL_PRECISION, n_processes=None):
+    """
+    Igual que aggregate_files, pero repartiendo los archivos entre un pool de
+    procesos: cada shard limpia, asigna celdas, agrupa en el tiempo y agrega
+    sus archivos, y los estados parciales se combinan con merge_partials. Un
+    mismo time_bin puede aparecer en varios shards; la combinación es exacta.
+    """
+    shards = make_shards(paths, n_processes or os.cpu_count())
+    print(f"➡️  Aggregating {len(paths)} files in {len(shards)} shards")
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        futures = [
+            pool.submit(aggregate_files, shard, cell_size_deg, time_bin, distinct, precision, 1)
+            for shard in shards
+        ]
+        states = [future.result() for future in tqdm(futures, desc="Aggregating shards")]
+    return merge_partials(states)
+
+# ─────────────── Estado incremental ───────────────
+# El estado y la tabla agregada se guardan por día (el del time_bin): con
+# --append solo se leen y reescriben los días que tocan los archivos nuevos.
+#   aggregation_state/days/<día>/      momentos y pares únicos o sketches del día
+#   aggregation_state/state.json       parámetros, archivos procesados y, por día,
+#                                      n, suma y suma de cuadrados de congestion_count
+#   aggregated_congestion.parquet/<día>.parquet   la tabla, con congestion_count sin escalar
+STATE_DIR = "aggregation_state"
+DAYS_DIR = "days"
+OUTPUT_NAME = "aggregated_congestion"
+
+def split_days(state):
+    """{día 'YYYY-MM-DD': estado con solo los time_bin de ese día}"""
+    moments = state["moments"]
+    day_codes, days = pd.factorize(moments["time_bin"].dt.strftime("%Y-%m-%d"), sort=True)
+    bounds = np.arange(len(days) + 1)
+    row_order = np.argsort(day_codes, kind="stable")
+    row_bounds = np.searchsorted(day_codes[row_order], bounds)
+    # Posición de cada fila de moments dentro de su día
+    local = np.empty(len(moments), dtype=np.int64)
+    local[row_order] = np.arange(len(moments)) - row_bounds[day_codes[row_order]]
+
+    # Las entradas de los conjuntos, ordenadas por el día de su grupo
+    set_slices = {}
+    for name, sketch in state["sets"].items():
+        groups = sketch.group if state["distinct"] == "hll" else sketch["group"].to_numpy()
+        order = np.argsort(day_codes[groups], kind="stable")
+        set_slices[name] = (groups, order, np.searchsorted(day_codes[groups][order], bounds))
+
+    result = {}
+    for k, day in enumerate(days):
+        rows = row_order[row_bounds[k]:row_bounds[k + 1]]
+        sets = {}
+        for name, (groups, order, set_bounds) in set_slices.items():
+            picked = order[set_bounds[k]:set_bounds[k + 1]]
+            sketch = state["sets"][name]
+            if state["distinct"] == "hll":
+                sets[name] = HyperLogLog(local[groups[picked]], sketch.register[picked], sketch.rank[picked],
+                                         len(rows), sketch.precision)
+            else:
+                sets[name] = pd.DataFrame({"group": local[groups[picked]],
+                                           "value": sketch["value"].to_numpy()[picked]})
+        result[day] = {"distinct": state["distinct"], "precision": state["precision"],
+                       "moments": moments.iloc[rows].reset_index(drop=True), "sets": sets}
+    return result
+
+def save_day(state, state_dir, day):
+    day_dir = os.path.join(state_dir, DAYS_DIR, day)
+    Path(day_dir).mkdir(parents=True, exist_ok=True)
+    state["moments"].to_parquet(os.path.join(day_dir, "moments.parquet"), index=False)
+    for name, sketch in state["sets"].items():
+        if state["distinct"] == "hll":
+            np.savez(os.path.join(day_dir, f"{name}.npz"), **sketch.to_dict())
+        else:
+            sketch.to_parquet(os.path.join(day_dir, f"{name}.parquet"), index=False)
+
+def load_day(state_dir, day, distinct, precision):
+    day_dir = os.path.join(state_dir, DAYS_DIR, day)
+    sets = {}
+    for name in DISTINCT_COLUMNS:
+        if distinct == "hll":
+            sets[name] = HyperLogLog.from_dict(np.load(os.path.join(day_dir, f"{name}.npz")))
+        else:
+            sets[name] = pd.read_parquet(os.path.join(day_dir, f"{name}.parquet"))
+    return {
+        "distinct": distinct,
+        "precision": precision,
+        "moments": pd.read_parquet(os.path.join(day_dir, "moments.parquet")),
+        "sets": sets,
+    }
+
+def read_state_meta(out_dir):
+    """state.json guardado por save_state, o None si no hay"""
+    meta_path = os.path.join(out_dir, STATE_DIR, "state.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if "days" not in meta:
+        raise ValueError(f"The aggregation state in {out_dir} uses an older layout, rebuild it from raw data")
+    return meta
+
+def load_state(out_dir):
+    """(estado completo, state.json) guardados por save_state, o (None, None) si no hay"""
+    meta = read_state_meta(out_dir)
+    if meta is None:
+        return None, None
+    state_dir = os.path.join(out_dir, STATE_DIR)
+    days = [load_day(state_dir, day, meta["distinct"], meta["precision"]) for day in sorted(meta["days"])]
+    return merge_partials(days), meta
+
+def clear_outputs(out_dir):
+    """Borra el estado y la tabla de una ejecución anterior (también el Parquet de un solo archivo)"""
+    for path in (os.path.join(out_dir, STATE_DIR), os.path.join(out_dir, f"{OUTPUT_NAME}.parquet"),
+                 os.path.join(out_dir, f"{OUTPUT_NAME}.csv")):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+def save_state(days, out_dir, settings, processed_files, day_stats=None, write_csv=False):
+    """
+    Guarda cada día de `days` (estado y tabla agregada) y luego state.json
+    con los parámetros, los archivos crudos procesados y las sumas de
+    congestion_count por día. `day_stats` son las de los días ya guardados
+    que no se tocan; state.json se escribe al final.
+    """
+    state_dir = os.path.join(out_dir, STATE_DIR)
+    day_stats = dict(day_stats or {})
+    for day, state in tqdm(days.items(), desc="Saving days"):
+        save_day(state, state_dir, day)
+        agg = finalize_aggregate(state)
+        save_outputs(agg, os.path.join(out_dir, f"{OUTPUT_NAME}.parquet"), day,
+                     os.path.join(out_dir, f"{OUTPUT_NAME}.csv") if write_csv else None)
+        counts = agg["congestion_count"].to_numpy(dtype=np.int64)
+        day_stats[day] = {"n": len(counts), "sum": int(counts.sum()), "sumsq": int((counts ** 2).sum())}
+    with open(os.path.join(state_dir, "state.json"), "w") as f:
+        json.dump({**settings, "processed_files": processed_files, "days": day_stats}, f, indent=2)
+    print(f"💾 Saved {len(days)} days to {state_dir} and {OUTPUT_NAME}.parquet/")
+    return day_stats
+
+def scaler_from_stats(day_stats):
+    """
+    StandardScaler de congestion_count a partir de las sumas por día: las
+    sumas son enteras y exactas, así que da lo mismo que ajustarlo sobre
+    toda la tabla, sin leerla.
+    """
+    n = sum(s["n"] for s in day_stats.values())
+    total = sum(s["sum"] for s in day_stats.values())
+    total_sq = sum(s["sumsq"] for s in day_stats.values())
+    var = (n * total_sq - total * total) / (n * n)
     scaler = StandardScaler()
-    agg["congestion_count"] = scaler.fit_transform(agg[["congestion_count"]])
-    print(f"✅ Scaled congestion_count (mean={scaler.mean_[0]:.3f}, std={scaler.scale_[0]:.3f})")
+    scaler.n_features_in_ = 1
+    scaler.feature_names_in_ = np.array(["congestion_count"], dtype=object)
+    scaler.n_samples_seen_ = np.int64(n)
+    scaler.mean_ = np.array([total / n])
+    scaler.var_ = np.array([var])
+    scaler.scale_ = np.array([np.sqrt(var) if var > 0 else 1.0])
+    return scaler
+
+def save_outputs(df, out_dir, base_name, csv_dir=None):
+    """Guarda DataFrame en Parquet y opcional CSV (en csv_dir)"""
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    df.to_parquet(os.path.join(out_dir, f"{base_name}.parquet"), index=False)
+    if csv_dir:
+        Path(csv_dir).mkdir(parents=True, exist_ok=True)
+        df.to_csv(os.path.join(csv_dir, f"{base_name}.csv"), index=False)
+
+def save_meta(out_dir, cell_size_deg, time_bin):
+    """
+    Guarda en meta.json la rejilla de celdas, para poder decodificar cell_id,
+    y qué columnas de la tabla se guardan sin escalar (create_windows las escala)
+    """
+    meta = {"cell_grid": cell_grid(cell_size_deg), "time_bin": time_bin, "unscaled_columns": ["congestion_count"]}
+    meta_path = os.path.join(out_dir, "meta.json")
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    print(f"💾 Saved: {meta_path}")
+
+def file_stamp(path, known=None):
+    """
+    Tamaño, mtime y SHA-256 de un archivo crudo. Si tamaño y mtime coinciden
+    con `known` (lo guardado) se reutiliza su hash sin releer el archivo; si
+    solo cambió el mtime (p. ej. tras un git clone) se rehace el hash.
+    """
+    stat = os.stat(path)
+    if known and known.get("size") == stat.st_size and known.get("mtime_ns") == stat.st_mtime_ns:
+        return known
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+
+def state_from_raw(args, settings):
+    """
+    (días nuevos o modificados, archivos procesados, state.json anterior o
+    None) desde data/raw: todo, o con --append solo los archivos nuevos,
+    combinados con los días guardados que se solapan. Sin nada nuevo, los
+    días son None.
+    """
+    files = list_input_files(args.input_dir)
+    previous_meta = read_state_meta(args.out_dir) if args.append else None
+    done = previous_meta["processed_files"] if previous_meta is not None else {}
+    stamps = {f: file_stamp(os.path.join(args.input_dir, f), done.get(f)) for f in files}
+
+    if previous_meta is not None:
+        changed_settings = {k: v for k, v in settings.items() if previous_meta.get(k) != v}
+        if changed_settings:
+            raise ValueError(f"Append mode needs the same settings as the saved state: {changed_settings}")
+        changed = [f for f in files if f in done and done[f].get("sha256") != stamps[f]["sha256"]]
+        if changed:
+            raise ValueError(f"Already processed files changed, rerun without --append: {changed}")
+        files = [f for f in files if f not in done]
+        if not files:
+            print("✅ No new files to process")
+            return None, None, previous_meta
+        print(f"➡️  Append mode: {len(files)} new files ({len(done)} already processed)")
+    elif args.append:
+        print("➡️  No saved aggregation state; processing everything")
+
+    print(f"🗂️  Loading {len(files)} files from {args.input_dir}")
+    paths = [os.path.join(args.input_dir, f) for f in files]
+    if args.processes > 1:
+        state = sharded_aggregate(paths, args.cell_size_deg, args.time_bin, args.distinct,
+                                  args.hll_precision, args.processes)
+    else:
+        state = aggregate_files(paths, args.cell_size_deg, args.time_bin, args.distinct,
+                                args.hll_precision, args.workers)
+    days = split_days(state)
+    processed_files = {f: stamps[f] for f in files}
+    if previous_meta is not None:
+        # Solo los días que ya estaban se combinan con lo guardado; el resto se añade tal cual
+        state_dir = os.path.join(args.out_dir, STATE_DIR)
+        overlapping = [day for day in days if day in previous_meta["days"]]
+        print(f"➡️  {len(days)} days in the new files, {len(overlapping)} merged with the saved state")
+        for day in overlapping:
+            saved = load_day(state_dir, day, previous_meta["distinct"], previous_meta["precision"])
+            days[day] = merge_partials([saved, days[day]])
+        # Los ya procesados, con el mtime actual para no volver a hashearlos
+        processed_files = {**done, **{f: stamps[f] for f in stamps if f in done}, **processed_files}
+    return days, processed_files, previous_meta
+
+def state_from_cube(args, settings):
+    """Días a la resolución pedida derivados del estado fino guardado en --from_state"""
+    if os.path.realpath(args.from_state) == os.path.realpath(args.out_dir):
+        raise ValueError(f"--out_dir is the cube folder {args.from_state}; write the derived dataset elsewhere")
+    cube, cube_meta = load_state(args.from_state)
+    if cube is None:
+        raise ValueError(f"No aggregation state found in {args.from_state}")
+    if cube_meta.get("cell_grid") != cell_grid(cube_meta["cell_size_deg"]):
+        raise ValueError(f"The cube in {args.from_state} uses an older cell grid, rebuild it from raw data")
+    print(f"➡️  Deriving from cube in {args.from_state} "
+          f"({cube_meta['cell_size_deg']} deg, {cube_meta['time_bin']})")
+    state = derive_state(cube, cube_meta["cell_size_deg"], cube_meta["time_bin"], args.cell_size_deg, args.time_bin)
+    settings.update(distinct=cube_meta["distinct"], precision=cube_meta["precision"])
+    return split_days(state), cube_meta["processed_files"]
+
+def main(args):
+    print("📌 Starting dataset preparation")
+    print(f"➡️  Input: {args.from_state or args.input_dir}")
+    print(f"➡️  Output: {args.out_dir}")
+    print(f"➡️  Cell size: {args.cell_size_deg} deg")
+    print(f"➡️  Time bin: {args.time_bin}")
+
+    settings = {
+        "cell_size_deg": args.cell_size_deg,
+        "time_bin": args.time_bin,
+        # cell_id depende de la rejilla; un estado con otra rejilla no se puede combinar
+        "cell_grid": cell_grid(args.cell_size_deg),
+        "distinct": args.distinct,
+        "precision": args.hll_precision,
+    }
+    if args.from_state:
+        days, processed_files = state_from_cube(args, settings)
+        previous_meta = None
+    else:
+        days, processed_files, previous_meta = state_from_raw(args, settings)
+        if days is None:
+            return
+
+    if previous_meta is None:
+        clear_outputs(args.out_dir)
+    Path(args.out_dir).mkdir(parents=True, exist_ok=True)
+    day_stats = save_state(days, args.out_dir, settings, processed_files,
+                           previous_meta["days"] if previous_meta else None, args.write_csv)
+    print(f"✅ Aggregated {sum(s['n'] for s in day_stats.values())} rows (cell_id x time_bin) in {len(day_stats)} days")
 
+    # congestion_count se guarda sin escalar; el scaler sale de las sumas por día, sin releer la tabla
+    scaler = scaler_from_stats(day_stats)
+    print(f"✅ Scaler for congestion_count (mean={scaler.mean_[0]:.3f}, std={scaler.scale_[0]:.3f})")
     scaler_path = os.path.join(args.out_dir, "scaler.pkl")
     joblib.dump(scaler, scaler_path)
     print(f"💾 Saved scaler to {scaler_path}")
 
-    save_outputs(agg, args.out_dir, "aggregated_congestion")
+    save_meta(args.out_dir, args.cell_size_deg, args.time_bin)
 
     print("🎯 Dataset preparation complete!")
 
@@ -122,5 +633,12 @@ if __name__ == "__main__":
     parser.add_argument("--out_dir", default="data/processed", help="Output folder")
     parser.add_argument("--cell_size_deg", type=float, default=0.5, help="Grid cell size in degrees")
     parser.add_argument("--time_bin", default="1min", help="Time bin size (e.g., '1min', '5min')")
+    parser.add_argument("--distinct", choices=["exact", "hll"], default="exact", help="Distinct counts: exact or HyperLogLog")
+    parser.add_argument("--hll_precision", type=int, default=HLL_PRECISION, help="HyperLogLog precision (2^p registers)")
+    parser.add_argument("--append", action="store_true", help="Only aggregate raw files not processed yet and merge them into the saved state")
+    parser.add_argument("--workers", type=int, default=None, help="Threads used to read files (default: all cores)")
+    parser.add_argument("--from_state", default=None, help="Derive a coarser cell size / time bin from the aggregation state (cube) in this folder, without reading raw data")
+    parser.add_argument("--write_csv", action="store_true", help="Also write the table as CSV, one file per day in aggregated_congestion.csv/")
+    parser.add_argument("--processes", type=int, default=1, help="Aggregate files in this many parallel shards")
     args = parser.parse_args()
     main(args)
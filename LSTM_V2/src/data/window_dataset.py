@@ -0,0 +1,93 @@
+import os
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Formato de ventanas: la serie de cada celda se guarda una sola vez, contigua
+#   series.npy        (n_filas, n_features + 1): features y, en la última columna, el target
+#   cell_offsets.npy  (n_celdas + 1,): la celda k ocupa las filas [offsets[k], offsets[k + 1])
+#   meta.json         lookback/horizon por defecto, columnas, test_frac y rejilla de celdas
+# Las ventanas se cortan al pedirlas, así que lookback y horizon se pueden cambiar sin regenerar.
+SERIES_FILE = "series.npy"
+OFFSETS_FILE = "cell_offsets.npy"
+META_FILE = "meta.json"
+
+def window_starts(cell_ids, span):
+    """
+    Filas (de un array ordenado por cell_id, time_bin) donde empieza una
+    ventana de `span` filas de una misma celda: como está ordenado, basta
+    con que la primera y la última fila sean de la misma celda.
+    """
+    cell_ids = np.asarray(cell_ids)
+    if len(cell_ids) < span:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(cell_ids[span - 1:] == cell_ids[:len(cell_ids) - span + 1])
+
+class SeriesWindows:
+    """
+    Ventanas (X: lookback x n_features, y: horizon) que empiezan en las filas
+    `starts` de la serie. Indexar con un entero, slice o array de índices
+    copia solo esas ventanas; si la serie es un memmap, solo se leen sus páginas.
+    """
+
+    def __init__(self, series, starts, lookback, horizon):
+        self.series = series
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lookback = lookback
+        self.horizon = horizon
+        n_features = series.shape[1] - 1
+        self._X = sliding_window_view(series[:, :-1], (lookback, n_features))[:, 0]
+        self._y = sliding_window_view(series[lookback:, -1], horizon)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, idx):
+        starts = self.starts[idx]
+        return self._X[starts], self._y[starts]
+
+    @property
+    def y(self):
+        """Todos los targets (horizon valores por ventana, mucho menor que X)"""
+        return self._y[self.starts]
+
+def save_series(out_dir, series, cell_ids, meta):
+    """Guarda la serie ordenada por (cell_id, time_bin), los límites de cada celda y meta.json"""
+    # Con != y no np.diff, para que valga también con cell_id de texto (agregados anteriores)
+    cell_ids = np.asarray(cell_ids)
+    boundaries = np.flatnonzero(cell_ids[1:] != cell_ids[:-1]) + 1
+    offsets = np.r_[0, boundaries, len(cell_ids)].astype(np.int64)
+    np.save(os.path.join(out_dir, SERIES_FILE), np.ascontiguousarray(series))
+    np.save(os.path.join(out_dir, OFFSETS_FILE), offsets)
+    with open(os.path.join(out_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+def load_windows(windows_dir, lookback=None, horizon=None, mmap=True):
+    """
+    (train, val, meta) como SeriesWindows sobre series.npy (mapeado en
+    memoria con mmap=True). lookback/horizon por defecto, los de meta.json.
+    El reparto es el de create_windows: las primeras (1 - test_frac) ventanas
+    para train y el resto para validación.
+    """
+    if not os.path.exists(os.path.join(windows_dir, SERIES_FILE)):
+        legacy = os.path.exists(os.path.join(windows_dir, "X_train.npz"))
+        raise FileNotFoundError(
+            f"{windows_dir} has no {SERIES_FILE}"
+            + (" (it holds windows in the old X_*.npz format)" if legacy else "")
+            + "; rerun create_windows.py to write the series format")
+    with open(os.path.join(windows_dir, META_FILE)) as f:
+        meta = json.load(f)
+    lookback = lookback or meta["lookback"]
+    horizon = horizon or meta["horizon"]
+    meta = {**meta, "lookback": lookback, "horizon": horizon}
+
+    series = np.load(os.path.join(windows_dir, SERIES_FILE), mmap_mode="r" if mmap else None)
+    offsets = np.load(os.path.join(windows_dir, OFFSETS_FILE))
+    cell_index = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    starts = window_starts(cell_index, lookback + horizon)
+    n_train = int(len(starts) * (1 - meta["test_frac"]))
+    return (
+        SeriesWindows(series, starts[:n_train], lookback, horizon),
+        SeriesWindows(series, starts[n_train:], lookback, horizon),
+        meta,
+    )
@@ -0,0 +1,142 @@
+import atexit
+import logging
+import threading
+import time
+
+import mlflow
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.tracking import MlflowClient
+
+logger = logging.getLogger(__name__)
+
+# Este archivo existe dos veces, idéntico: MLPipeline/buffered_mlflow.py y
+# LSTM_V2/src/models/buffered_mlflow.py (cada proyecto se despliega por
+# separado). Cualquier cambio se hace en los dos; LSTM_V2/tests/test_buffered_mlflow.py
+# falla si las copias difieren.
+
+# Límites de MLflow por llamada a log_batch
+MAX_ENTITIES_PER_BATCH = 1000
+MAX_PARAMS_PER_BATCH = 100
+MAX_TAGS_PER_BATCH = 100
+FLUSH_INTERVAL_SEC = 2.0
+
+class BufferedLogger:
+    """
+    Sustituto de mlflow.log_metric/log_metrics/log_param/log_params/set_tag
+    que no espera al servidor de tracking: cada llamada apunta el valor
+    (con el run activo y el timestamp del momento) en un buffer en memoria,
+    y un hilo de fondo lo envía con MlflowClient.log_batch cada
+    flush_interval segundos o al acumular max_pending valores. flush()
+    vacía el buffer de forma síncrona; close() se registra con atexit, así
+    que lo pendiente se envía también si el script termina con una excepción.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL_SEC, max_pending=MAX_ENTITIES_PER_BATCH):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._client = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="mlflow-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log_metric(self, key, value, step=None):
+        self._add(Metric(key, float(value), int(time.time() * 1000), step or 0))
+
+    def log_metrics(self, metrics, step=None):
+        timestamp = int(time.time() * 1000)
+        for key, value in metrics.items():
+            self._add(Metric(key, float(value), timestamp, step or 0))
+
+    def log_param(self, key, value):
+        self._add(Param(key, str(value)))
+
+    def log_params(self, params):
+        for key, value in params.items():
+            self._add(Param(key, str(value)))
+
+    def set_tag(self, key, value):
+        self._add(RunTag(key, str(value)))
+
+    def _add(self, entity):
+        # El run se resuelve en el hilo que llama (los runs activos de MLflow son por hilo);
+        # sin run activo, MLflow abre uno, igual que mlflow.log_metric
+        run = mlflow.active_run() or mlflow.start_run()
+        with self._lock:
+            if self._client is None:
+                self._client = MlflowClient(mlflow.get_tracking_uri())
+            self._pending.append((run.info.run_id, entity))
+            n_pending = len(self._pending)
+        if self._closed:
+            self.flush()
+        elif n_pending >= self.max_pending:
+            self._wake.set()
+
+    def _loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Envía todo lo pendiente, un log_batch por run (troceado según los límites de MLflow)"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            by_run = {}
+            for run_id, entity in pending:
+                by_run.setdefault(run_id, []).append(entity)
+            for run_id, entities in by_run.items():
+                metrics = [e for e in entities if isinstance(e, Metric)]
+                params = [e for e in entities if isinstance(e, Param)]
+                tags = [e for e in entities if isinstance(e, RunTag)]
+                while metrics or params or tags:
+                    batch_params, params = params[:MAX_PARAMS_PER_BATCH], params[MAX_PARAMS_PER_BATCH:]
+                    batch_tags, tags = tags[:MAX_TAGS_PER_BATCH], tags[MAX_TAGS_PER_BATCH:]
+                    n_metrics = MAX_ENTITIES_PER_BATCH - len(batch_params) - len(batch_tags)
+                    batch_metrics, metrics = metrics[:n_metrics], metrics[n_metrics:]
+                    try:
+                        self._client.log_batch(run_id, metrics=batch_metrics, params=batch_params, tags=batch_tags)
+                    except Exception as e:
+                        logger.warning(f"No se pudieron registrar {len(batch_metrics) + len(batch_params) + len(batch_tags)} "
+                                       f"valores en el run {run_id}: {e}")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+# Instancia por proceso: `import buffered_mlflow as tracking` y tracking.log_metric(...) como con mlflow
+_default = None
+
+def _logger():
+    global _default
+    if _default is None:
+        _default = BufferedLogger()
+    return _default
+
+def log_metric(key, value, step=None):
+    _logger().log_metric(key, value, step)
+
+def log_metrics(metrics, step=None):
+    _logger().log_metrics(metrics, step)
+
+def log_param(key, value):
+    _logger().log_param(key, value)
+
+def log_params(params):
+    _logger().log_params(params)
+
+def set_tag(key, value):
+    _logger().set_tag(key, value)
+
+def flush():
+    if _default is not None:
+        _default.flush()
@@ -0,0 +1,213 @@
+import time
+import copy
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+
+from train_lstm import LSTMModel, load_data, tensor_windows, configure_threads, train_one_epoch_fast
+
+class EnsembleLSTM(nn.Module):
+    """
+    Varios LSTMModel con la misma forma (input_size, hidden_size, horizon,
+    stacked) entrenados como un solo módulo: todos ven el mismo lote y la
+    recurrencia de los K miembros se calcula con un bmm por paso de tiempo.
+    Cada miembro conserva sus propios parámetros (members[k] es un LSTMModel
+    normal) y su propio dropout, así que se separan sin conversión.
+    """
+
+    def __init__(self, members, dropouts):
+        super().__init__()
+        self.members = nn.ModuleList(members)
+        self.register_buffer("dropouts", torch.tensor(dropouts, dtype=torch.float32))
+        self.n_layers = members[0].lstm.num_layers
+
+    def _dropout(self, x):
+        if not self.training:
+            return x
+        p = self.dropouts.view(-1, *([1] * (x.dim() - 1)))
+        return x * (torch.rand_like(x) >= p) / (1 - p)
+
+    def forward(self, x):
+        """x: (batch, lookback, n_features) -> (K, batch, horizon)"""
+        inputs = x.unsqueeze(0)
+        for layer in range(self.n_layers):
+            lstms = [m.lstm for m in self.members]
+            W_ih = torch.stack([getattr(l, f"weight_ih_l{layer}") for l in lstms])
+            W_hh = torch.stack([getattr(l, f"weight_hh_l{layer}") for l in lstms]).transpose(1, 2)
+            bias = torch.stack([getattr(l, f"bias_ih_l{layer}") + getattr(l, f"bias_hh_l{layer}") for l in lstms])
+            # Proyección de la entrada de todos los pasos de una vez: (K, batch, lookback, 4 * hidden)
+            projected = torch.matmul(inputs, W_ih.transpose(1, 2).unsqueeze(1)) + bias[:, None, None, :]
+
+            n_members, batch_size, hidden_size = projected.shape[0], projected.shape[1], W_hh.shape[1]
+            h = projected.new_zeros(n_members, batch_size, hidden_size)
+            c = torch.zeros_like(h)
+            outputs = []
+            # unbind en lugar de indexar projected[:, :, t] y cortar las puertas: el
+            # backward de cada corte rellena un tensor de ceros del tamaño completo
+            # (coste cuadrático en lookback); el de unbind es un solo stack
+            for projected_t in projected.unbind(2):
+                # Puertas en el orden de nn.LSTM (i, f, g, o)
+                i, f, g, o = torch.baddbmm(projected_t, h, W_hh).view(n_members, batch_size, 4, hidden_size).unbind(2)
+                c = torch.sigmoid(f) * c + torch.sigmoid(i) * torch.tanh(g)
+                h = torch.sigmoid(o) * torch.tanh(c)
+                outputs.append(h)
+            if layer < self.n_layers - 1:
+                inputs = self._dropout(torch.stack(outputs, dim=2))
+
+        # La salida solo usa el último paso de la última capa
+        out = self._dropout(h)
+        W_fc = torch.stack([m.fc.weight for m in self.members]).transpose(1, 2)
+        b_fc = torch.stack([m.fc.bias for m in self.members])
+        return torch.baddbmm(b_fc.unsqueeze(1), out, W_fc)
+
+def build_ensemble(configs, seeds, n_features, horizon):
+    """
+    EnsembleLSTM de configs que solo difieren en dropout y lr. Cada miembro
+    se inicializa como LSTMModel con su semilla, igual que un trial normal.
+    """
+    shape = {(c["hidden_size"], c["stacked"]) for c in configs}
+    if len(shape) != 1:
+        raise ValueError(f"Ensemble members must share hidden_size and stacked, got {shape}")
+    members = []
+    for config, seed in zip(configs, seeds):
+        torch.manual_seed(seed)
+        members.append(LSTMModel(n_features, config["hidden_size"], horizon, config["dropout"], config["stacked"]))
+    return EnsembleLSTM(members, [c["dropout"] for c in configs])
+
+def train_ensemble(ensemble, lrs, train_windows, val_windows, batch_size, max_epochs, patience, generator):
+    """
+    Entrena los K miembros a la vez con un Adam de un grupo de parámetros
+    por miembro (lr y reducción de LR propios) y early stopping por miembro:
+    un miembro parado deja de actualizarse (lr 0) y se guarda su mejor estado.
+    Devuelve, por miembro, historial, mejor val_loss, mejor state_dict y épocas.
+    """
+    n_members = len(ensemble.members)
+    optimizer = torch.optim.Adam([{"params": m.parameters(), "lr": lr} for m, lr in zip(ensemble.members, lrs)], foreach=True)
+    results = [{"history": [], "best_val_loss": float("inf"), "best_model": None, "epoch": 0,
+                "patience_counter": 0, "stopped": False} for _ in range(n_members)]
+
+    for epoch in range(1, max_epochs + 1):
+        train_loss, train_mae = _ensemble_epoch(ensemble, train_windows, batch_size, optimizer, generator)
+        val_loss, val_mae = _ensemble_validate(ensemble, val_windows, batch_size)
+        for k, result in enumerate(results):
+            if result["stopped"]:
+                continue
+            result["history"].append({"train_loss": train_loss[k], "train_mae": train_mae[k],
+                                      "val_loss": val_loss[k], "val_mae": val_mae[k]})
+            result["epoch"] = epoch
+            if val_loss[k] < result["best_val_loss"]:
+                result["best_val_loss"] = val_loss[k]
+                result["patience_counter"] = 0
+                result["best_model"] = copy.deepcopy(ensemble.members[k].state_dict())
+            else:
+                result["patience_counter"] += 1
+                if result["patience_counter"] >= patience:
+                    result["stopped"] = True
+                    optimizer.param_groups[k]["lr"] = 0.0
+                    continue
+            if epoch % max(1, patience // 2) == 0:
+                optimizer.param_groups[k]["lr"] *= 0.5
+        if all(r["stopped"] for r in results):
+            break
+    return results
+
+def _ensemble_epoch(ensemble, windows, batch_size, optimizer, generator):
+    ensemble.train()
+    n = len(windows)
+    n_members = len(ensemble.members)
+    order = torch.randperm(n, generator=generator).to(windows.starts.device)
+    total_loss = torch.zeros(n_members, device=windows.starts.device)
+    total_mae = torch.zeros(n_members, device=windows.starts.device)
+    for start in range(0, n, batch_size):
+        X_batch, y_batch = windows.batch(order[start:start + batch_size])
+        optimizer.zero_grad(set_to_none=True)
+        y_pred = ensemble(X_batch)
+        # Suma de las MSE de cada miembro: los parámetros son disjuntos, así que
+        # cada miembro recibe el mismo gradiente que si entrenara solo
+        member_loss = ((y_pred - y_batch) ** 2).mean(dim=(1, 2))
+        member_loss.sum().backward()
+        optimizer.step()
+        with torch.no_grad():
+            total_loss += member_loss.detach() * len(X_batch)
+            total_mae += (y_pred.detach() - y_batch).abs().mean(dim=(1, 2)) * len(X_batch)
+    return (total_loss / n).tolist(), (total_mae / n).tolist()
+
+def _ensemble_validate(ensemble, windows, batch_size):
+    ensemble.eval()
+    n = len(windows)
+    n_members = len(ensemble.members)
+    total_loss = torch.zeros(n_members, device=windows.starts.device)
+    total_mae = torch.zeros(n_members, device=windows.starts.device)
+    with torch.inference_mode():
+        for start in range(0, n, batch_size):
+            X_batch, y_batch = windows.batch(torch.arange(start, min(start + batch_size, n), device=windows.starts.device))
+            y_pred = ensemble(X_batch)
+            total_loss += ((y_pred - y_batch) ** 2).mean(dim=(1, 2)) * len(X_batch)
+            total_mae += (y_pred - y_batch).abs().mean(dim=(1, 2)) * len(X_batch)
+    return (total_loss / n).tolist(), (total_mae / n).tolist()
+
+def benchmark_ensemble(windows_dir, n_members=8, hidden_size=32, stacked=False, batch_size=32, epochs=1,
+                       threads=None, seed=42, lookback=None):
+    """
+    Épocas/s por configuración: n_members LSTMModel entrenados uno detrás de
+    otro con el bucle rápido frente a un solo EnsembleLSTM con los mismos
+    miembros. Comprueba además que el ensemble reproduce cada LSTMModel.
+    """
+    configure_threads(threads)
+    train, val, meta, _ = load_data(windows_dir, lookback)
+    train_t, val_t = tensor_windows(train, val, torch.device("cpu"))
+    rng = np.random.default_rng(seed)
+    configs = [{"hidden_size": hidden_size, "stacked": stacked, "dropout": float(rng.choice([0.2, 0.4])),
+                "lr": float(rng.choice([1e-3, 5e-4]))} for _ in range(n_members)]
+    seeds = [seed + k for k in range(n_members)]
+    print(f"➡️  {n_members} members (hidden {hidden_size}, stacked={stacked}), {len(train)} train windows "
+          f"(lookback {meta['lookback']}), "
+          f"batch_size={batch_size}, {torch.get_num_threads()} threads")
+
+    ensemble = build_ensemble(configs, seeds, meta["n_features"], meta["horizon"]).eval()
+    X_batch, _ = val_t.batch(torch.arange(min(256, len(val_t))))
+    with torch.no_grad():
+        ensemble_out = ensemble(X_batch)
+        max_diff = max((ensemble_out[k] - m.eval()(X_batch)).abs().max().item()
+                       for k, m in enumerate(ensemble.members))
+
+    start_time = time.time()
+    for config, member_seed in zip(configs, seeds):
+        torch.manual_seed(member_seed)
+        model = LSTMModel(meta["n_features"], hidden_size, meta["horizon"], config["dropout"], stacked)
+        optimizer = torch.optim.Adam(model.parameters(), lr=config["lr"])
+        generator = torch.Generator().manual_seed(seed)
+        for _ in range(epochs):
+            train_one_epoch_fast(model, train_t, nn.MSELoss(), optimizer, batch_size, generator)
+    sequential_sec = time.time() - start_time
+
+    ensemble = build_ensemble(configs, seeds, meta["n_features"], meta["horizon"])
+    optimizer = torch.optim.Adam([{"params": m.parameters(), "lr": c["lr"]} for m, c in zip(ensemble.members, configs)], foreach=True)
+    generator = torch.Generator().manual_seed(seed)
+    start_time = time.time()
+    for _ in range(epochs):
+        _ensemble_epoch(ensemble, train_t, batch_size, optimizer, generator)
+    ensemble_sec = time.time() - start_time
+
+    sequential_rate = n_members * epochs / sequential_sec
+    ensemble_rate = n_members * epochs / ensemble_sec
+    print(f"✅ Max |ensemble - LSTMModel| on a val batch: {max_diff:.2e}")
+    print(f"⏱️  Sequential: {sequential_rate:.2f} config-epochs/s")
+    print(f"⏱️  Ensemble: {ensemble_rate:.2f} config-epochs/s ({ensemble_rate / sequential_rate:.1f}x)")
+    return sequential_rate, ensemble_rate, max_diff
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batched training of several LSTM configs")
+    parser.add_argument("--windows_dir", default="data/processed/windows")
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--hidden_size", type=int, default=32)
+    parser.add_argument("--stacked", action="store_true")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--lookback", type=int, default=None, help="Default: meta.json")
+    args = parser.parse_args()
+    benchmark_ensemble(args.windows_dir, args.members, args.hidden_size, args.stacked, args.batch_size,
+                       args.epochs, args.threads, args.seed, args.lookback)
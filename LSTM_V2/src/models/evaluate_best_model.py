@@ -3,8 +3,13 @@ import torch.nn as nn
 import numpy as np
 import matplotlib.pyplot as plt
 import argparse
-import json
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from window_dataset import load_windows
+from export_lstm import VARIANTS, load_variant
+from model_bundle import get_bundle
 
 class LSTMModel(nn.Module):
     def __init__(self, input_size, hidden_size, horizon, dropout, stacked):
@@ -24,36 +29,48 @@ class LSTMModel(nn.Module):
         return out
 
 def main(args):
-    with open(os.path.join(args.windows_dir, "meta.json")) as f:
-        meta = json.load(f)
+    bundle = None
+    if args.bundle:
+        # Por defecto, las ventanas con el lookback/horizon con que se entrenó el modelo
+        bundle = get_bundle(args.bundle, args.variant)
+        args.lookback = args.lookback or bundle.meta["lookback"]
+        args.horizon = args.horizon or bundle.meta["horizon"]
+
+    _, val, meta = load_windows(args.windows_dir, args.lookback, args.horizon)
 
     input_size = meta["n_features"]
     horizon = meta["horizon"]
 
     print(f"✅ Loaded meta: input_size={input_size}, horizon={horizon}")
 
-    X_val = np.load(os.path.join(args.windows_dir, "X_val.npz"))['arr_0']
-    y_val = np.load(os.path.join(args.windows_dir, "y_val.npz"))['arr_0']
-
-    X_val_tensor = torch.tensor(X_val, dtype=torch.float32)
-    y_val_tensor = torch.tensor(y_val, dtype=torch.float32)
-
-    print(f"✅ Validation data: X_val {X_val.shape}, y_val {y_val.shape}")
+    y_val = val.y
+    print(f"✅ Validation data: {len(val)} windows (lookback={meta['lookback']}), y_val {y_val.shape}")
 
-    model = LSTMModel(
-        input_size=input_size,
-        hidden_size=args.hidden_size,
-        horizon=horizon,
-        dropout=args.dropout,
-        stacked=args.stacked
-    )
-    model.load_state_dict(torch.load(args.model_path, map_location="cpu"))
-    model.eval()
+    if bundle is not None:
+        if (bundle.arch["input_size"], bundle.arch["horizon"]) != (input_size, horizon):
+            raise ValueError(f"❌ Bundle expects n_features={bundle.arch['input_size']}, horizon={bundle.arch['horizon']}; "
+                             f"windows have n_features={input_size}, horizon={horizon}")
+        model = bundle.model
+        print(f"✅ Loaded {args.variant} bundle from {args.bundle}: {bundle.arch}")
+    else:
+        model = LSTMModel(
+            input_size=input_size,
+            hidden_size=args.hidden_size,
+            horizon=horizon,
+            dropout=args.dropout,
+            stacked=args.stacked
+        )
+        model = load_variant(model, args.model_path, args.variant)
 
-    print(f"✅ Loaded model from {args.model_path}")
+        print(f"✅ Loaded {args.variant} model from {args.model_path}")
 
+    # Por lotes: las ventanas se cortan de la serie mapeada sin materializar X_val
+    preds = []
     with torch.no_grad():
-        preds = model(X_val_tensor).numpy()
+        for start in range(0, len(val), args.batch_size):
+            X_batch, _ = val[start:start + args.batch_size]
+            preds.append(model(torch.tensor(X_batch, dtype=torch.float32)).numpy())
+    preds = np.concatenate(preds) if preds else np.zeros((0, horizon), dtype=np.float32)
 
     n_examples = min(100, len(y_val))
     plt.figure(figsize=(12, 6))
@@ -74,11 +91,18 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evaluate best LSTM model and plot predictions")
-    parser.add_argument("--model_path", required=True, help="Path to best_model.pt")
+    parser.add_argument("--bundle", default=None, help="model_bundle.pt (replaces model_path, hidden_size, dropout, stacked)")
+    parser.add_argument("--model_path", help="Path to best_model.pt")
     parser.add_argument("--windows_dir", default="data/processed/windows", help="Directory with windowed data")
     parser.add_argument("--out_dir", default="outputs", help="Where to save plots and results")
     parser.add_argument("--hidden_size", type=int, default=64)
     parser.add_argument("--dropout", type=float, default=0.2)
     parser.add_argument("--stacked", action="store_true", help="Use stacked LSTM if model was trained with it")
+    parser.add_argument("--lookback", type=int, default=None, help="Lookback the model was trained with (default: meta.json)")
+    parser.add_argument("--horizon", type=int, default=None, help="Horizon the model was trained with (default: meta.json)")
+    parser.add_argument("--batch_size", type=int, default=4096)
+    parser.add_argument("--variant", choices=VARIANTS, default="fp32", help="Inference variant exported by export_lstm.py")
     args = parser.parse_args()
+    if not args.bundle and not args.model_path:
+        parser.error("pass --bundle or --model_path")
     main(args)
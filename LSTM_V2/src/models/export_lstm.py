@@ -0,0 +1,198 @@
+import os
+import copy
+import json
+import time
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+# torch.ao.quantization está deprecado (PyTorch lo está migrando a torchao) y en
+# torch 2.14 ya avisa de que los tensores qint8 se retirarán. Si desaparece, int8
+# deja de estar disponible; fp32 y bf16 siguen funcionando.
+try:
+    from torch.ao.quantization import quantize_dynamic
+except ImportError:
+    quantize_dynamic = None
+
+# fp32: best_model.pt tal cual; int8: LSTM y Linear con cuantización dinámica
+# (pesos int8, activaciones cuantizadas al vuelo); bf16: pesos y cálculo en bfloat16
+VARIANTS = ("fp32", "int8", "bf16")
+# Una variante es usable si su MAE de validación (target escalado) no empeora
+# más que esto respecto a fp32; si no, queda marcada en variants.json y no se carga
+MAX_MAE_DELTA = 0.01
+REPORT_FILE = "variants.json"
+
+class BFloat16Model(nn.Module):
+    """LSTMModel en bfloat16 que recibe y devuelve float32, como el original"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model.to(torch.bfloat16)
+
+    @property
+    def fc(self):
+        return self.model.fc
+
+    def forward(self, x):
+        return self.model(x.to(torch.bfloat16)).float()
+
+def convert(model, variant):
+    """Copia de un LSTMModel (en eval) en la variante pedida"""
+    model = copy.deepcopy(model).eval()
+    if variant == "fp32":
+        return model
+    if variant == "int8":
+        if quantize_dynamic is None:
+            raise ValueError("int8 needs torch.ao.quantization, which this torch version no longer ships")
+        return quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+    if variant == "bf16":
+        return BFloat16Model(model)
+    raise ValueError(f"Unknown variant {variant!r}, expected one of {VARIANTS}")
+
+def variant_path(model_path, variant):
+    """best_model.pt -> best_model_int8.pt / best_model_bf16.pt (fp32 es el propio best_model.pt)"""
+    if variant == "fp32":
+        return model_path
+    root, ext = os.path.splitext(model_path)
+    return f"{root}_{variant}{ext}"
+
+def report_path(model_path):
+    """variants.json que export_lstm deja junto al modelo"""
+    return os.path.join(os.path.dirname(model_path), REPORT_FILE)
+
+def check_variant(model_path, variant):
+    """
+    Falla salvo que `variant` sea fp32 o haya pasado la comprobación de MAE
+    de export_lstm, según el variants.json que hay junto a model_path.
+    """
+    if variant == "fp32":
+        return
+    path = report_path(model_path)
+    row = None
+    if os.path.exists(path):
+        with open(path) as f:
+            row = json.load(f).get(variant)
+    if row is None or "usable" not in row:
+        raise ValueError(f"No checked {variant} entry in {path}; run export_lstm.py on this model first")
+    if not row["usable"]:
+        raise ValueError(f"The {variant} variant did not pass the accuracy check (MAE delta "
+                         f"{row['mae_delta']:+.5f}, max {row['max_mae_delta']}), see {path}")
+
+def load_variant(model, model_path, variant="fp32"):
+    """
+    Carga la variante `variant` de model_path sobre `model`, un LSTMModel
+    recién construido con la misma arquitectura. Devuelve el modelo en eval.
+    Las variantes que no pasaron la tolerancia de MAE no se cargan.
+
+    Los archivos int8/bf16 se leen con weights_only=False, es decir, con
+    pickle: solo deben cargarse los generados por export_lstm en una carpeta
+    de confianza, nunca archivos de origen desconocido.
+    """
+    if variant == "fp32":
+        model.load_state_dict(torch.load(model_path, map_location="cpu"))
+        return model.eval()
+    check_variant(model_path, variant)
+    converted = convert(model, variant)
+    # Los pesos int8 empaquetados no son tensores simples; el archivo lo genera export_lstm
+    converted.load_state_dict(torch.load(variant_path(model_path, variant), map_location="cpu", weights_only=False))
+    return converted.eval()
+
+def predict(model, windows, batch_size=4096):
+    preds = []
+    with torch.inference_mode():
+        for start in range(0, len(windows), batch_size):
+            X_batch, _ = windows[start:start + batch_size]
+            preds.append(model(torch.tensor(X_batch, dtype=torch.float32)).numpy())
+    return np.concatenate(preds)
+
+def latency_ms(model, window, n_calls=200):
+    """Mediana de ms por predicción de una sola ventana (el caso del rolling forecast)"""
+    x = torch.tensor(window, dtype=torch.float32).unsqueeze(0)
+    times = []
+    with torch.inference_mode():
+        for _ in range(n_calls):
+            start_time = time.perf_counter()
+            model(x)
+            times.append(time.perf_counter() - start_time)
+    return float(np.median(times) * 1e3)
+
+def export_variants(model, model_path, val, variants=("int8", "bf16"), batch_size=4096, max_mae_delta=MAX_MAE_DELTA):
+    """
+    Guarda cada variante junto a model_path y la compara con fp32 sobre las
+    ventanas de validación: MAE, su diferencia con la de fp32, máxima
+    diferencia de predicción, latencia por ventana y tamaño del archivo.
+    "usable" indica si la diferencia de MAE está dentro de max_mae_delta.
+    """
+    y_val = val.y
+    fp32 = convert(model, "fp32")
+    fp32_preds = predict(fp32, val, batch_size)
+    fp32_mae = float(np.abs(fp32_preds - y_val).mean())
+    seed_window, _ = val[len(val) - 1]
+    report = {"fp32": {
+        "file": os.path.basename(model_path),
+        "size_bytes": os.path.getsize(model_path),
+        "mae": fp32_mae,
+        "mae_delta": 0.0,
+        "max_abs_pred_diff": 0.0,
+        "latency_ms": latency_ms(fp32, seed_window),
+        "max_mae_delta": max_mae_delta,
+        "usable": True,
+    }}
+
+    for variant in variants:
+        converted = convert(model, variant)
+        path = variant_path(model_path, variant)
+        torch.save(converted.state_dict(), path)
+        preds = predict(converted, val, batch_size)
+        mae = float(np.abs(preds - y_val).mean())
+        report[variant] = {
+            "file": os.path.basename(path),
+            "size_bytes": os.path.getsize(path),
+            "mae": mae,
+            "mae_delta": mae - fp32_mae,
+            "max_abs_pred_diff": float(np.abs(preds - fp32_preds).max()),
+            "latency_ms": latency_ms(converted, seed_window),
+            "max_mae_delta": max_mae_delta,
+            "usable": mae - fp32_mae <= max_mae_delta,
+        }
+    return report
+
+def main(args):
+    from train_lstm import LSTMModel, load_data
+
+    _, val, meta, _ = load_data(args.windows_dir, args.lookback, args.horizon)
+    print(f"✅ Loaded {len(val)} validation windows (lookback={meta['lookback']}, horizon={meta['horizon']})")
+
+    model = LSTMModel(meta["n_features"], args.hidden_size, meta["horizon"], args.dropout, args.stacked)
+    model = load_variant(model, args.model_path, "fp32")
+    print(f"✅ Loaded model from {args.model_path}")
+
+    variants = [v for v in args.variants.split(",") if v != "fp32"]
+    report = export_variants(model, args.model_path, val, variants, args.batch_size, args.max_mae_delta)
+    for variant, row in report.items():
+        print(f"➡️  {variant:>4}: MAE {row['mae']:.5f} (delta {row['mae_delta']:+.5f}), "
+              f"max |pred - fp32| {row['max_abs_pred_diff']:.4f}, "
+              f"{row['latency_ms']:.3f} ms/window, {row['size_bytes'] / 1024:.0f} KB")
+        if not row["usable"]:
+            print(f"⚠️  {variant} exceeds --max_mae_delta {args.max_mae_delta}; marked unusable and will not be loaded")
+
+    path = report_path(args.model_path)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Saved variants and report to {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export int8 / bfloat16 inference variants of a trained LSTM")
+    parser.add_argument("--model_path", required=True, help="Path to best_model.pt")
+    parser.add_argument("--windows_dir", default="data/processed/windows", help="Windows used to check accuracy against fp32")
+    parser.add_argument("--hidden_size", type=int, default=64)
+    parser.add_argument("--dropout", type=float, default=0.2)
+    parser.add_argument("--stacked", action="store_true")
+    parser.add_argument("--variants", default="int8,bf16", help="Comma-separated variants to export")
+    parser.add_argument("--lookback", type=int, default=None)
+    parser.add_argument("--horizon", type=int, default=None)
+    parser.add_argument("--batch_size", type=int, default=4096)
+    parser.add_argument("--max_mae_delta", type=float, default=MAX_MAE_DELTA,
+                        help="Largest validation MAE increase over fp32 (scaled target) for a variant to be usable")
+    args = parser.parse_args()
+    main(args)
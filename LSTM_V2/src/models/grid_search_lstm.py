@@ -1,52 +1,377 @@
 ﻿import os
-import subprocess
+import copy
+import json
+import time
+import argparse
 import itertools
-import sys
-
-def main():
-    hidden_sizes = [32, 64]
-    dropouts = [0.2, 0.4]
-    learning_rates = [1e-3, 5e-4]
-    stacked_options = [False, True]
-    batch_size = 32
-    epochs = 50
-    patience = 10
-
-    windows_dir = "data/processed/windows"
-    out_dir = "artifacts"
-    mlflow_uri = "file:./mlruns"
-    experiment = "air_traffic_congestion"
-
-    grid = list(itertools.product(hidden_sizes, dropouts, learning_rates, stacked_options))
-    print(f"🧪 Total combinations: {len(grid)}")
-
-    for i, (hidden_size, dropout, lr, stacked) in enumerate(grid, 1):
-        run_name = f"grid_run_{i:02d}_hs{hidden_size}_do{dropout}_lr{lr}_stacked{stacked}"
-
-        print(f"\n➡️  Launching run {i}/{len(grid)}: {run_name}")
-
-        cmd = [
-            sys.executable, "src/models/train_lstm.py",
-            "--windows_dir", windows_dir,
-            "--out_dir", out_dir,
-            "--mlflow_uri", mlflow_uri,
-            "--experiment", experiment,
-            "--run_name", run_name,
-            "--epochs", str(epochs),
-            "--batch_size", str(batch_size),
-            "--hidden_size", str(hidden_size),
-            "--dropout", str(dropout),
-            "--lr", str(lr),
-            "--patience", str(patience),
-        ]
-
-        if stacked:
-            cmd.append("--stacked")
-
-        print(f"📜 Command: {' '.join(cmd)}")
-        subprocess.run(cmd)
-
-    print("\n✅ All grid runs completed!")
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+import numpy as np
+import joblib
+import mlflow
+import torch
+import torch.nn as nn
+import torch.multiprocessing as mp
+
+from train_lstm import (LSTMModel, TensorWindows, load_data, series_tensors, configure_threads,
+                        train_one_epoch_fast, validate_fast)
+from ensemble_lstm import build_ensemble, train_ensemble
+import buffered_mlflow
+from model_bundle import BUNDLE_FILE, save_bundle
+
+# Espacio de búsqueda por defecto: la rejilla de siempre (16 combinaciones).
+# En un archivo --space, una lista es un conjunto de valores y un dict
+# {"low": ..., "high": ..., "log": true} un rango continuo que se muestrea.
+DEFAULT_SPACE = {
+    "hidden_size": [32, 64],
+    "dropout": [0.2, 0.4],
+    "lr": [1e-3, 5e-4],
+    "stacked": [False, True],
+    "batch_size": [32],
+}
+
+def load_space(path=None):
+    if path is None:
+        return DEFAULT_SPACE
+    with open(path) as f:
+        return {**DEFAULT_SPACE, **json.load(f)}
+
+def sample_configs(space, n_trials=None, seed=42):
+    """
+    Rejilla completa si todos los parámetros son listas y no se pide
+    n_trials; si no, n_trials configuraciones muestreadas al azar.
+    """
+    keys = list(space)
+    if n_trials is None:
+        if not all(isinstance(space[k], list) for k in keys):
+            raise ValueError("A search space with ranges needs --n_trials")
+        return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n_trials):
+        config = {}
+        for k in keys:
+            if isinstance(space[k], list):
+                config[k] = space[k][rng.integers(len(space[k]))]
+            elif space[k].get("log"):
+                config[k] = float(np.exp(rng.uniform(np.log(space[k]["low"]), np.log(space[k]["high"]))))
+            else:
+                config[k] = float(rng.uniform(space[k]["low"], space[k]["high"]))
+            if isinstance(config[k], np.generic):
+                config[k] = config[k].item()
+        configs.append(config)
+    return configs
+
+def run_name_for(i, config):
+    return (f"grid_run_{i:02d}_hs{config['hidden_size']}_do{config['dropout']:g}"
+            f"_lr{config['lr']:g}_stacked{config['stacked']}")
+
+def new_trial(trial_id, config, seed):
+    return {
+        "id": trial_id, "config": config, "run_name": run_name_for(trial_id, config),
+        "seed": seed + trial_id, "epoch": 0, "best_val_loss": float("inf"),
+        "patience_counter": 0, "stopped": False, "state": None, "best_model": None, "history": [],
+    }
+
+# ─────────────── ASHA ───────────────
+class ASHA:
+    """
+    Asynchronous Successive Halving. Los trials se evalúan en peldaños de
+    min_epochs * eta^k épocas (el último, max_epochs). Cuando un worker queda
+    libre, sube al siguiente peldaño un trial que esté en el mejor 1/eta de
+    los que completaron el suyo; si no hay ninguno, empieza un trial nuevo.
+    Los que nunca suben quedan podados sin entrenar el resto de épocas.
+    """
+
+    def __init__(self, min_epochs, max_epochs, eta=3):
+        self.eta = eta
+        self.rungs = []
+        epochs = min_epochs
+        while epochs < max_epochs:
+            self.rungs.append(epochs)
+            epochs *= eta
+        self.rungs.append(max_epochs)
+        self.results = [{} for _ in self.rungs]
+        self.promoted = [set() for _ in self.rungs]
+
+    def report(self, trial_id, rung, val_loss):
+        self.results[rung][trial_id] = val_loss
+
+    def promotion(self, at_least_one=False):
+        """
+        (trial_id, peldaño destino) del próximo trial a subir, o None. Con
+        at_least_one (sin trials nuevos ni en curso) sube el mejor de cada
+        peldaño aunque haya menos de eta, para que alguno llegue al final.
+        """
+        for rung in reversed(range(len(self.rungs) - 1)):
+            results = self.results[rung]
+            n_top = len(results) // self.eta
+            if at_least_one:
+                n_top = max(1, n_top)
+            top = sorted(results, key=results.get)[:n_top]
+            for trial_id in top:
+                if trial_id not in self.promoted[rung]:
+                    self.promoted[rung].add(trial_id)
+                    return trial_id, rung + 1
+        return None
+
+# ─────────────── Workers ───────────────
+_worker = {}
+
+def _init_worker(X_series, y_series, train_starts, val_starts, lookback, horizon, n_features, threads):
+    """Initializer del pool: la serie llega en memoria compartida, sin copiarse por worker"""
+    configure_threads(threads)
+    _worker["train"] = TensorWindows(X_series, y_series, train_starts, lookback, horizon)
+    _worker["val"] = TensorWindows(X_series, y_series, val_starts, lookback, horizon)
+    _worker["n_features"] = n_features
+    _worker["horizon"] = horizon
+
+def _run_segment(trial, until_epoch, patience):
+    """
+    Entrena el trial desde trial["epoch"] hasta until_epoch, con el mismo
+    early stopping y reducción de LR que train_lstm. Devuelve el trial con
+    su estado (modelo, optimizador, RNG) para continuarlo si sube de peldaño.
+    """
+    config = trial["config"]
+    if trial["state"] is None:
+        torch.manual_seed(trial["seed"])
+    model = LSTMModel(_worker["n_features"], config["hidden_size"], _worker["horizon"],
+                      config["dropout"], config["stacked"])
+    optimizer = torch.optim.Adam(model.parameters(), lr=config["lr"])
+    generator = torch.Generator()
+    if trial["state"] is None:
+        generator.manual_seed(trial["seed"])
+    else:
+        model.load_state_dict(trial["state"]["model"])
+        optimizer.load_state_dict(trial["state"]["optimizer"])
+        generator.set_state(trial["state"]["generator"])
+        torch.set_rng_state(trial["state"]["rng"])
+    loss_fn = nn.MSELoss()
+
+    history = []
+    for epoch in range(trial["epoch"] + 1, until_epoch + 1):
+        train_loss, train_mae = train_one_epoch_fast(model, _worker["train"], loss_fn, optimizer,
+                                                     config["batch_size"], generator)
+        val_loss, val_mae, _ = validate_fast(model, _worker["val"], loss_fn, config["batch_size"])
+        history.append({"train_loss": train_loss, "train_mae": train_mae, "val_loss": val_loss, "val_mae": val_mae})
+        trial["epoch"] = epoch
+
+        if val_loss < trial["best_val_loss"]:
+            trial["best_val_loss"] = val_loss
+            trial["patience_counter"] = 0
+            trial["best_model"] = copy.deepcopy(model.state_dict())
+        else:
+            trial["patience_counter"] += 1
+            if trial["patience_counter"] >= patience:
+                trial["stopped"] = True
+                break
+
+        if epoch % max(1, patience // 2) == 0:
+            for param_group in optimizer.param_groups:
+                param_group["lr"] *= 0.5
+
+    trial["state"] = {
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "generator": generator.get_state(),
+        "rng": torch.get_rng_state(),
+    }
+    return trial, history
+
+def _run_ensemble(trials, max_epochs, patience):
+    """Entrena un grupo de trials de la misma forma como un EnsembleLSTM, hasta max_epochs o early stopping"""
+    configs = [t["config"] for t in trials]
+    ensemble = build_ensemble(configs, [t["seed"] for t in trials], _worker["n_features"], _worker["horizon"])
+    generator = torch.Generator().manual_seed(trials[0]["seed"])
+    results = train_ensemble(ensemble, [c["lr"] for c in configs], _worker["train"], _worker["val"],
+                             configs[0]["batch_size"], max_epochs, patience, generator)
+    for trial, result in zip(trials, results):
+        trial.update(result)
+        trial["status"] = "early_stopped" if result["stopped"] else "completed"
+    return trials
+
+# ─────────────── Búsqueda ───────────────
+def start_pool(windows_dir, n_workers=None, threads_per_worker=None, lookback=None, horizon=None):
+    """
+    Pool de procesos de entrenamiento. La serie se carga una vez en memoria
+    compartida (float32) y todos los workers la leen sin copiarla.
+    Devuelve (pool, n_workers, meta, scaler).
+    """
+    n_workers = n_workers or os.cpu_count()
+    threads_per_worker = threads_per_worker or max(1, os.cpu_count() // n_workers)
+    train, val, meta, scaler = load_data(windows_dir, lookback, horizon)
+    X_series, y_series = series_tensors(train.series, "cpu")
+    X_series.share_memory_()
+    y_series.share_memory_()
+    print(f"➡️  {n_workers} workers x {threads_per_worker} threads")
+    pool = ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(X_series, y_series, train.starts, val.starts, meta["lookback"], meta["horizon"],
+                  meta["n_features"], threads_per_worker),
+    )
+    return pool, n_workers, meta, scaler
+
+def ensemble_search(configs, windows_dir, n_workers=None, threads_per_worker=None, max_epochs=50, patience=10,
+                    max_members=8, lookback=None, horizon=None, seed=42):
+    """
+    Agrupa las configs que comparten forma (hidden_size, stacked, batch_size)
+    en ensembles de hasta max_members y entrena cada grupo como un solo
+    EnsembleLSTM en el pool, sin poda. Devuelve (trials, meta, scaler).
+    """
+    trials = [new_trial(i, config, seed) for i, config in enumerate(configs, 1)]
+    groups = {}
+    for trial in trials:
+        c = trial["config"]
+        groups.setdefault((c["hidden_size"], c["stacked"], c["batch_size"]), []).append(trial)
+    groups = [g[i:i + max_members] for g in groups.values() for i in range(0, len(g), max_members)]
+    print(f"➡️  {len(trials)} trials in {len(groups)} ensembles")
+
+    pool, _, meta, scaler = start_pool(windows_dir, n_workers, threads_per_worker, lookback, horizon)
+    with pool:
+        futures = [pool.submit(_run_ensemble, group, max_epochs, patience) for group in groups]
+        for future in as_completed(futures):
+            for trial in future.result():
+                trials[trial["id"] - 1] = trial
+                print(f"{trial['run_name']}: epoch {trial['epoch']}, best val_loss {trial['best_val_loss']:.4f}")
+    return trials, meta, scaler
+
+def asha_search(configs, windows_dir, n_workers=None, threads_per_worker=None, min_epochs=5, max_epochs=50,
+                eta=3, patience=10, lookback=None, horizon=None, seed=42):
+    """
+    Ejecuta los trials en un pool de procesos con ASHA. La serie se carga
+    una vez en memoria compartida (float32) y todos los workers la leen.
+    Devuelve (trials, meta, scaler); cada trial lleva su historial por época,
+    su mejor modelo y su estado: "completed", "early_stopped" o "pruned".
+    """
+    pool, n_workers, meta, scaler = start_pool(windows_dir, n_workers, threads_per_worker, lookback, horizon)
+
+    asha = ASHA(min_epochs, max_epochs, eta)
+    print(f"➡️  {len(configs)} trials, rungs {asha.rungs}")
+    trials = {}
+    new_configs = iter(enumerate(configs, 1))
+    running = {}
+
+    def next_job():
+        promotion = asha.promotion()
+        trial_id, config = (None, None) if promotion else next(new_configs, (None, None))
+        if promotion is None and trial_id is None and not running:
+            promotion = asha.promotion(at_least_one=True)
+        if promotion is not None:
+            trial_id, rung = promotion
+        elif trial_id is not None:
+            trials[trial_id] = new_trial(trial_id, config, seed)
+            rung = 0
+        else:
+            return False
+        trial = {k: v for k, v in trials[trial_id].items() if k != "history"}
+        running[pool.submit(_run_segment, trial, asha.rungs[rung], patience)] = (trial_id, rung)
+        return True
+
+    with pool:
+        while True:
+            while len(running) < n_workers and next_job():
+                pass
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial_id, rung = running.pop(future)
+                trial, history = future.result()
+                trial["history"] = trials[trial_id]["history"] + history
+                trials[trial_id] = trial
+                if trial["stopped"]:
+                    trial["status"] = "early_stopped"
+                elif rung == len(asha.rungs) - 1:
+                    trial["status"] = "completed"
+                else:
+                    asha.report(trial_id, rung, trial["best_val_loss"])
+                    trial["status"] = "pruned"
+                print(f"{trial['run_name']}: epoch {trial['epoch']}, best val_loss {trial['best_val_loss']:.4f}")
+
+    return [trials[i] for i in sorted(trials)], meta, scaler
+
+def log_trial(trial, meta, scaler, out_dir):
+    """Run hijo de MLflow por trial; los no podados guardan best_model.pt y el bundle como train_lstm"""
+    with mlflow.start_run(run_name=trial["run_name"], nested=True):
+        buffered_mlflow.log_params(trial["config"])
+        buffered_mlflow.set_tag("status", trial["status"])
+        for epoch, metrics in enumerate(trial["history"], 1):
+            buffered_mlflow.log_metrics(metrics, step=epoch)
+        buffered_mlflow.log_metric("best_val_loss", trial["best_val_loss"])
+        buffered_mlflow.log_metric("epochs_trained", trial["epoch"])
+        if trial["status"] != "pruned" and trial["best_model"] is not None:
+            run_out_dir = os.path.join(out_dir, trial["run_name"])
+            os.makedirs(run_out_dir, exist_ok=True)
+            torch.save(trial["best_model"], os.path.join(run_out_dir, "best_model.pt"))
+            joblib.dump(scaler, os.path.join(run_out_dir, "scaler.pkl"))
+            with open(os.path.join(run_out_dir, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            config = trial["config"]
+            arch = {"input_size": meta["n_features"], "hidden_size": config["hidden_size"], "horizon": meta["horizon"],
+                    "dropout": config["dropout"], "stacked": config["stacked"]}
+            save_bundle(os.path.join(run_out_dir, BUNDLE_FILE), trial["best_model"], arch, meta, scaler)
+            mlflow.log_artifacts(run_out_dir)
+
+def main(args):
+    space = load_space(args.space)
+    configs = sample_configs(space, args.n_trials, args.seed)
+    print(f"🧪 Total combinations: {len(configs)}")
+
+    mlflow.set_tracking_uri(args.mlflow_uri)
+    mlflow.set_experiment(args.experiment)
+    start_time = time.time()
+    if args.ensemble:
+        trials, meta, scaler = ensemble_search(
+            configs, args.windows_dir, args.workers, args.threads_per_worker, args.epochs, args.patience,
+            args.ensemble_size, args.lookback, args.horizon, args.seed,
+        )
+    else:
+        trials, meta, scaler = asha_search(
+            configs, args.windows_dir, args.workers, args.threads_per_worker, args.min_epochs, args.epochs,
+            args.eta, args.patience, args.lookback, args.horizon, args.seed,
+        )
+    duration = time.time() - start_time
+
+    epochs_trained = sum(t["epoch"] for t in trials)
+    finished = [t for t in trials if t["status"] != "pruned"]
+    best = min(finished, key=lambda t: t["best_val_loss"])
+    with mlflow.start_run(run_name=f"{'ensemble' if args.ensemble else 'asha'}_search_{time.strftime('%Y-%m-%d_%H%M')}"):
+        buffered_mlflow.log_params({"n_trials": len(trials), "eta": args.eta, "min_epochs": args.min_epochs,
+                                    "max_epochs": args.epochs, "workers": args.workers or os.cpu_count(),
+                                    "ensemble": args.ensemble})
+        for trial in trials:
+            log_trial(trial, meta, scaler, args.out_dir)
+        buffered_mlflow.log_params({f"best_{k}": v for k, v in best["config"].items()})
+        buffered_mlflow.log_metrics({"best_val_loss": best["best_val_loss"], "epochs_trained": epochs_trained,
+                                     "search_duration_sec": duration})
+        buffered_mlflow.flush()
+
+    n_pruned = len(trials) - len(finished)
+    print(f"✂️  Pruned {n_pruned}/{len(trials)} trials; trained {epochs_trained} epochs "
+          f"of {len(trials) * args.epochs} for the full search")
+    print(f"🏆 Best: {best['run_name']} (val_loss {best['best_val_loss']:.4f})")
+    print(f"\n✅ All grid runs completed in {duration:.1f} s!")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Parallel LSTM hyperparameter search with ASHA early pruning")
+    parser.add_argument("--windows_dir", default="data/processed/windows")
+    parser.add_argument("--out_dir", default="artifacts")
+    parser.add_argument("--mlflow_uri", default="file:./mlruns")
+    parser.add_argument("--experiment", default="air_traffic_congestion")
+    parser.add_argument("--space", default=None, help="JSON search space (lists = choices, {low, high, log} = ranges)")
+    parser.add_argument("--n_trials", type=int, default=None, help="Random configurations to sample (default: full grid)")
+    parser.add_argument("--epochs", type=int, default=50, help="Max epochs per trial (last ASHA rung)")
+    parser.add_argument("--min_epochs", type=int, default=5, help="Epochs of the first ASHA rung")
+    parser.add_argument("--eta", type=int, default=3, help="Keep the best 1/eta trials at each rung")
+    parser.add_argument("--patience", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--threads_per_worker", type=int, default=None, help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--lookback", type=int, default=None)
+    parser.add_argument("--horizon", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ensemble", action="store_true", help="Train configs sharing hidden_size/stacked/batch_size together as one batched module (no pruning)")
+    parser.add_argument("--ensemble_size", type=int, default=8, help="Max configs per ensemble")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import argparse
+import threading
+from collections import OrderedDict
+import joblib
+import numpy as np
+import torch
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from export_lstm import check_variant, convert
+
+# Un solo archivo por modelo (torch.save de un dict, cargable con weights_only):
+#   format/version  "lstm_bundle" y BUNDLE_VERSION
+#   arch            argumentos de LSTMModel (input_size, hidden_size, horizon, dropout, stacked)
+#   meta            el meta.json de las ventanas con que se entrenó (lookback, horizon, features...)
+#   scaler          columnas, media y escala del StandardScaler del target
+#   state_dict      pesos fp32; las variantes int8/bf16 se derivan al cargar
+BUNDLE_FORMAT = "lstm_bundle"
+BUNDLE_VERSION = 1
+BUNDLE_FILE = "model_bundle.pt"
+CACHE_SIZE = 64
+
+class LSTMBundle:
+    """Modelo listo para inferencia (en eval) junto con su arquitectura, meta y scaler"""
+
+    def __init__(self, model, arch, meta, scaler, variant):
+        self.model = model
+        self.arch = arch
+        self.meta = meta
+        self.scaler = scaler
+        self.variant = variant
+
+    # float64 como scaler.mean_[0] / scaler.scale_[0], para desescalar igual que con scaler.pkl
+    @property
+    def target_mean(self):
+        return np.float64(self.scaler["mean"][0])
+
+    @property
+    def target_std(self):
+        return np.float64(self.scaler["scale"][0])
+
+def scaler_stats(scaler):
+    """Media y escala de un StandardScaler ajustado, como listas (sin pickle de sklearn)"""
+    columns = getattr(scaler, "feature_names_in_", None)
+    return {
+        "columns": [str(c) for c in columns] if columns is not None else None,
+        "mean": [float(v) for v in scaler.mean_],
+        "scale": [float(v) for v in scaler.scale_],
+    }
+
+def save_bundle(path, state_dict, arch, meta, scaler):
+    """
+    Guarda pesos, arquitectura, meta y scaler (StandardScaler o scaler_stats)
+    en `path`. Antes comprueba que todo encaja, para que un bundle que se
+    escribe siempre se pueda cargar.
+    """
+    from train_lstm import LSTMModel
+
+    if meta["n_features"] != arch["input_size"] or meta["horizon"] != arch["horizon"]:
+        raise ValueError(f"meta (n_features={meta['n_features']}, horizon={meta['horizon']}) does not match "
+                         f"arch (input_size={arch['input_size']}, horizon={arch['horizon']})")
+    LSTMModel(**arch).load_state_dict(state_dict)
+    torch.save({
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "arch": dict(arch),
+        "meta": meta,
+        "scaler": scaler if isinstance(scaler, dict) else scaler_stats(scaler),
+        "state_dict": {k: v.detach().cpu() for k, v in state_dict.items()},
+    }, path)
+    return path
+
+def read_bundle(path):
+    """
+    El dict del bundle con los tensores mapeados en memoria: leer arch, meta
+    o scaler no carga los pesos. Valida formato y versión.
+    """
+    bundle = torch.load(path, map_location="cpu", mmap=True)
+    if not isinstance(bundle, dict) or bundle.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"{path} is not an LSTM bundle (a bare state_dict? pack it with model_bundle.py)")
+    if bundle["version"] > BUNDLE_VERSION:
+        raise ValueError(f"{path} is bundle version {bundle['version']}, this code reads up to {BUNDLE_VERSION}")
+    return bundle
+
+def load_bundle(path, variant="fp32"):
+    """
+    LSTMBundle con el modelo reconstruido a partir de arch y convertido a
+    `variant`. int8/bf16 solo si pasaron la comprobación de export_lstm
+    (variants.json junto al bundle, como en la carpeta de artifacts del run).
+    """
+    from train_lstm import LSTMModel
+
+    check_variant(path, variant)
+    bundle = read_bundle(path)
+    model = LSTMModel(**bundle["arch"])
+    model.load_state_dict(bundle["state_dict"])
+    return LSTMBundle(convert(model, variant), bundle["arch"], bundle["meta"], bundle["scaler"], variant)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def get_bundle(path, variant="fp32"):
+    """
+    load_bundle con caché por proceso: cada (archivo, variante) se carga una
+    sola vez y se reutiliza mientras el archivo no cambie (mtime). Guarda
+    hasta CACHE_SIZE modelos y descarta el menos usado.
+    """
+    # Se comprueba en cada llamada: un variants.json regenerado puede retirar una variante
+    check_variant(path, variant)
+    key = (os.path.realpath(path), variant)
+    mtime = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            _cache.move_to_end(key)
+            return cached[1]
+
+    bundle = load_bundle(path, variant)
+    with _cache_lock:
+        _cache[key] = (mtime, bundle)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return bundle
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+def main(args):
+    with open(os.path.join(args.run_dir, "meta.json")) as f:
+        meta = json.load(f)
+    scaler = joblib.load(os.path.join(args.run_dir, "scaler.pkl"))
+    state_dict = torch.load(os.path.join(args.run_dir, "best_model.pt"), map_location="cpu")
+    arch = {"input_size": meta["n_features"], "hidden_size": args.hidden_size, "horizon": meta["horizon"],
+            "dropout": args.dropout, "stacked": args.stacked}
+
+    out_path = save_bundle(args.out_file or os.path.join(args.run_dir, BUNDLE_FILE), state_dict, arch, meta, scaler)
+    print(f"✅ Bundle {arch} (lookback={meta['lookback']}, horizon={meta['horizon']})")
+    print(f"💾 Saved bundle to {out_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack best_model.pt, meta.json and scaler.pkl of a run into one bundle")
+    parser.add_argument("--run_dir", required=True, help="Run folder with best_model.pt, meta.json and scaler.pkl")
+    parser.add_argument("--hidden_size", type=int, required=True)
+    parser.add_argument("--dropout", type=float, required=True)
+    parser.add_argument("--stacked", action="store_true")
+    parser.add_argument("--out_file", default=None, help=f"Default: <run_dir>/{BUNDLE_FILE}")
+    args = parser.parse_args()
+    main(args)
@@ -7,9 +7,11 @@ from tqdm import trange
 import joblib
 
 from train_lstm import LSTMModel
+from export_lstm import VARIANTS, load_variant
+from model_bundle import get_bundle
 
 
-def load_model(model_path, meta, hidden_size, dropout, stacked):
+def load_model(model_path, meta, hidden_size, dropout, stacked, variant="fp32"):
     device = torch.device("cpu")
     model = LSTMModel(
         input_size=meta["n_features"],
@@ -19,10 +21,7 @@ def load_model(model_path, meta, hidden_size, dropout, stacked):
         stacked=stacked
     ).to(device)
 
-    state_dict = torch.load(model_path, map_location=device)
-    model.load_state_dict(state_dict)
-    model.eval()
-    return model
+    return load_variant(model, model_path, variant)
 
 
 def rolling_forecast(model, start_window, steps_ahead, scaler_mean, scaler_std):
@@ -63,16 +62,34 @@ def rolling_forecast(model, start_window, steps_ahead, scaler_mean, scaler_std):
 
 def main(args):
     print(f"📌 Rolling forecast started")
-    
-    # Load meta
-    with open(args.meta_file) as f:
-        meta = json.load(f)
-    print(f"✅ Loaded meta: lookback={meta['lookback']}, n_features={meta['n_features']}, horizon={meta['horizon']}")
 
-    # Load scaler.pkl
-    scaler = joblib.load(args.scaler_file)
-    scaler_mean = scaler.mean_[0]
-    scaler_std = scaler.scale_[0]
+    if args.bundle:
+        # Modelo, arquitectura, meta y scaler salen del mismo archivo
+        bundle = get_bundle(args.bundle, args.variant)
+        model, meta = bundle.model, bundle.meta
+        scaler_mean, scaler_std = bundle.target_mean, bundle.target_std
+        print(f"✅ Loaded {args.variant} bundle from {args.bundle}: {bundle.arch}")
+    else:
+        # Load meta
+        with open(args.meta_file) as f:
+            meta = json.load(f)
+
+        # Load scaler.pkl
+        scaler = joblib.load(args.scaler_file)
+        scaler_mean = scaler.mean_[0]
+        scaler_std = scaler.scale_[0]
+
+        # Load trained model
+        model = load_model(
+            args.model_path,
+            meta,
+            hidden_size=args.hidden_size,
+            dropout=args.dropout,
+            stacked=args.stacked,
+            variant=args.variant
+        )
+        print(f"✅ Loaded {args.variant} model from {args.model_path}")
+    print(f"✅ Loaded meta: lookback={meta['lookback']}, n_features={meta['n_features']}, horizon={meta['horizon']}")
     print(f"✅ Loaded scaler (mean={scaler_mean:.3f}, std={scaler_std:.3f})")
 
     # Load start window
@@ -81,16 +98,6 @@ def main(args):
         raise ValueError(f"❌ start_window shape mismatch: expected {(meta['lookback'], meta['n_features'])}, got {start_window.shape}")
     print(f"✅ Loaded start window shape: {start_window.shape}")
 
-    # Load trained model
-    model = load_model(
-        args.model_path,
-        meta,
-        hidden_size=args.hidden_size,
-        dropout=args.dropout,
-        stacked=args.stacked
-    )
-    print(f"✅ Loaded model from {args.model_path}")
-
     # Perform rolling forecast
     predictions = rolling_forecast(
         model,
@@ -110,15 +117,19 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Rolling Forecast with trained LSTM Model")
-    parser.add_argument("--model_path", required=True, help="Path to trained model .pt")
-    parser.add_argument("--meta_file", required=True, help="Path to meta.json")
+    parser.add_argument("--bundle", default=None, help="model_bundle.pt (replaces model_path, meta_file, scaler_file, hidden_size, dropout, stacked)")
+    parser.add_argument("--model_path", help="Path to trained model .pt")
+    parser.add_argument("--meta_file", help="Path to meta.json")
     parser.add_argument("--start_window", required=True, help="NPY file with shape (lookback, n_features)")
-    parser.add_argument("--scaler_file", required=True, help="Path to scaler.pkl")
+    parser.add_argument("--scaler_file", help="Path to scaler.pkl")
     parser.add_argument("--out_dir", default="outputs", help="Folder to save predictions")
-    parser.add_argument("--hidden_size", type=int, required=True)
-    parser.add_argument("--dropout", type=float, required=True)
+    parser.add_argument("--hidden_size", type=int)
+    parser.add_argument("--dropout", type=float)
     parser.add_argument("--steps_ahead", type=int, default=30, help="Total future steps to predict")
     parser.add_argument("--stacked", action="store_true", help="Use stacked (2-layer) LSTM")
+    parser.add_argument("--variant", choices=VARIANTS, default="fp32", help="Inference variant exported by export_lstm.py")
     args = parser.parse_args()
+    if not args.bundle and None in (args.model_path, args.meta_file, args.scaler_file, args.hidden_size, args.dropout):
+        parser.error("pass --bundle, or --model_path, --meta_file, --scaler_file, --hidden_size and --dropout")
 
     main(args)
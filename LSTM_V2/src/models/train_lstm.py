@@ -1,14 +1,22 @@
 ﻿import os
+import sys
+import time
 import argparse
 import json
 import numpy as np
 import mlflow
 import torch
 import torch.nn as nn
-from torch.utils.data import TensorDataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, BatchSampler, RandomSampler, SequentialSampler
 from tqdm import tqdm
 import joblib
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+from window_dataset import load_windows
+import buffered_mlflow
+from model_bundle import BUNDLE_FILE, save_bundle
+
 class LSTMModel(nn.Module):
     def __init__(self, input_size, hidden_size, horizon, dropout, stacked):
         super().__init__()
@@ -26,15 +34,32 @@ class LSTMModel(nn.Module):
         out = self.fc(out)
         return out
 
-def load_data(windows_dir):
-    X_train = np.load(os.path.join(windows_dir, "X_train.npz"))['arr_0']
-    y_train = np.load(os.path.join(windows_dir, "y_train.npz"))['arr_0']
-    X_val = np.load(os.path.join(windows_dir, "X_val.npz"))['arr_0']
-    y_val = np.load(os.path.join(windows_dir, "y_val.npz"))['arr_0']
-    with open(os.path.join(windows_dir, "meta.json")) as f:
-        meta = json.load(f)
+def load_data(windows_dir, lookback=None, horizon=None):
+    train, val, meta = load_windows(windows_dir, lookback, horizon)
     scaler = joblib.load(os.path.join(windows_dir, "scaler.pkl"))
-    return X_train, y_train, X_val, y_val, meta, scaler
+    return train, val, meta, scaler
+
+class WindowBatches(Dataset):
+    """
+    Dataset de torch sobre SeriesWindows que recibe lotes de índices
+    (BatchSampler) y corta sus ventanas de una vez desde la serie mapeada.
+    """
+
+    def __init__(self, windows):
+        self.windows = windows
+
+    def __len__(self):
+        return len(self.windows)
+
+    def __getitem__(self, idx):
+        X, y = self.windows[idx]
+        return torch.from_numpy(X.astype(np.float32)), torch.from_numpy(y.astype(np.float32))
+
+def make_loader(windows, batch_size, shuffle):
+    dataset = WindowBatches(windows)
+    sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    # batch_size=None: cada elemento del sampler ya es un lote de índices
+    return DataLoader(dataset, batch_size=None, sampler=BatchSampler(sampler, batch_size, drop_last=False))
 
 def train_one_epoch(model, dataloader, loss_fn, optimizer, device):
     model.train()
@@ -66,25 +91,152 @@ def validate(model, dataloader, loss_fn, device):
             all_preds.append(y_pred.cpu().numpy())
     return total_loss / len(dataloader.dataset), total_mae / len(dataloader.dataset), np.concatenate(all_preds)
 
+# ─────────────── Modo rápido en CPU ───────────────
+class TensorWindows:
+    """
+    Ventanas sobre la serie como tensores float32 contiguos (features y
+    target por separado): cada lote se corta con un solo gather (starts +
+    desplazamientos), sin DataLoader ni copias de todas las ventanas.
+    X_series/y_series se comparten entre train y val (y entre procesos).
+    """
+
+    def __init__(self, X_series, y_series, starts, lookback, horizon):
+        self.X_series = X_series
+        self.y_series = y_series
+        self.starts = torch.from_numpy(np.asarray(starts, dtype=np.int64)).to(X_series.device)
+        self.x_offsets = torch.arange(lookback, device=X_series.device)
+        self.y_offsets = torch.arange(lookback, lookback + horizon, device=X_series.device)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def batch(self, idx):
+        starts = self.starts[idx].unsqueeze(1)
+        return self.X_series[starts + self.x_offsets], self.y_series[starts + self.y_offsets]
+
+def series_tensors(series, device):
+    """(X_series, y_series) float32 contiguos a partir de la serie de window_dataset"""
+    series = np.asarray(series)
+    X_series = torch.from_numpy(np.ascontiguousarray(series[:, :-1], dtype=np.float32)).to(device)
+    y_series = torch.from_numpy(np.ascontiguousarray(series[:, -1], dtype=np.float32)).to(device)
+    return X_series, y_series
+
+def tensor_windows(train, val, device):
+    """TensorWindows de train y val sobre una única copia float32 de la serie"""
+    X_series, y_series = series_tensors(train.series, device)
+    return (
+        TensorWindows(X_series, y_series, train.starts, train.lookback, train.horizon),
+        TensorWindows(X_series, y_series, val.starts, val.lookback, val.horizon),
+    )
+
+def configure_threads(threads):
+    """Hilos intra-op de torch (por defecto, los que elija torch) y un solo hilo inter-op"""
+    if threads:
+        torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Solo se puede fijar antes del primer trabajo en paralelo
+        pass
+
+def train_one_epoch_fast(model, windows, loss_fn, optimizer, batch_size, generator):
+    """
+    Como train_one_epoch, pero barajando índices sobre TensorWindows y
+    acumulando loss y MAE en el dispositivo: una sola sincronización por época.
+    """
+    model.train()
+    n = len(windows)
+    order = torch.randperm(n, generator=generator).to(windows.starts.device)
+    total_loss = torch.zeros((), device=windows.starts.device)
+    total_mae = torch.zeros((), device=windows.starts.device)
+    for start in range(0, n, batch_size):
+        X_batch, y_batch = windows.batch(order[start:start + batch_size])
+        optimizer.zero_grad(set_to_none=True)
+        y_pred = model(X_batch)
+        loss = loss_fn(y_pred, y_batch)
+        loss.backward()
+        optimizer.step()
+        with torch.no_grad():
+            total_loss += loss.detach() * len(X_batch)
+            total_mae += (y_pred.detach() - y_batch).abs().mean() * len(X_batch)
+    return (total_loss / n).item(), (total_mae / n).item()
+
+def validate_fast(model, windows, loss_fn, batch_size):
+    model.eval()
+    n = len(windows)
+    total_loss = torch.zeros((), device=windows.starts.device)
+    total_mae = torch.zeros((), device=windows.starts.device)
+    all_preds = []
+    with torch.inference_mode():
+        for start in range(0, n, batch_size):
+            X_batch, y_batch = windows.batch(torch.arange(start, min(start + batch_size, n), device=windows.starts.device))
+            y_pred = model(X_batch)
+            total_loss += loss_fn(y_pred, y_batch) * len(X_batch)
+            total_mae += (y_pred - y_batch).abs().mean() * len(X_batch)
+            all_preds.append(y_pred)
+    preds = torch.cat(all_preds).cpu().numpy() if all_preds else np.zeros((0, windows.y_offsets.numel()), dtype=np.float32)
+    return (total_loss / n).item(), (total_mae / n).item(), preds
+
+def benchmark_training(windows_dir, epochs=3, batch_size=32, hidden_size=64, threads=None, seed=42,
+                       dropout=0.2, stacked=False, lookback=None, horizon=None):
+    """
+    Épocas/s del bucle con DataLoader frente al modo rápido, con el mismo
+    modelo inicial y la misma configuración que un entrenamiento normal. El
+    modo rápido se ejecuta dos veces con la misma semilla para comprobar que
+    es reproducible.
+    """
+    configure_threads(threads)
+    train, val, meta, _ = load_data(windows_dir, lookback, horizon)
+    device = torch.device("cpu")
+    loss_fn = nn.MSELoss()
+    print(f"➡️  {len(train)} train windows (lookback={meta['lookback']}, horizon={meta['horizon']}), "
+          f"batch_size={batch_size}, {epochs} epochs, {torch.get_num_threads()} threads")
+
+    def new_model():
+        torch.manual_seed(seed)
+        model = LSTMModel(meta["n_features"], hidden_size, meta["horizon"], dropout, stacked)
+        return model, torch.optim.Adam(model.parameters(), lr=1e-3)
+
+    model, optimizer = new_model()
+    train_loader = make_loader(train, batch_size, shuffle=True)
+    start_time = time.time()
+    for _ in range(epochs):
+        loader_loss, _ = train_one_epoch(model, train_loader, loss_fn, optimizer, device)
+    loader_eps = epochs / (time.time() - start_time)
+
+    train_t, _ = tensor_windows(train, val, device)
+    fast_runs = []
+    for _ in range(2):
+        model, optimizer = new_model()
+        generator = torch.Generator().manual_seed(seed)
+        start_time = time.time()
+        for _ in range(epochs):
+            fast_loss, _ = train_one_epoch_fast(model, train_t, loss_fn, optimizer, batch_size, generator)
+        fast_runs.append((epochs / (time.time() - start_time), fast_loss, model.state_dict()))
+
+    fast_eps = fast_runs[0][0]
+    reproducible = fast_runs[0][1] == fast_runs[1][1] and all(
+        torch.equal(fast_runs[0][2][k], fast_runs[1][2][k]) for k in fast_runs[0][2]
+    )
+    print(f"⏱️  DataLoader loop: {loader_eps:.2f} epochs/s (train loss {loader_loss:.4f})")
+    print(f"⏱️  Fast CPU loop: {fast_eps:.2f} epochs/s (train loss {fast_runs[0][1]:.4f}, {fast_eps / loader_eps:.1f}x)")
+    print(f"✅ Reproducible: {reproducible}")
+    return loader_eps, fast_eps, reproducible
+
 def main(args):
+    configure_threads(args.threads)
     mlflow.set_tracking_uri(args.mlflow_uri)
     mlflow.set_experiment(args.experiment)
     with mlflow.start_run(run_name=args.run_name):
-        mlflow.log_params(vars(args))
+        buffered_mlflow.log_params(vars(args))
 
-        X_train, y_train, X_val, y_val, meta, scaler = load_data(args.windows_dir)
-        print(f"✅ Loaded data: X_train {X_train.shape}, y_train {y_train.shape}")
+        train, val, meta, scaler = load_data(args.windows_dir, args.lookback, args.horizon)
+        print(f"✅ Loaded data: {len(train)} train / {len(val)} val windows "
+              f"(lookback={meta['lookback']}, horizon={meta['horizon']})")
 
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         print(f"Using device: {device}")
-
-        train_ds = TensorDataset(torch.tensor(X_train, dtype=torch.float32),
-                                 torch.tensor(y_train, dtype=torch.float32))
-        val_ds = TensorDataset(torch.tensor(X_val, dtype=torch.float32),
-                               torch.tensor(y_val, dtype=torch.float32))
-
-        train_loader = DataLoader(train_ds, batch_size=args.batch_size, shuffle=True)
-        val_loader = DataLoader(val_ds, batch_size=args.batch_size, shuffle=False)
+        torch.manual_seed(args.seed)
 
         model = LSTMModel(
             input_size=meta["n_features"],
@@ -98,6 +250,18 @@ def main(args):
         optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
         loss_fn = nn.MSELoss()
 
+        if args.fast_cpu:
+            print(f"⚡ Fast CPU loop with {torch.get_num_threads()} threads")
+            train_t, val_t = tensor_windows(train, val, device)
+            generator = torch.Generator().manual_seed(args.seed)
+            run_epoch = lambda: train_one_epoch_fast(model, train_t, loss_fn, optimizer, args.batch_size, generator)
+            run_validation = lambda: validate_fast(model, val_t, loss_fn, args.batch_size)
+        else:
+            train_loader = make_loader(train, args.batch_size, shuffle=True)
+            val_loader = make_loader(val, args.batch_size, shuffle=False)
+            run_epoch = lambda: train_one_epoch(model, train_loader, loss_fn, optimizer, device)
+            run_validation = lambda: validate(model, val_loader, loss_fn, device)
+
         best_val_loss = float('inf')
         patience_counter = 0
 
@@ -105,17 +269,15 @@ def main(args):
         os.makedirs(run_out_dir, exist_ok=True)
 
         for epoch in range(1, args.epochs + 1):
-            train_loss, train_mae = train_one_epoch(model, train_loader, loss_fn, optimizer, device)
-            val_loss, val_mae, _ = validate(model, val_loader, loss_fn, device)
+            train_loss, train_mae = run_epoch()
+            val_loss, val_mae, _ = run_validation()
 
             print(f"Epoch {epoch:03d}: "
                   f"Train Loss {train_loss:.4f}, Train MAE {train_mae:.4f} | "
                   f"Val Loss {val_loss:.4f}, Val MAE {val_mae:.4f}")
 
-            mlflow.log_metric("train_loss", train_loss, step=epoch)
-            mlflow.log_metric("train_mae", train_mae, step=epoch)
-            mlflow.log_metric("val_loss", val_loss, step=epoch)
-            mlflow.log_metric("val_mae", val_mae, step=epoch)
+            buffered_mlflow.log_metrics({"train_loss": train_loss, "train_mae": train_mae,
+                                         "val_loss": val_loss, "val_mae": val_mae}, step=epoch)
 
             if val_loss < best_val_loss:
                 best_val_loss = val_loss
@@ -133,19 +295,24 @@ def main(args):
                     param_group['lr'] *= 0.5
                 print(f"🔽 Reduced LR to {optimizer.param_groups[0]['lr']}")
 
-        _, _, y_pred = validate(model, val_loader, loss_fn, device)
-        np.save(os.path.join(run_out_dir, "y_val.npy"), y_val)
+        _, _, y_pred = run_validation()
+        np.save(os.path.join(run_out_dir, "y_val.npy"), val.y)
         np.save(os.path.join(run_out_dir, "y_pred.npy"), y_pred)
         joblib.dump(scaler, os.path.join(run_out_dir, "scaler.pkl"))
         with open(os.path.join(run_out_dir, "meta.json"), "w") as f:
             json.dump(meta, f)
+        arch = {"input_size": meta["n_features"], "hidden_size": args.hidden_size, "horizon": meta["horizon"],
+                "dropout": args.dropout, "stacked": args.stacked}
+        best_state = torch.load(os.path.join(run_out_dir, "best_model.pt"), map_location="cpu")
+        save_bundle(os.path.join(run_out_dir, BUNDLE_FILE), best_state, arch, meta, scaler)
 
+        buffered_mlflow.flush()
         mlflow.log_artifacts(run_out_dir)
         print("✅ Training complete.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Train LSTM for Air Traffic Congestion Prediction")
-    parser.add_argument("--windows_dir", default="data/processed/windows", help="Directory with .npz window files")
+    parser.add_argument("--windows_dir", default="data/processed/windows", help="Directory with the series written by create_windows.py")
     parser.add_argument("--out_dir", default="artifacts", help="Base output directory")
     parser.add_argument("--mlflow_uri", default="file:./mlruns", help="MLflow Tracking URI")
     parser.add_argument("--experiment", default="air_traffic_congestion", help="MLflow experiment name")
@@ -157,5 +324,15 @@ if __name__ == "__main__":
     parser.add_argument("--lr", type=float, default=1e-3)
     parser.add_argument("--patience", type=int, default=10)
     parser.add_argument("--stacked", action="store_true", help="Use 2-layer stacked LSTM")
+    parser.add_argument("--lookback", type=int, default=None, help="Override the lookback in meta.json")
+    parser.add_argument("--horizon", type=int, default=None, help="Override the horizon in meta.json")
+    parser.add_argument("--fast_cpu", action="store_true", help="Index-shuffled training over contiguous tensors, without DataLoader")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--benchmark", action="store_true", help="Compare epochs/sec of the DataLoader loop and the fast CPU loop")
     args = parser.parse_args()
-    main(args)
+    if args.benchmark:
+        benchmark_training(args.windows_dir, args.epochs, args.batch_size, args.hidden_size, args.threads, args.seed,
+                           args.dropout, args.stacked, args.lookback, args.horizon)
+    else:
+        main(args)
@@ -3,11 +3,30 @@ import numpy as np
 import argparse
 import json
 from src.models.train_lstm import LSTMModel
+from src.models.export_lstm import VARIANTS, load_variant
+from src.models.model_bundle import get_bundle
 
 def main(args):
-    # Cargar meta
-    with open(args.meta_file) as f:
-        meta = json.load(f)
+    if args.bundle:
+        # El bundle trae modelo, arquitectura y meta en un solo archivo
+        bundle = get_bundle(args.bundle, args.variant)
+        model, meta = bundle.model, bundle.meta
+        print(f"✅ Loaded {args.variant} bundle from {args.bundle}: {bundle.arch}")
+    else:
+        # Cargar meta
+        with open(args.meta_file) as f:
+            meta = json.load(f)
+
+        # Cargar modelo
+        model = LSTMModel(
+            input_size=meta["n_features"],
+            hidden_size=args.hidden_size,
+            horizon=meta["horizon"],
+            dropout=args.dropout,
+            stacked=args.stacked
+        )
+        model = load_variant(model, args.model_path, args.variant)
+        print(f"✅ Loaded {args.variant} model from {args.model_path}")
 
     lookback = meta["lookback"]
     n_features = meta["n_features"]
@@ -15,20 +34,10 @@ def main(args):
 
     print(f"✅ Loaded meta: lookback={lookback}, n_features={n_features}, horizon={horizon}")
 
-    # Cargar modelo
-    model = LSTMModel(
-        input_size=n_features,
-        hidden_size=args.hidden_size,
-        horizon=horizon,
-        dropout=args.dropout,
-        stacked=args.stacked
-    )
-    model.load_state_dict(torch.load(args.model_path, map_location="cpu"))
-    model.eval()
-    print(f"✅ Loaded model from {args.model_path}")
-
     # Cargar ventana nueva
     window = np.load(args.new_window)
+    if window.shape != (lookback, n_features):
+        raise ValueError(f"❌ new_window shape mismatch: expected {(lookback, n_features)}, got {window.shape}")
     print(f"✅ Loaded new window shape: {window.shape}")
 
     # Predecir
@@ -44,12 +53,16 @@ def main(args):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model_path", required=True)
-    parser.add_argument("--meta_file", required=True)
+    parser.add_argument("--bundle", default=None, help="model_bundle.pt (replaces model_path, meta_file, hidden_size, dropout, stacked)")
+    parser.add_argument("--model_path")
+    parser.add_argument("--meta_file")
     parser.add_argument("--new_window", required=True, help="NPY file with shape (lookback, n_features)")
     parser.add_argument("--out_file", default="outputs/new_prediction.npy")
-    parser.add_argument("--hidden_size", type=int, required=True)
-    parser.add_argument("--dropout", type=float, required=True)
+    parser.add_argument("--hidden_size", type=int)
+    parser.add_argument("--dropout", type=float)
     parser.add_argument("--stacked", action="store_true")
+    parser.add_argument("--variant", choices=VARIANTS, default="fp32", help="fp32, int8 or bf16 (see export_lstm.py)")
     args = parser.parse_args()
+    if not args.bundle and None in (args.model_path, args.meta_file, args.hidden_size, args.dropout):
+        parser.error("pass --bundle, or --model_path, --meta_file, --hidden_size and --dropout")
     main(args)
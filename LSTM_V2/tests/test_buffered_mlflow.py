@@ -0,0 +1,15 @@
+import os
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+COPIES = [
+    os.path.join(ROOT, "MLPipeline", "buffered_mlflow.py"),
+    os.path.join(ROOT, "LSTM_V2", "src", "models", "buffered_mlflow.py"),
+]
+
+def test_buffered_mlflow_copies_are_identical():
+    # Cada proyecto se despliega por separado con su copia; deben ser el mismo archivo
+    contents = []
+    for path in COPIES:
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    assert contents[0] == contents[1], f"{COPIES[0]} and {COPIES[1]} differ; apply the change to both"
@@ -0,0 +1,120 @@
+import os
+import sys
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "data"))
+from prepare_dataset import (KEYS, STATE_DIR, DAYS_DIR, aggregate_files, assign_cells, cell_bins, cell_grid,
+                             decode_cells, derive_state, finalize_aggregate, main)
+
+# Valores en el borde de una celda (0.3 / 0.1 = 2.9999999999999996, 0.7 / 0.1 = 6.999999999999999...)
+EDGE_COORDS = [0.0, 0.1, 0.3, 0.5, 0.7, 1.0, 10.0, -0.1, -0.3, -0.5, -10.0, 89.9, 90.0, -180.0, 179.9, 180.0]
+
+def write_raw(path, seed=0, n=5000, start="2025-06-25", hours=3):
+    rng = np.random.default_rng(seed)
+    lat = np.concatenate([rng.choice(EDGE_COORDS, n // 2), rng.uniform(-90, 90, n - n // 2)]).round(4)
+    lon = np.concatenate([rng.choice(EDGE_COORDS, n // 2), rng.uniform(-180, 180, n - n // 2)]).round(4)
+    lat, lon = np.clip(lat, -90, 90), np.clip(lon, -180, 180)
+    seconds = rng.integers(0, hours * 3600, n)
+    timestamps = (pd.Timestamp(start, tz="UTC") + pd.to_timedelta(seconds, unit="s")).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00Z")
+    pd.DataFrame({
+        "icao24": [f"a{i:05x}" for i in rng.integers(0, 300, n)],
+        "callsign": [f"CS{i}" for i in rng.integers(0, 200, n)],
+        "longitude": lon,
+        "latitude": lat,
+        "baro_altitude": rng.uniform(0, 12000, n).round(2),
+        "on_ground": "false",
+        "velocity": rng.uniform(0, 300, n).round(2),
+        "timestamp_ingest": timestamps,
+    }).to_csv(path, index=False)
+    return str(path)
+
+def test_cell_bins_edges():
+    assert list(cell_bins([0.3, 0.7, 10.0, -0.1, -0.3], 0.1)) == [3, 7, 100, -1, -3]
+    assert list(cell_bins([0.3, 0.7, 10.0, -0.1, -0.3], 0.5)) == [0, 1, 20, -1, -1]
+
+def test_fine_grid_cell_ids_do_not_overflow():
+    # 0.001° son 180001 x 360001 celdas: más códigos de los que caben en int32
+    df = assign_cells(pd.DataFrame({"latitude": [89.999, -90.0, 0.3], "longitude": [179.999, -180.0, 0.7]}), 0.001)
+    assert df["cell_id"].dtype == np.int64
+    lat_bin, lon_bin, _, _ = decode_cells(df["cell_id"], cell_grid(0.001))
+    assert list(lat_bin) == [89999, -90000, 300] and list(lon_bin) == [179999, -180000, 700]
+    assert assign_cells(pd.DataFrame({"latitude": [0.3], "longitude": [0.7]}), 0.1)["cell_id"].dtype == np.int32
+
+@pytest.mark.parametrize("distinct", ["exact", "hll"])
+def test_derived_cube_matches_direct_run(tmp_path, distinct):
+    paths = [write_raw(tmp_path / "a.csv", seed=0), write_raw(tmp_path / "b.csv", seed=1)]
+    cube = aggregate_files(paths, 0.1, "1min", distinct, n_workers=1)
+    derived = finalize_aggregate(derive_state(cube, 0.1, "1min", 0.5, "5min"))
+    direct = finalize_aggregate(aggregate_files(paths, 0.5, "5min", distinct, n_workers=1))
+
+    derived = derived.sort_values(KEYS).reset_index(drop=True)
+    direct = direct.sort_values(KEYS).reset_index(drop=True)
+    pd.testing.assert_frame_equal(derived[KEYS], direct[KEYS], check_column_type=False)
+    # Con HLL el sketch de la celda gruesa es la unión de los finos: misma estimación
+    pd.testing.assert_series_equal(derived["congestion_count"], direct["congestion_count"])
+    pd.testing.assert_series_equal(derived["n_callsigns"], direct["n_callsigns"])
+    for column in derived.columns.difference(KEYS + ["congestion_count", "n_callsigns"]):
+        np.testing.assert_allclose(derived[column], direct[column], rtol=1e-9, atol=1e-9, err_msg=column)
+
+def test_derive_state_rejects_bad_resolutions(tmp_path):
+    cube = aggregate_files([write_raw(tmp_path / "a.csv", n=200)], 0.1, "2min", n_workers=1)
+    with pytest.raises(ValueError, match="cell_size_deg"):
+        derive_state(cube, 0.1, "2min", 0.25)
+    with pytest.raises(ValueError, match="time_bin"):
+        derive_state(cube, 0.1, "2min", time_bin="3min")
+    with pytest.raises(ValueError, match="time_bin"):
+        derive_state(cube, 0.1, "2min", time_bin="1min")
+
+def run_prepare(input_dir, out_dir, append=False, distinct="exact"):
+    main(argparse.Namespace(input_dir=str(input_dir), out_dir=str(out_dir), cell_size_deg=0.5, time_bin="5min",
+                            distinct=distinct, hll_precision=12, append=append, workers=1, from_state=None,
+                            write_csv=False, processes=1))
+    table = pd.read_parquet(os.path.join(out_dir, "aggregated_congestion.parquet"))
+    return table.sort_values(KEYS).reset_index(drop=True), joblib.load(os.path.join(out_dir, "scaler.pkl"))
+
+@pytest.mark.parametrize("distinct", ["exact", "hll"])
+def test_append_matches_full_run(tmp_path, distinct):
+    # a: 24 y 25 de junio; b: de la tarde del 25 al 26, así el 25 se combina con lo guardado
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    write_raw(raw / "a.csv", seed=0, start="2025-06-24", hours=40)
+    first, _ = run_prepare(raw, tmp_path / "inc", distinct=distinct)
+    day_24 = tmp_path / "inc" / STATE_DIR / DAYS_DIR / "2025-06-24" / "moments.parquet"
+    mtime_24 = os.stat(day_24).st_mtime_ns
+
+    write_raw(raw / "b.csv", seed=1, start="2025-06-25T12:00", hours=30)
+    appended, appended_scaler = run_prepare(raw, tmp_path / "inc", append=True, distinct=distinct)
+    full, full_scaler = run_prepare(raw, tmp_path / "full", distinct=distinct)
+
+    assert os.stat(day_24).st_mtime_ns == mtime_24  # el día que no tocan los archivos nuevos no se reescribe
+    assert len(appended) > len(first)
+    pd.testing.assert_frame_equal(appended, full)
+    np.testing.assert_allclose(appended_scaler.mean_, full_scaler.mean_, rtol=1e-12)
+    np.testing.assert_allclose(appended_scaler.scale_, full_scaler.scale_, rtol=1e-12)
+    # El scaler por sumas es el mismo que ajustarlo sobre la tabla
+    np.testing.assert_allclose(full_scaler.mean_, [full["congestion_count"].mean()], rtol=1e-12)
+    np.testing.assert_allclose(full_scaler.scale_, [full["congestion_count"].std(ddof=0)], rtol=1e-12)
+
+def test_append_detects_rewritten_file_of_same_size(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    path = write_raw(raw / "a.csv", n=300)
+    run_prepare(raw, tmp_path / "out")
+    stat = os.stat(path)
+
+    # Solo cambia el mtime (como tras un git clone): mismo contenido, no hay nada nuevo
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    run_prepare(raw, tmp_path / "out", append=True)
+
+    # Mismo tamaño, otro contenido
+    with open(path) as f:
+        text = f.read()
+    with open(path, "w") as f:
+        f.write(text.replace("CS1", "CS2", 1))
+    assert os.path.getsize(path) == stat.st_size
+    with pytest.raises(ValueError, match="changed"):
+        run_prepare(raw, tmp_path / "out", append=True)
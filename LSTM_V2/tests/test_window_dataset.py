@@ -0,0 +1,23 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "data"))
+from window_dataset import OFFSETS_FILE, load_windows, save_series
+
+META = {"lookback": 2, "horizon": 1, "n_features": 1, "test_frac": 0.5}
+
+@pytest.mark.parametrize("cell_ids", [np.array([3, 3, 3, 7, 7, 7, 7]), np.array(["-1_2"] * 3 + ["0_5"] * 4)])
+def test_save_series_cell_offsets(tmp_path, cell_ids):
+    # cell_id entero (prepare_dataset actual) o texto "lat_lon" (agregados anteriores)
+    series = np.arange(14, dtype=np.float64).reshape(7, 2)
+    save_series(tmp_path, series, cell_ids, META)
+    assert list(np.load(tmp_path / OFFSETS_FILE)) == [0, 3, 7]
+    train, val, _ = load_windows(tmp_path)
+    assert len(train) + len(val) == 3  # 1 ventana en la primera celda, 2 en la segunda
+
+def test_load_windows_legacy_layout(tmp_path):
+    np.savez(tmp_path / "X_train.npz", X=np.zeros((1, 2, 1)))
+    with pytest.raises(FileNotFoundError, match="rerun create_windows.py"):
+        load_windows(tmp_path)
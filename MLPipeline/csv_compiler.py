@@ -3,12 +3,12 @@ import json
 import csv
 import os
 
-def csv_compiler():
-    LAMBDA_NAME = 'daily_extractor'
-    REGION_NAME = 'us-east-1'
+LAMBDA_NAME = 'daily_extractor'
+REGION_NAME = 'us-east-1'
 
+def get_daily_object():
+    """(bucket, key) del JSON diario que devuelve la Lambda, o None si falla"""
     lambda_client = boto3.client('lambda', region_name=REGION_NAME)
-    s3_client = boto3.client('s3', region_name=REGION_NAME)
 
     # Invocamos Lambda
     print("Invocando Lambda para obtener bucket y key...")
@@ -20,10 +20,18 @@ def csv_compiler():
     payload = json.load(resp['Payload'])
     if payload.get("statusCode") != 200:
         print(f"❌ Error en Lambda: {payload.get('body')}")
-        return
+        return None
     body = json.loads(payload['body'])
-    bucket = body['bucket']
-    key = body['key']
+    return body['bucket'], body['key']
+
+def csv_compiler(bucket=None, key=None):
+    s3_client = boto3.client('s3', region_name=REGION_NAME)
+
+    if bucket is None or key is None:
+        daily_object = get_daily_object()
+        if daily_object is None:
+            return
+        bucket, key = daily_object
 
     print(f"Bucket: {bucket}")
     print(f"Key: {key}")
@@ -0,0 +1,138 @@
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.stats import t as student_t
+from sklearn.metrics import silhouette_score, davies_bouldin_score
+
+from denstream_numpy import BatchDenStream
+from denstream_format import CompactDenStream
+
+SILHOUETTE_SAMPLE_SIZE = 2_000
+SILHOUETTE_REPEATS = 5
+
+# ─────────────── Micro-clusters ───────────────
+def get_p_centers(clusterer):
+    """Centros de los p-micro-clusters como array (n, d), para river o BatchDenStream"""
+    if isinstance(clusterer, BatchDenStream):
+        return clusterer.p_centers
+    return np.array([
+        list(mc.calc_center(clusterer.timestamp).values())
+        for mc in clusterer.p_micro_clusters.values()
+    ])
+
+def get_p_arrays(clusterer):
+    """(centros, radios, pesos) de los p-micro-clusters en el timestamp actual"""
+    if isinstance(clusterer, CompactDenStream):
+        return clusterer.p_centers, clusterer.p_radii, clusterer.p_weights
+    if isinstance(clusterer, BatchDenStream):
+        pmc = clusterer.p_micro_clusters
+        if pmc is None:
+            return np.empty((0, 0)), np.empty(0), np.empty(0)
+        return pmc.centers, pmc.radii(), pmc.weights(clusterer.timestamp, clusterer.decaying_factor)
+    mcs = list(clusterer.p_micro_clusters.values())
+    return (
+        get_p_centers(clusterer),
+        np.array([mc.calc_radius(clusterer.timestamp) for mc in mcs]),
+        np.array([mc.calc_weight(clusterer.timestamp) for mc in mcs]),
+    )
+
+def micro_cluster_stats(clusterer):
+    """Conteos y estadisticas de peso de los micro-clusters en el timestamp actual"""
+    if isinstance(clusterer, BatchDenStream):
+        if clusterer.p_micro_clusters is None:
+            weights, n_outliers = np.empty(0), 0
+        else:
+            weights = clusterer.p_micro_clusters.weights(clusterer.timestamp, clusterer.decaying_factor)
+            n_outliers = len(clusterer.o_micro_clusters)
+    else:
+        weights = np.array([mc.calc_weight(clusterer.timestamp) for mc in clusterer.p_micro_clusters.values()])
+        n_outliers = len(clusterer.o_micro_clusters)
+
+    stats = {"n_p_micro_clusters": len(weights), "n_o_micro_clusters": n_outliers}
+    if len(weights):
+        stats.update({
+            "p_mc_weight_sum": float(weights.sum()),
+            "p_mc_weight_mean": float(weights.mean()),
+            "p_mc_weight_min": float(weights.min()),
+            "p_mc_weight_max": float(weights.max()),
+        })
+    return stats
+
+# ─────────────── Asignacion y metricas ───────────────
+def assign_nearest(X, centers):
+    """Etiqueta y distancia al centro mas cercano con un KD-tree (O(n log k))"""
+    distances, labels = cKDTree(centers).query(X)
+    return labels, distances
+
+def stratified_sample(labels, sample_size, rng):
+    """Indices de una muestra estratificada por etiqueta, con asignacion proporcional"""
+    n = len(labels)
+    if n <= sample_size:
+        return np.arange(n)
+    classes, counts = np.unique(labels, return_counts=True)
+    # Al menos 2 puntos por cluster (si los tiene) para que su silhouette este definido
+    quota = np.minimum(counts, np.maximum(2, np.round(counts * sample_size / n).astype(int)))
+    order = np.argsort(labels, kind="stable")
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    picks = [
+        order[start + rng.choice(count, size=q, replace=False)]
+        for start, count, q in zip(starts, counts, quota)
+    ]
+    return np.concatenate(picks)
+
+def sampled_silhouette(X, labels, sample_size=SILHOUETTE_SAMPLE_SIZE, n_repeats=SILHOUETTE_REPEATS, seed=42):
+    """
+    Silhouette estimado sobre n_repeats muestras estratificadas de sample_size
+    puntos. Devuelve (media, desviacion, ic95_bajo, ic95_alto); el intervalo
+    es el de la media de las repeticiones, con la t de Student de n - 1
+    grados de libertad (con pocas repeticiones, 1.96 lo estrecha demasiado).
+    Con una sola repeticion el intervalo se reduce a la media.
+    """
+    rng = np.random.default_rng(seed)
+    scores = []
+    for _ in range(n_repeats):
+        idx = stratified_sample(labels, sample_size, rng)
+        if len(np.unique(labels[idx])) < 2:
+            continue
+        scores.append(silhouette_score(X[idx], labels[idx]))
+        if len(idx) == len(labels):
+            break  # la muestra es todo el dataset; repetir no aporta
+    if not scores:
+        return None
+    scores = np.array(scores)
+    mean = float(scores.mean())
+    if len(scores) == 1:
+        return mean, 0.0, mean, mean
+    std = float(scores.std(ddof=1))
+    half_width = float(student_t.ppf(0.975, len(scores) - 1)) * std / math.sqrt(len(scores))
+    return mean, std, mean - half_width, mean + half_width
+
+def evaluate_clusterer(clusterer, X, sample_size=SILHOUETTE_SAMPLE_SIZE, n_repeats=SILHOUETTE_REPEATS):
+    """
+    Metricas de calidad del clustering sobre X (ya escalado). Cada punto se
+    etiqueta con su p-micro-cluster mas cercano; Silhouette se estima por
+    muestreo y Davies-Bouldin y los pesos de micro-clusters son lineales.
+    silhouette_score vale -1 cuando no se puede calcular, como antes.
+    """
+    metrics = micro_cluster_stats(clusterer)
+    metrics["silhouette_score"] = -1
+    centers = get_p_centers(clusterer)
+    if len(centers) < 2 or len(X) == 0:
+        return metrics
+
+    labels, distances = assign_nearest(X, centers)
+    metrics["mean_distance_to_center"] = float(distances.mean())
+    if len(np.unique(labels)) < 2:
+        return metrics
+
+    metrics["davies_bouldin_score"] = float(davies_bouldin_score(X, labels))
+    silhouette = sampled_silhouette(X, labels, sample_size, n_repeats)
+    if silhouette is not None:
+        mean, std, low, high = silhouette
+        metrics.update({
+            "silhouette_score": mean,
+            "silhouette_std": std,
+            "silhouette_ci95_low": low,
+            "silhouette_ci95_high": high,
+        })
+    return metrics
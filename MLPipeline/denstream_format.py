@@ -0,0 +1,206 @@
+import json
+import struct
+import numpy as np
+
+from denstream_numpy import BatchDenStream, MicroClusterArrays
+
+# Formato .dsm: MAGIC | uint32 version | uint64 largo del header | header JSON | arrays
+# Cada array empieza alineado a ALIGNMENT bytes; el header guarda dtype, shape y offset.
+MAGIC = b"DSTM"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct("<4sIQ")
+
+PARAM_NAMES = ("decaying_factor", "beta", "mu", "epsilon", "n_samples_init", "stream_speed")
+MC_FIELDS = ("n", "linear_sum", "squared_sum", "last_edit_time", "creation_time")
+
+class CompactDenStream:
+    """
+    Modelo DenStream cargado desde un .dsm: hiperparametros y estado en
+    `params`, arrays de solo lectura en `arrays`. Con mmap=True los arrays
+    son vistas sobre el archivo mapeado en memoria, sin copias.
+    """
+
+    def __init__(self, params, arrays):
+        self.params = params
+        self.arrays = arrays
+
+    def __getattr__(self, name):
+        params = self.__dict__.get("params", {})
+        if name in params:
+            return params[name]
+        raise AttributeError(name)
+
+    @property
+    def p_centers(self):
+        return self.arrays["p_centers"]
+
+    @property
+    def p_radii(self):
+        return self.arrays["p_radii"]
+
+    @property
+    def p_weights(self):
+        return self.arrays["p_weights"]
+
+# ─────────────── Conversion river <-> arrays ───────────────
+def from_river(denstream):
+    """Convierte un river.cluster.DenStream entrenado en BatchDenStream (mismo estado)"""
+    model = BatchDenStream(**{name: getattr(denstream, name) for name in PARAM_NAMES})
+    model.timestamp = denstream.timestamp
+    model.initialized = denstream.initialized
+    model._n_samples_seen = denstream._n_samples_seen
+    if not denstream.initialized:
+        model._init_buffer = [np.array([list(item.x.values()) for item in denstream._init_buffer])]
+        model._n_buffered = len(denstream._init_buffer)
+        if model._n_buffered:
+            model.n_features = model._init_buffer[0].shape[1]
+        return model
+
+    mcs = list(denstream.p_micro_clusters.values()) + list(denstream.o_micro_clusters.values())
+    if not mcs:
+        return model
+    keys = list(mcs[0].linear_sum.keys())
+    model.n_features = len(keys)
+    for target, source in ((MicroClusterArrays(len(keys)), denstream.p_micro_clusters),
+                           (MicroClusterArrays(len(keys)), denstream.o_micro_clusters)):
+        for mc in source.values():
+            target.append(
+                mc.N,
+                [mc.linear_sum[k] for k in keys],
+                [mc.squared_sum[k] for k in keys],
+                mc.last_edit_time,
+                mc.creation_time,
+            )
+        if source is denstream.p_micro_clusters:
+            model.p_micro_clusters = target
+        else:
+            model.o_micro_clusters = target
+    return model
+
+def to_river(model):
+    """Convierte un BatchDenStream (o un CompactDenStream) en river.cluster.DenStream"""
+    from river.cluster import DenStream
+    from river.cluster.denstream import DenStreamMicroCluster
+
+    if isinstance(model, CompactDenStream):
+        model = to_batch_denstream(model)
+    denstream = DenStream(**{name: getattr(model, name) for name in PARAM_NAMES})
+    denstream.timestamp = model.timestamp
+    denstream.initialized = model.initialized
+    denstream._n_samples_seen = model._n_samples_seen
+    if not model.initialized:
+        for x in (np.concatenate(model._init_buffer) if model._init_buffer else []):
+            denstream._init_buffer.append(DenStream.BufferItem(dict(enumerate(x)), model.timestamp, False))
+        return denstream
+    del denstream._init_buffer
+
+    for source, target in ((model.p_micro_clusters, denstream.p_micro_clusters),
+                           (model.o_micro_clusters, denstream.o_micro_clusters)):
+        if source is None:
+            continue
+        for i in range(len(source)):
+            mc = DenStreamMicroCluster(
+                x=dict(enumerate(source.linear_sum[i] / source.n[i])),
+                timestamp=source.creation_time[i],
+                decaying_factor=model.decaying_factor,
+            )
+            mc.N = int(source.n[i])
+            mc.linear_sum = dict(enumerate(source.linear_sum[i].tolist()))
+            mc.squared_sum = dict(enumerate(source.squared_sum[i].tolist()))
+            mc.last_edit_time = source.last_edit_time[i]
+            target[i] = mc
+    return denstream
+
+def to_batch_denstream(compact):
+    """Copia un CompactDenStream a un BatchDenStream mutable, para seguir entrenando"""
+    model = BatchDenStream(**{name: compact.params[name] for name in PARAM_NAMES})
+    model.timestamp = compact.params["timestamp"]
+    model.initialized = compact.params["initialized"]
+    model._n_samples_seen = compact.params["n_samples_seen"]
+    model.n_features = compact.params["n_features"]
+    if model.n_features is None:
+        return model
+    if not model.initialized:
+        model._init_buffer = [np.array(compact.arrays["init_buffer"])]
+        model._n_buffered = len(model._init_buffer[0])
+    for prefix in ("p", "o"):
+        mcs = MicroClusterArrays(model.n_features, capacity=max(64, len(compact.arrays[f"{prefix}_n"])))
+        mcs.size = len(compact.arrays[f"{prefix}_n"])
+        for field in MC_FIELDS:
+            getattr(mcs, field)[:mcs.size] = compact.arrays[f"{prefix}_{field}"]
+        setattr(model, f"{prefix}_micro_clusters", mcs)
+    return model
+
+# ─────────────── Lectura / escritura ───────────────
+def _model_arrays(model):
+    n_features = model.n_features or 0
+    arrays = {}
+    for prefix, mcs in (("p", model.p_micro_clusters), ("o", model.o_micro_clusters)):
+        if mcs is None:
+            mcs = MicroClusterArrays(n_features, capacity=0)
+        for field in MC_FIELDS:
+            arrays[f"{prefix}_{field}"] = np.ascontiguousarray(getattr(mcs, field)[:len(mcs)])
+        if prefix == "p":
+            # Derivados, para puntuar sin recalcular nada al cargar
+            arrays["p_centers"] = np.ascontiguousarray(mcs.centers)
+            arrays["p_radii"] = mcs.radii()
+            arrays["p_weights"] = mcs.weights(model.timestamp, model.decaying_factor)
+    if not model.initialized and model._init_buffer:
+        arrays["init_buffer"] = np.concatenate(model._init_buffer)
+    return arrays
+
+def save_model(clusterer, path):
+    """Guarda un DenStream (river o BatchDenStream) en el formato compacto .dsm"""
+    model = clusterer if isinstance(clusterer, BatchDenStream) else from_river(clusterer)
+    arrays = _model_arrays(model)
+
+    params = {name: getattr(model, name) for name in PARAM_NAMES}
+    params.update({
+        "timestamp": int(model.timestamp),
+        "initialized": bool(model.initialized),
+        "n_samples_seen": int(model._n_samples_seen),
+        "n_features": model.n_features,
+    })
+    # Hiperparámetros que vienen de una rejilla NumPy (np.int64, np.float64...) a tipos de Python para JSON
+    params = {name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+
+    table, offset = {}, 0
+    for name, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        table[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header = json.dumps({"params": params, "arrays": table}).encode("utf-8")
+    data_start = -(-(PREAMBLE.size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    with open(path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + table[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    return path
+
+def load_model(path, mmap=True):
+    """
+    Carga un .dsm. Con mmap=True los arrays son vistas de solo lectura sobre
+    el archivo mapeado (arranque casi instantaneo, paginas bajo demanda).
+    """
+    with open(path, "rb") as f:
+        magic, version, header_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} no es un modelo DenStream compacto")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Version de formato {version} no soportada (maxima {FORMAT_VERSION})")
+        header = json.loads(f.read(header_len))
+    data_start = -(-(PREAMBLE.size + header_len) // ALIGNMENT) * ALIGNMENT
+
+    buffer = np.memmap(path, dtype=np.uint8, mode="r") if mmap else np.fromfile(path, dtype=np.uint8)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        start = data_start + spec["offset"]
+        arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+    return CompactDenStream(header["params"], arrays)
@@ -0,0 +1,366 @@
+import math
+import time
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+class MicroClusterArrays:
+    """
+    Conjunto de micro-clusters en arrays contiguos: conteo N, CF1
+    (linear_sum), CF2 (squared_sum), ultima edicion y creacion.
+    Las filas [0, size) son las activas; la capacidad crece al doble.
+    """
+
+    def __init__(self, n_features, capacity=64):
+        self.size = 0
+        self.n = np.zeros(capacity)
+        self.linear_sum = np.zeros((capacity, n_features))
+        self.squared_sum = np.zeros((capacity, n_features))
+        self.last_edit_time = np.zeros(capacity)
+        self.creation_time = np.zeros(capacity)
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self, capacity):
+        for name in ("n", "linear_sum", "squared_sum", "last_edit_time", "creation_time"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:])
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, n, linear_sum, squared_sum, last_edit_time, creation_time):
+        if self.size == len(self.n):
+            self._grow(2 * len(self.n))
+        i = self.size
+        self.n[i] = n
+        self.linear_sum[i] = linear_sum
+        self.squared_sum[i] = squared_sum
+        self.last_edit_time[i] = last_edit_time
+        self.creation_time[i] = creation_time
+        self.size += 1
+        return i
+
+    def pop(self, i):
+        """Quita la fila i y devuelve sus valores (n, ls, ss, last_edit, creation)"""
+        row = (self.n[i], self.linear_sum[i].copy(), self.squared_sum[i].copy(),
+               self.last_edit_time[i], self.creation_time[i])
+        self.keep(np.arange(self.size) != i)
+        return row
+
+    def keep(self, mask):
+        """Compacta los arrays conservando solo las filas activas con mask=True"""
+        idx = np.flatnonzero(mask)
+        k = len(idx)
+        self.n[:k] = self.n[idx]
+        self.linear_sum[:k] = self.linear_sum[idx]
+        self.squared_sum[:k] = self.squared_sum[idx]
+        self.last_edit_time[:k] = self.last_edit_time[idx]
+        self.creation_time[:k] = self.creation_time[idx]
+        self.size = k
+
+    def insert(self, idx, X, timestamps):
+        """Inserta los puntos X en los micro-clusters idx (indices repetidos permitidos)"""
+        size = self.size
+        self.n[:size] += np.bincount(idx, minlength=size)
+        for j in range(X.shape[1]):
+            self.linear_sum[:size, j] += np.bincount(idx, weights=X[:, j], minlength=size)
+            self.squared_sum[:size, j] += np.bincount(idx, weights=X[:, j] * X[:, j], minlength=size)
+        np.maximum.at(self.last_edit_time, idx, timestamps)
+
+    def insert_one(self, i, x, timestamp):
+        """Inserta un solo punto x en el micro-cluster i, sin recorrer los demas"""
+        self.n[i] += 1
+        self.linear_sum[i] += x
+        self.squared_sum[i] += x * x
+        self.last_edit_time[i] = max(self.last_edit_time[i], timestamp)
+
+    @property
+    def centers(self):
+        return self.linear_sum[:self.size] / self.n[:self.size, None]
+
+    def weights(self, timestamp, decaying_factor):
+        return self.n[:self.size] * 2 ** (-decaying_factor * (timestamp - self.last_edit_time[:self.size]))
+
+    def radii(self):
+        n = self.n[:self.size]
+        diff = (np.sqrt((self.squared_sum[:self.size] ** 2).sum(axis=1)) / n
+                - (self.linear_sum[:self.size] ** 2).sum(axis=1) / n ** 2)
+        return np.sqrt(np.maximum(diff, 0.0))
+
+    def nearest_with(self, x):
+        """Micro-cluster mas cercano a x y el radio que tendria al insertarle x"""
+        k = int(np.argmin(((self.centers - x) ** 2).sum(axis=1)))
+        n1 = self.n[k] + 1
+        ls = self.linear_sum[k] + x
+        ss = self.squared_sum[k] + x * x
+        diff = math.sqrt((ss ** 2).sum()) / n1 - (ls ** 2).sum() / n1 ** 2
+        return k, math.sqrt(max(diff, 0.0))
+
+def nearest(centers, X, chunk_size=4096):
+    """Indice y distancia del centro mas cercano para cada fila de X"""
+    idx = np.empty(len(X), dtype=np.int64)
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2; |x|^2 no cambia el argmin
+    center_norms = (centers ** 2).sum(axis=1)
+    for start in range(0, len(X), chunk_size):
+        block = X[start:start + chunk_size]
+        idx[start:start + chunk_size] = (center_norms - 2 * block @ centers.T).argmin(axis=1)
+    dist = np.sqrt(((X - centers[idx]) ** 2).sum(axis=1))
+    return idx, dist
+
+def _grouped_cumsum(values, group_start, group_len):
+    """Suma acumulada de filas reiniciada al inicio de cada grupo contiguo"""
+    total = np.cumsum(values, axis=0)
+    offset = np.vstack([np.zeros((1, values.shape[1])), total])[group_start]
+    return total - np.repeat(offset, group_len, axis=0)
+
+def connect_micro_clusters(centers, radii, weights, mu, epsilon):
+    """
+    Variante de DBSCAN de DenStream sobre p-micro-clusters: dos p-micro-clusters
+    con peso > mu se conectan si su distancia es < 2*epsilon y <= suma de
+    radios. Devuelve la etiqueta (componente conexa) de cada p-micro-cluster.
+    """
+    core = weights > mu
+    dist = np.sqrt(((centers[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2))
+    adjacency = (core[:, None] & core[None, :] & (dist < 2 * epsilon)
+                 & (dist <= radii[:, None] + radii[None, :]))
+    np.fill_diagonal(adjacency, False)
+    _, labels = connected_components(csr_matrix(adjacency), directed=False)
+    return labels
+
+class BatchDenStream:
+    """
+    DenStream (Feng et al., 2006) sobre arrays NumPy, con los mismos
+    parametros y la misma logica de micro-clusters que river.cluster.DenStream.
+
+    Los puntos se procesan por mini-lotes: el p-micro-cluster mas cercano se
+    busca de forma vectorizada con los centros al inicio del lote y cada
+    p-micro-cluster acepta sus puntos en orden mientras su radio acumulado
+    no supere epsilon. Solo los puntos restantes siguen, uno a uno, la logica
+    de river. Por eso el resultado es equivalente al de river dentro de una
+    tolerancia, no identico.
+    """
+
+    def __init__(self, decaying_factor=0.25, beta=0.75, mu=2, epsilon=0.02,
+                 n_samples_init=1000, stream_speed=100, batch_size=1000):
+        if not (0 < beta <= 1):
+            raise ValueError(f"The value of `beta` (currently {beta}) must be within the range (0,1].")
+        self.decaying_factor = decaying_factor
+        self.beta = beta
+        self.mu = mu
+        self.epsilon = epsilon
+        self.n_samples_init = n_samples_init
+        self.stream_speed = stream_speed
+        self.batch_size = batch_size
+
+        self.timestamp = -1
+        self.initialized = False
+        self.n_features = None
+        self.p_micro_clusters = None
+        self.o_micro_clusters = None
+        self.n_clusters = 0
+        self.cluster_centers = np.empty((0, 0))
+        self._init_buffer = []
+        self._n_buffered = 0
+        self._n_samples_seen = 0
+        self._time_period = math.ceil(
+            (1 / decaying_factor) * math.log((mu * beta) / (mu * beta - 1))
+        )
+
+    # ─────────────── Aprendizaje ───────────────
+    def learn_one(self, x, w=None):
+        """Compatibilidad con river: x es un dict {feature: valor}"""
+        self.learn_many(np.array([list(x.values())]))
+
+    def learn_many(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if self.n_features is None:
+            self.n_features = X.shape[1]
+            self.p_micro_clusters = MicroClusterArrays(self.n_features)
+            self.o_micro_clusters = MicroClusterArrays(self.n_features)
+
+        start = 0
+        if not self.initialized:
+            take = min(self.n_samples_init - self._n_buffered, len(X))
+            self._init_buffer.append(X[:take])
+            self._n_buffered += take
+            self._advance(take)
+            start = take
+            if self._n_buffered == self.n_samples_init:
+                self._initial_dbscan(np.concatenate(self._init_buffer))
+                self._init_buffer = []
+                self.initialized = True
+
+        while start < len(X):
+            stop = min(start + self.batch_size, len(X))
+            timestamps = self._timestamps(stop - start)
+            # Cortar el lote tras el ultimo punto de un instante de poda
+            prune_at = np.flatnonzero((timestamps > 0) & (timestamps % self._time_period == 0))
+            if len(prune_at):
+                stop = start + prune_at[-1] + 1
+                timestamps = timestamps[:stop - start]
+            self._learn_batch(X[start:stop], timestamps)
+            self._advance(stop - start)
+            if len(prune_at):
+                self._prune(self.timestamp)
+            start = stop
+        return self
+
+    def _timestamps(self, n):
+        seen = self._n_samples_seen + np.arange(1, n + 1)
+        return -1 + seen // self.stream_speed
+
+    def _advance(self, n):
+        self._n_samples_seen += n
+        self.timestamp = -1 + self._n_samples_seen // self.stream_speed
+
+    def _initial_dbscan(self, points):
+        within = ((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2) < self.epsilon ** 2
+        covered = np.zeros(len(points), dtype=bool)
+        for i in range(len(points)):
+            if covered[i]:
+                continue
+            covered[i] = True
+            neighborhood = np.flatnonzero(within[i] & ~covered)
+            if len(neighborhood) > self.mu:
+                covered[neighborhood] = True
+                members = points[np.concatenate(([i], neighborhood))]
+                self.p_micro_clusters.append(
+                    len(members), members.sum(axis=0), (members * members).sum(axis=0),
+                    self.timestamp, self.timestamp
+                )
+            else:
+                covered[i] = False
+
+    def _learn_batch(self, X, timestamps):
+        pmc = self.p_micro_clusters
+        absorbed = np.zeros(len(X), dtype=bool)
+        if len(pmc):
+            idx, _ = nearest(pmc.centers, X)
+            # Radio acumulado de cada p-micro-cluster al ir insertando sus puntos
+            # del lote en orden; se aceptan los puntos hasta la primera violacion
+            order = np.argsort(idx, kind='stable')
+            sorted_idx = idx[order]
+            group_start = np.r_[0, np.flatnonzero(np.diff(sorted_idx)) + 1]
+            group_len = np.diff(np.r_[group_start, len(order)])
+            rank = np.arange(len(order)) - np.repeat(group_start, group_len)
+            ls = _grouped_cumsum(X[order], group_start, group_len)
+            ss = _grouped_cumsum(X[order] ** 2, group_start, group_len)
+            n1 = pmc.n[sorted_idx] + rank + 1
+            ls += pmc.linear_sum[sorted_idx]
+            ss += pmc.squared_sum[sorted_idx]
+            diff = np.sqrt((ss ** 2).sum(axis=1)) / n1 - (ls ** 2).sum(axis=1) / n1 ** 2
+            ok = np.sqrt(np.maximum(diff, 0.0)) <= self.epsilon
+            # Prefijo aceptado: ninguna violacion previa dentro del grupo
+            violations = np.cumsum(~ok) - np.repeat(np.r_[0, np.cumsum(~ok)][group_start], group_len)
+            absorbed[order] = violations == 0
+            if absorbed.any():
+                pmc.insert(idx[absorbed], X[absorbed], timestamps[absorbed])
+        # El resto sigue la logica secuencial de river, punto a punto
+        for j in np.flatnonzero(~absorbed):
+            self._merge(X[j], timestamps[j])
+
+    def _merge(self, x, timestamp):
+        pmc = self.p_micro_clusters
+        if len(pmc):
+            k, radius = pmc.nearest_with(x)
+            if radius <= self.epsilon:
+                pmc.insert_one(k, x, timestamp)
+                return
+        self._merge_outlier(x, timestamp)
+
+    def _merge_outlier(self, x, timestamp):
+        omc = self.o_micro_clusters
+        if len(omc):
+            k, radius = omc.nearest_with(x)
+            if radius <= self.epsilon:
+                omc.insert_one(k, x, timestamp)
+                weight = omc.n[k] * 2 ** (-self.decaying_factor * (timestamp - omc.last_edit_time[k]))
+                if weight > self.mu * self.beta:
+                    # Crecio hasta ser un p-micro-cluster
+                    self.p_micro_clusters.append(*omc.pop(k))
+                return
+        omc.append(1, x, x * x, timestamp, timestamp)
+
+    def _prune(self, timestamp):
+        pmc, omc = self.p_micro_clusters, self.o_micro_clusters
+        pmc.keep(pmc.weights(timestamp, self.decaying_factor) >= self.mu * self.beta)
+        xi = (
+            2 ** (-self.decaying_factor * (timestamp - omc.creation_time[:omc.size] + self._time_period)) - 1
+        ) / (2 ** (-self.decaying_factor * self._time_period) - 1)
+        omc.keep(omc.weights(timestamp, self.decaying_factor) >= xi)
+
+    # ─────────────── Clustering ───────────────
+    @property
+    def p_centers(self):
+        if self.p_micro_clusters is None:
+            return np.empty((0, 0))
+        return self.p_micro_clusters.centers
+
+    def generate_clusters(self):
+        """Agrupa los p-micro-clusters en clusters finales; devuelve la etiqueta de cada uno"""
+        pmc = self.p_micro_clusters
+        if pmc is None or len(pmc) == 0:
+            self.n_clusters = 0
+            self.cluster_centers = np.empty((0, self.n_features or 0))
+            return np.empty(0, dtype=np.int64)
+
+        labels = connect_micro_clusters(
+            pmc.centers, pmc.radii(), pmc.weights(self.timestamp, self.decaying_factor),
+            self.mu, self.epsilon
+        )
+        self.n_clusters = labels.max() + 1
+
+        n = np.bincount(labels, weights=pmc.n[:pmc.size], minlength=self.n_clusters)
+        linear_sum = np.zeros((self.n_clusters, self.n_features))
+        np.add.at(linear_sum, labels, pmc.linear_sum[:pmc.size])
+        self.cluster_centers = linear_sum / n[:, None]
+        return labels
+
+    def predict_many(self, X):
+        if not self.initialized:
+            return np.zeros(len(X), dtype=np.int64)
+        self.generate_clusters()
+        if self.n_clusters == 0:
+            return np.zeros(len(X), dtype=np.int64)
+        idx, _ = nearest(self.cluster_centers, np.asarray(X, dtype=np.float64))
+        return idx
+
+    def predict_one(self, x, w=None):
+        return int(self.predict_many(np.array([list(x.values())]))[0])
+
+def benchmark_denstream(n_points=100_000, seed=42, **params):
+    """Compara muestras/s y centros de p-micro-clusters contra river.cluster.DenStream"""
+    import river
+    from river.cluster import DenStream
+
+    params = params or {'epsilon': 1.0, 'beta': 0.2, 'mu': 20, 'decaying_factor': 0.0001}
+    rng = np.random.default_rng(seed)
+    means = rng.uniform(-3, 3, size=(8, 2))
+    X = means[rng.integers(0, len(means), n_points)] + rng.normal(scale=0.4, size=(n_points, 2))
+
+    river_model = DenStream(**params)
+    start_time = time.time()
+    for row in X:
+        river_model.learn_one({0: row[0], 1: row[1]})
+    river_sec = time.time() - start_time
+    river_centers = np.array([
+        list(mc.calc_center(river_model.timestamp).values())
+        for mc in river_model.p_micro_clusters.values()
+    ])
+
+    model = BatchDenStream(**params)
+    start_time = time.time()
+    model.learn_many(X)
+    numpy_sec = time.time() - start_time
+
+    _, gap = nearest(river_centers, model.p_centers)
+    print(f"Puntos: {n_points}")
+    print(f"river {river.__version__}: {n_points / river_sec:,.0f} muestras/s, {len(river_centers)} p-micro-clusters")
+    print(f"NumPy: {n_points / numpy_sec:,.0f} muestras/s, {len(model.p_centers)} p-micro-clusters "
+          f"({river_sec / numpy_sec:.1f}x)")
+    print(f"Distancia al centro river mas cercano: mediana {np.median(gap):.4f}, max {gap.max():.4f}")
+    return river_sec, numpy_sec, gap
+
+if __name__ == "__main__":
+    benchmark_denstream()
@@ -0,0 +1,173 @@
+import json
+import time
+import pickle
+import logging
+import threading
+import numpy as np
+import boto3
+from scipy.spatial import cKDTree
+
+from projection import project_lonlat_km
+from running_scaler import SCALER_NAME, scaler_for_day
+from denstream_numpy import connect_micro_clusters
+from denstream_evaluation import get_p_arrays
+from denstream_format import load_model
+from model_registry import latest_model_object, fetch_model, REGION_NAME, BUCKET_NAME
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BOOTSTRAP_SERVERS = '52.205.209.139'
+INPUT_TOPIC = 'flight_stream'
+OUTPUT_TOPIC = 'flight_clusters'
+BATCH_SIZE = 5_000
+POLL_INTERVAL_SEC = 300
+
+class ScoringModel:
+    """
+    Version inmutable del modelo lista para puntuar: KD-tree sobre los
+    centros de los p-micro-clusters, etiqueta de cluster final de cada uno
+    y el scaler con el que se escalaron sus datos (lon/lat -> UTM km -> escalado).
+    Un punto es outlier si su p-micro-cluster mas cercano esta a mas de
+    epsilon; en ese caso su cluster_id es -1.
+    """
+
+    def __init__(self, clusterer, scaler, version=None):
+        centers, radii, weights = get_p_arrays(clusterer)
+        if len(centers) == 0:
+            raise ValueError("El modelo no tiene p-micro-clusters; no se puede puntuar")
+        self.version = version
+        self.epsilon = clusterer.epsilon
+        self.tree = cKDTree(centers)
+        self.p_labels = connect_micro_clusters(centers, radii, weights, clusterer.mu, clusterer.epsilon)
+
+        # preprocessing_part_2 escala 4 columnas; aqui solo se necesitan x_km, y_km
+        columns = [scaler.feature_names.index(c) for c in ('x_km', 'y_km')]
+        self.mean = scaler.mean_[columns]
+        self.scale = scaler.scale_[columns]
+
+    def transform(self, longitude, latitude):
+        x_km, y_km = project_lonlat_km(longitude, latitude, n_workers=1)
+        X = np.column_stack([x_km, y_km])
+        return (X - self.mean) / self.scale
+
+    def score(self, longitude, latitude):
+        """(cluster_id, is_outlier) para arrays de lon/lat en grados"""
+        distances, idx = self.tree.query(self.transform(longitude, latitude))
+        is_outlier = distances > self.epsilon
+        cluster_id = np.where(is_outlier, -1, self.p_labels[idx])
+        return cluster_id, is_outlier
+
+def build_scoring_model(clusterer, day, version=None):
+    return ScoringModel(clusterer, scaler_for_day(SCALER_NAME, day), version=version)
+
+class ModelWatcher:
+    """
+    Mantiene `model` apuntando a la ultima version publicada en S3. Un hilo
+    de fondo consulta S3 cada poll_interval segundos y, si hay una version
+    nueva, la construye completa antes de reemplazar la referencia, asi que
+    los lectores nunca ven un modelo a medio cargar.
+    """
+
+    def __init__(self, poll_interval=POLL_INTERVAL_SEC, bucket=BUCKET_NAME):
+        self.poll_interval = poll_interval
+        self.bucket = bucket
+        self.s3_client = boto3.client('s3', region_name=REGION_NAME)
+        self.model = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+
+    def refresh(self):
+        obj = latest_model_object(self.s3_client, self.bucket)
+        if obj is None or (self.model is not None and obj['version'] <= self.model.version):
+            return False
+        model_path = fetch_model(self.s3_client, obj, self.bucket)
+        if obj['compact']:
+            # Arrays mapeados en memoria: no hay deserializacion al arrancar
+            clusterer = load_model(model_path, mmap=True)
+        else:
+            with open(model_path, "rb") as f:
+                clusterer = pickle.load(f)
+        self.model = build_scoring_model(clusterer, obj['day'], version=obj['version'])
+        logger.info(f"Modelo v{obj['version']} cargado ({self.model.tree.n} p-micro-clusters)")
+        return True
+
+    def start(self):
+        self.refresh()
+        if self.model is None:
+            raise RuntimeError("No hay ningun modelo DenStream publicado en S3")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Se sigue sirviendo la version anterior
+                logger.error(f"Error recargando el modelo: {e}")
+
+def score_records(model, records):
+    """Puntua una lista de registros de vuelo (dicts del producer de Kafka)"""
+    records = [r for r in records if r.get('longitude') is not None and r.get('latitude') is not None]
+    if not records:
+        return []
+    longitude = np.fromiter((r['longitude'] for r in records), dtype=np.float64, count=len(records))
+    latitude = np.fromiter((r['latitude'] for r in records), dtype=np.float64, count=len(records))
+    cluster_id, is_outlier = model.score(longitude, latitude)
+    return [
+        {
+            "icao24": r.get('icao24'),
+            "timestamp_ingest": r.get('timestamp_ingest'),
+            "cluster_id": int(c),
+            "is_outlier": bool(o),
+            "model_version": model.version,
+        }
+        for r, c, o in zip(records, cluster_id, is_outlier)
+    ]
+
+def run(bootstrap_servers=BOOTSTRAP_SERVERS, input_topic=INPUT_TOPIC, output_topic=OUTPUT_TOPIC,
+        batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL_SEC):
+    from confluent_kafka import Consumer, Producer
+
+    watcher = ModelWatcher(poll_interval).start()
+    consumer = Consumer({
+        'bootstrap.servers': bootstrap_servers,
+        'group.id': 'denstream-scoring',
+        'auto.offset.reset': 'latest'
+    })
+    producer = Producer({'bootstrap.servers': bootstrap_servers})
+    consumer.subscribe([input_topic])
+    logger.info(f"Servicio de scoring activo: {input_topic} -> {output_topic}")
+
+    try:
+        while True:
+            messages = consumer.consume(num_messages=batch_size, timeout=1.0)
+            records = [json.loads(m.value().decode('utf-8')) for m in messages if not m.error()]
+            for result in score_records(watcher.model, records):
+                producer.produce(output_topic, json.dumps(result).encode('utf-8'))
+            producer.poll(0)
+    except KeyboardInterrupt:
+        logger.info("Interrupción por usuario, cerrando servicio...")
+    finally:
+        watcher.stop()
+        producer.flush()
+        consumer.close()
+
+def benchmark_scoring(model, n_points=1_000_000, batch_size=BATCH_SIZE, seed=42):
+    """Puntos/s de ScoringModel.score en un solo nucleo, por micro-lotes"""
+    rng = np.random.default_rng(seed)
+    longitude = rng.uniform(-90.0, -30.0, n_points)
+    latitude = rng.uniform(-60.0, 15.0, n_points)
+    start_time = time.time()
+    for start in range(0, n_points, batch_size):
+        model.score(longitude[start:start + batch_size], latitude[start:start + batch_size])
+    elapsed = time.time() - start_time
+    print(f"Scoring: {n_points / elapsed:,.0f} puntos/s (lotes de {batch_size})")
+    return n_points / elapsed
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,130 @@
+import os
+import time
+import logging
+import argparse
+import itertools
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import mlflow
+
+import buffered_mlflow
+from stream_reader import iter_chunks, count_rows
+from denstream_evaluation import evaluate_clusterer
+from model_DENStream import (FEATURES, EVAL_SAMPLE_SIZE, build_clusterer, dataset_path, log_training_metrics,
+                             setup_mlflow)
+
+logger = logging.getLogger(__name__)
+
+# Rejilla por defecto alrededor de la config de produccion de model_DENStream
+DEFAULT_GRID = {
+    'epsilon': [0.5, 1.0, 2.0],
+    'beta': [0.2, 0.5],
+    'mu': [10, 20, 40],
+    'decaying_factor': [0.0001, 0.001],
+}
+
+def grid_configs(grid=DEFAULT_GRID):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+# ─────────────── Dataset en memoria compartida ───────────────
+def load_shared_dataset(path):
+    """
+    Lee el dataset (ya escalado por preprocessing_part_2, igual que el que
+    usa model_DENStream) una sola vez y lo deja en un bloque de memoria
+    compartida (n, len(FEATURES)) float64. Devuelve (shm, shape); los
+    workers lo abren por nombre, sin copiarlo.
+    """
+    shape = (count_rows(path), len(FEATURES))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, shape[0] * shape[1] * 8))
+    X = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    start = 0
+    for chunk in iter_chunks(path, FEATURES):
+        X[start:start + len(chunk)] = chunk.to_numpy(dtype=np.float64)
+        start += len(chunk)
+    return shm, shape
+
+_worker = {}
+
+def _attach(shm_name, shape):
+    """Initializer del pool: cada worker mapea el bloque compartido una vez"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker['shm'] = shm
+    _worker['X'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+def _train_config(config, engine, eval_sample_size, seed):
+    X = _worker['X']
+    clusterer = build_clusterer(config, engine)
+    start_time = time.time()
+    if engine == "river":
+        for row in X:
+            clusterer.learn_one({0: row[0], 1: row[1]})
+    else:
+        clusterer.learn_many(X)
+    train_duration_sec = time.time() - start_time
+
+    # Misma muestra de evaluacion para todas las configs, para que sean comparables
+    rng = np.random.default_rng(seed)
+    idx = rng.choice(len(X), size=min(eval_sample_size, len(X)), replace=False)
+    start_time = time.time()
+    metrics = evaluate_clusterer(clusterer, X[np.sort(idx)])
+    metrics["eval_duration_sec"] = time.time() - start_time
+    return config, train_duration_sec, len(X), metrics
+
+# ─────────────── Barrido ───────────────
+def denstream_sweep(configs=None, engine="numpy", n_workers=None, eval_sample_size=EVAL_SAMPLE_SIZE, seed=42):
+    """
+    Entrena cada config en un pool de procesos sobre el mismo dataset
+    compartido. Cada config queda como run hijo de MLflow (params, duracion,
+    throughput y metricas de calidad); el run padre registra la mejor por
+    silhouette. Devuelve la lista de resultados ordenada de mejor a peor.
+    """
+    configs = configs or grid_configs()
+    n_workers = n_workers or os.cpu_count()
+    path = dataset_path()
+    today_str = datetime.now().strftime("%Y-%m-%d")
+
+    logger.info(f"Cargando {path} en memoria compartida...")
+    shm, shape = load_shared_dataset(path)
+    results = []
+    try:
+        # Solo el proceso padre habla con MLflow; los workers solo entrenan
+        setup_mlflow()
+        with mlflow.start_run(run_name=f"denstream_sweep_{today_str}"):
+            buffered_mlflow.log_params({"engine": engine, "n_configs": len(configs), "n_workers": n_workers, "n_samples": shape[0]})
+            sweep_start = time.time()
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_attach, initargs=(shm.name, shape)) as pool:
+                futures = [pool.submit(_train_config, config, engine, eval_sample_size, seed) for config in configs]
+                for future in as_completed(futures):
+                    config, train_duration_sec, n_samples, metrics = future.result()
+                    run_name = "sweep_" + "_".join(f"{k}={v}" for k, v in config.items())
+                    with mlflow.start_run(run_name=run_name, nested=True):
+                        buffered_mlflow.log_params(config)
+                        buffered_mlflow.log_param("engine", engine)
+                        log_training_metrics(train_duration_sec, n_samples)
+                        buffered_mlflow.log_metrics(metrics)
+                    logger.info(f"{config}: silhouette={metrics['silhouette_score']:.4f}, "
+                                f"{n_samples / train_duration_sec:,.0f} muestras/s")
+                    results.append({"config": config, "train_duration_sec": train_duration_sec, **metrics})
+
+            results.sort(key=lambda r: r["silhouette_score"], reverse=True)
+            buffered_mlflow.log_metric("sweep_duration_sec", time.time() - sweep_start)
+            if results:
+                buffered_mlflow.log_params({f"best_{k}": v for k, v in results[0]["config"].items()})
+                buffered_mlflow.log_metric("best_silhouette_score", results[0]["silhouette_score"])
+            buffered_mlflow.flush()
+    finally:
+        shm.close()
+        shm.unlink()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Barrido de hiperparametros de DenStream en paralelo")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos del pool (por defecto, todos los nucleos)")
+    parser.add_argument("--engine", choices=["numpy", "river"], default="numpy")
+    args = parser.parse_args()
+    for result in denstream_sweep(engine=args.engine, n_workers=args.workers)[:5]:
+        print(result["config"], result["silhouette_score"])
@@ -1,4 +1,3 @@
-import numpy as np
 from river.cluster import DenStream
 import mlflow
 import pickle
@@ -7,15 +6,25 @@ import logging
 import requests
 import base64
 import pandas as pd
-from sklearn.metrics import silhouette_score
-from sklearn.preprocessing import StandardScaler
 import time
 from datetime import datetime
 
+import buffered_mlflow
+from running_scaler import SCALER_NAME, scaler_for_day
+from stream_reader import iter_chunks, count_rows, prefetch, ReservoirSample, CHUNK_SIZE
+from denstream_numpy import BatchDenStream
+from denstream_evaluation import evaluate_clusterer
+from model_registry import load_latest_model, gap_days, advance_time
+from denstream_format import save_model
+
 # ─────────────── Config MLflow ───────────────
-mlflow.set_tracking_uri("http://127.0.0.1:8082")
+MLFLOW_TRACKING_URI = "http://127.0.0.1:8082"
 experiment_name = "DenStream_Experiment"
-mlflow.set_experiment(experiment_name)
+
+def setup_mlflow():
+    """Apunta MLflow al servidor y al experimento; no se hace al importar el modulo"""
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    mlflow.set_experiment(experiment_name)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -60,59 +69,127 @@ def get_next_version_number():
     return count + 1
 
 # ─────────────── Entrenamiento ───────────────
-def train_denstream_model(df, config):
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(df[['x_km', 'y_km']])
+FEATURES = ['x_km', 'y_km']
+EVAL_SAMPLE_SIZE = 200_000
 
-    clusterer = DenStream(
+def build_clusterer(config, engine="numpy"):
+    """engine='numpy' usa BatchDenStream (mini-lotes vectorizados); 'river' el DenStream original"""
+    params = dict(
         epsilon=config['epsilon'],
         beta=config['beta'],
         mu=config['mu'],
         decaying_factor=config['decaying_factor']
     )
+    if engine == "river":
+        return DenStream(**params)
+    return BatchDenStream(**params)
 
-    start_time = time.time()
-
-    for row in X_scaled:
-        clusterer.learn_one({0: row[0], 1: row[1]})
+def learn_chunks(clusterer, chunks):
+    """Entrena el clusterer con un iterable de bloques ya escalados; devuelve el nº de muestras"""
+    n_samples = 0
+    for X in chunks:
+        if isinstance(clusterer, BatchDenStream):
+            clusterer.learn_many(X)
+        else:
+            for row in X:
+                clusterer.learn_one({0: row[0], 1: row[1]})
+        n_samples += len(X)
+    return n_samples
 
-    end_time = time.time()
-    train_duration_sec = end_time - start_time
-    n_samples = len(X_scaled)
+def log_training_metrics(train_duration_sec, n_samples):
     avg_samples_per_sec = n_samples / train_duration_sec if train_duration_sec > 0 else 0
 
-    mlflow.log_metric("train_duration_sec", train_duration_sec)
-    mlflow.log_metric("n_samples", n_samples)
-    mlflow.log_metric("avg_samples_per_sec", avg_samples_per_sec)
-
-    centers = [
-        np.array(list(mc.calc_center(clusterer.timestamp).values()))
-        for mc in clusterer.p_micro_clusters.values()
-    ]
-
-    if len(centers) > 1:
-        labels = [
-            int(np.argmin([np.linalg.norm(pt - c) for c in centers]))
-            for pt in X_scaled
-        ]
-        if len(set(labels)) > 1:
-            silhouette = silhouette_score(X_scaled, labels)
-            logger.info(f"Silhouette score: {silhouette:.4f}")
-            mlflow.log_metric("silhouette_score", silhouette)
-        else:
-            logger.info("No hay variedad de etiquetas para Silhouette")
-            mlflow.log_metric("silhouette_score", -1)
+    buffered_mlflow.log_metric("train_duration_sec", train_duration_sec)
+    buffered_mlflow.log_metric("n_samples", n_samples)
+    buffered_mlflow.log_metric("avg_samples_per_sec", avg_samples_per_sec)
+
+def log_evaluation(clusterer, X_scaled):
+    start_time = time.time()
+    metrics = evaluate_clusterer(clusterer, X_scaled)
+    metrics["eval_duration_sec"] = time.time() - start_time
+
+    if metrics["silhouette_score"] == -1:
+        logger.info("Menos de 2 clusters con puntos asignados; no se calcula Silhouette")
     else:
-        logger.info("Menos de 2 micro-clusters; no se calcula Silhouette")
-        mlflow.log_metric("silhouette_score", -1)
+        logger.info(f"Silhouette score: {metrics['silhouette_score']:.4f} "
+                    f"(IC95 {metrics['silhouette_ci95_low']:.4f} - {metrics['silhouette_ci95_high']:.4f})")
+    buffered_mlflow.log_metrics(metrics)
+
+def prepare_clusterer(config, engine, base_clusterer=None, gap=0, n_new=0):
+    """
+    Clusterer nuevo o, en warm start, el modelo anterior con el decaimiento
+    del hueco ya aplicado: cada dia sin entrenar cuenta como un dia de
+    n_new puntos (el volumen de hoy) en unidades de tiempo del stream.
+    """
+    if base_clusterer is None:
+        return build_clusterer(config, engine)
+    advance_time(base_clusterer, gap * n_new / base_clusterer.stream_speed)
+    return base_clusterer
+
+def train_denstream_model(df, config, day=None, engine="numpy", base_clusterer=None, gap=0):
+    # preprocessing_part_2 ya escalo las features con el scaler compartido;
+    # se devuelve la version que uso ese dia, no se ajusta otro encima
+    scaler = scaler_for_day(SCALER_NAME, day or datetime.now().strftime("%Y-%m-%d"))
+    X_scaled = df[FEATURES].to_numpy(dtype=float)
+
+    clusterer = prepare_clusterer(config, engine, base_clusterer, gap, len(X_scaled))
+
+    start_time = time.time()
+    n_samples = learn_chunks(clusterer, [X_scaled])
+    log_training_metrics(time.time() - start_time, n_samples)
+
+    log_evaluation(clusterer, X_scaled)
+
+    return clusterer, scaler
+
+def train_denstream_stream(path, config, day=None, engine="numpy", base_clusterer=None, gap=0,
+                           chunk_size=CHUNK_SIZE, eval_sample_size=EVAL_SAMPLE_SIZE):
+    """
+    Igual que train_denstream_model, pero leyendo `path` (Parquet o CSV) por
+    bloques mientras un hilo de fondo prelee el siguiente. La memoria no
+    depende del tamaño del dataset; la evaluacion se hace sobre una muestra
+    uniforme de eval_sample_size puntos.
+    """
+    scaler = scaler_for_day(SCALER_NAME, day or datetime.now().strftime("%Y-%m-%d"))
+
+    clusterer = prepare_clusterer(config, engine, base_clusterer, gap, count_rows(path))
+    sample = ReservoirSample(eval_sample_size)
+
+    def scaled_chunks():
+        for chunk in prefetch(iter_chunks(path, FEATURES, chunk_size)):
+            X = chunk.to_numpy(dtype=float)
+            sample.add(X)
+            yield X
+
+    start_time = time.time()
+    n_samples = learn_chunks(clusterer, scaled_chunks())
+    log_training_metrics(time.time() - start_time, n_samples)
+
+    log_evaluation(clusterer, sample.values)
 
     return clusterer, scaler
 
 # ─────────────── Pipeline principal ───────────────
-def model_DENStream():
-    logger.info("Cargando dataset...")
-    df = pd.read_csv("/home/ubuntu/datasets/temp/preprocessing_part_2.csv")
+DATASET_PARQUET = "/home/ubuntu/datasets/temp/preprocessing_part_2.parquet"
+DATASET_CSV = "/home/ubuntu/datasets/temp/preprocessing_part_2.csv"
+
+def dataset_path():
+    """
+    El mas reciente (por mtime) entre el Parquet del preprocesamiento y el
+    CSV: si se vuelve a generar solo el CSV, no se entrena con un Parquet viejo.
+    """
+    existing = [p for p in (DATASET_PARQUET, DATASET_CSV) if os.path.exists(p)]
+    if not existing:
+        return DATASET_CSV
+    return max(existing, key=os.path.getmtime)
 
+def load_dataset():
+    path = dataset_path()
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+def model_DENStream(engine="numpy", streaming=True, warm_start=False):
     config = {
         'epsilon': 1.0,
         'beta': 0.2,
@@ -120,16 +197,41 @@ def model_DENStream():
         'decaying_factor': 0.0001
     }
 
+    setup_mlflow()
     version_number = get_next_version_number()
     today_str = datetime.now().strftime("%Y-%m-%d")
     run_name = f"denstream_v{version_number}_{today_str}"
 
+    base_clusterer, base_info, gap = None, None, 0
+    if warm_start:
+        base_clusterer, base_info = load_latest_model(before=today_str)
+        if base_clusterer is None:
+            logger.info("No hay un modelo previo en S3; se entrena desde cero")
+        else:
+            gap = gap_days(base_info['day'], today_str)
+            engine = "numpy" if isinstance(base_clusterer, BatchDenStream) else "river"
+            logger.info(f"Warm start desde {base_info['key']} ({gap} dias sin entrenar)")
+
     mlflow.start_run(run_name=run_name)
 
     logger.info(f"Iniciando entrenamiento con config: {config}")
-    mlflow.log_params(config)
+    buffered_mlflow.log_params(config)
+    buffered_mlflow.log_param("engine", engine)
+    buffered_mlflow.log_param("streaming", streaming)
+    buffered_mlflow.log_param("warm_start", base_clusterer is not None)
+    if base_info is not None:
+        buffered_mlflow.log_param("warm_start_from", base_info['key'])
+        buffered_mlflow.log_param("gap_days", gap)
 
-    clusterer, scaler = train_denstream_model(df, config)
+    if streaming:
+        logger.info(f"Entrenando por bloques desde {dataset_path()}")
+        clusterer, scaler = train_denstream_stream(dataset_path(), config, day=today_str, engine=engine,
+                                                   base_clusterer=base_clusterer, gap=gap)
+    else:
+        logger.info("Cargando dataset...")
+        df = load_dataset()
+        clusterer, scaler = train_denstream_model(df, config, day=today_str, engine=engine,
+                                                  base_clusterer=base_clusterer, gap=gap)
 
     os.makedirs("/home/ubuntu/model/temp", exist_ok=True)
     scaler_path = "/home/ubuntu/model/temp/scaler.pkl"
@@ -142,13 +244,19 @@ def model_DENStream():
         pickle.dump(clusterer, f)
     mlflow.log_artifact(model_path)
 
+    # A S3 se sube el formato compacto (.dsm): arrays + JSON, sin pickle
+    compact_path = save_model(clusterer, "/home/ubuntu/model/temp/DENStream.dsm")
+    mlflow.log_artifact(compact_path)
+    buffered_mlflow.log_metric("model_size_bytes", os.path.getsize(compact_path))
+
     bucket_name = "s3-project-little-data"
-    s3_key = f"denstream/{run_name}.pkl"   # Nombre en S3 con versión y fecha
-    response = invoke_lambda_upload(model_path, bucket_name, s3_key)
+    s3_key = f"denstream/{run_name}.dsm"   # Nombre en S3 con versión y fecha
+    response = invoke_lambda_upload(compact_path, bucket_name, s3_key)
 
     logger.info(f"Respuesta Lambda: {response}")
 
     logger.info("Entrenamiento y log de métricas finalizado.")
+    buffered_mlflow.flush()
     mlflow.end_run()
 
 if __name__ == "__main__":
@@ -0,0 +1,109 @@
+import os
+import re
+import json
+import pickle
+import hashlib
+import logging
+from datetime import datetime
+import boto3
+
+from denstream_format import load_model, to_batch_denstream
+
+logger = logging.getLogger(__name__)
+
+REGION_NAME = 'us-east-1'
+BUCKET_NAME = "s3-project-little-data"
+MODEL_PREFIX = "denstream/"
+CACHE_DIR = "/home/ubuntu/model/cache"
+
+# .dsm es el formato compacto (denstream_format); .pkl, el pickle de versiones anteriores
+MODEL_KEY_PATTERN = re.compile(r'^denstream/denstream_v(\d+)_(\d{4}-\d{2}-\d{2})\.(dsm|pkl)$')
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def latest_model_object(s3_client, bucket=BUCKET_NAME, before=None):
+    """
+    Objeto S3 (key, etag, version, dia) con el numero de version mas alto, o
+    None. Con before='YYYY-MM-DD' solo se consideran modelos de dias
+    anteriores, como load_scaler: reejecutar un dia no parte del modelo que
+    ya incluye su lote.
+    """
+    latest = None
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=MODEL_PREFIX):
+        for obj in page.get('Contents', []):
+            match = MODEL_KEY_PATTERN.match(obj['Key'])
+            if not match or (before is not None and match.group(2) >= before):
+                continue
+            version, compact = int(match.group(1)), match.group(3) == 'dsm'
+            # A igual version se prefiere el formato compacto
+            if latest is None or (version, compact) > (latest['version'], latest['compact']):
+                latest = {
+                    'key': obj['Key'],
+                    'etag': obj['ETag'].strip('"'),
+                    'version': version,
+                    'day': match.group(2),
+                    'compact': compact,
+                }
+    return latest
+
+def fetch_model(s3_client, obj, bucket=BUCKET_NAME, cache_dir=CACHE_DIR):
+    """
+    Devuelve la ruta local del modelo. Si ya esta en cache con el mismo ETag
+    y su SHA-256 coincide con el registrado, no se vuelve a descargar.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.basename(obj['key'])
+    model_path = os.path.join(cache_dir, name)
+    meta_path = model_path + ".json"
+
+    if os.path.exists(model_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('etag') == obj['etag'] and meta.get('sha256') == file_sha256(model_path):
+            logger.info(f"Modelo {name} tomado de la cache local")
+            return model_path
+        logger.info(f"Cache de {name} desactualizada o corrupta; se descarga de nuevo")
+
+    s3_client.download_file(bucket, obj['key'], model_path)
+    with open(meta_path, "w") as f:
+        json.dump({'key': obj['key'], 'etag': obj['etag'], 'sha256': file_sha256(model_path)}, f, indent=2)
+    logger.info(f"Modelo {name} descargado de S3")
+    return model_path
+
+def load_latest_model(bucket=BUCKET_NAME, before=None):
+    """(clusterer, info) del ultimo modelo publicado en S3 (anterior a before), o (None, None) si no hay ninguno"""
+    s3_client = boto3.client('s3', region_name=REGION_NAME)
+    obj = latest_model_object(s3_client, bucket, before)
+    if obj is None:
+        return None, None
+    return load_model_file(fetch_model(s3_client, obj, bucket)), obj
+
+def load_model_file(model_path):
+    """Clusterer entrenable desde un .dsm (BatchDenStream) o un .pkl (el objeto guardado)"""
+    if model_path.endswith(".dsm"):
+        return to_batch_denstream(load_model(model_path))
+    with open(model_path, "rb") as f:
+        return pickle.load(f)
+
+def gap_days(model_day, today):
+    """Dias sin entrenar entre el modelo (YYYY-MM-DD) y hoy; 0 si el modelo es de ayer"""
+    delta = datetime.strptime(today, "%Y-%m-%d") - datetime.strptime(model_day, "%Y-%m-%d")
+    return max(delta.days - 1, 0)
+
+def advance_time(clusterer, units):
+    """
+    Avanza el reloj del clusterer `units` unidades de tiempo sin puntos, de
+    modo que el peso de los micro-clusters decae 2^(-lambda * units) como si
+    el hueco hubiera transcurrido. Vale para river y para BatchDenStream.
+    """
+    units = int(round(units))
+    if units <= 0:
+        return
+    clusterer._n_samples_seen += units * clusterer.stream_speed
+    clusterer.timestamp += units
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import boto3
+import pandas as pd
+
+TEMP_DIR = os.path.expanduser('~/datasets/temp')
+MANIFEST_PATH = os.path.join(TEMP_DIR, 'pipeline_manifest.json')
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ─────────────── Huellas ───────────────
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class FileHasher:
+    """SHA-256 de archivos, recordado por (ruta, tamaño, mtime) para no releer los que no cambian"""
+
+    def __init__(self, known=None):
+        self.known = dict(known or {})
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        stat = os.stat(path)
+        stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+        with self._lock:
+            cached = self.known.get(path)
+        if cached and cached['stamp'] == stamp:
+            return cached['sha256']
+        sha256 = _sha256_file(path)
+        with self._lock:
+            self.known[path] = {'stamp': stamp, 'sha256': sha256}
+        return sha256
+
+def code_fingerprint(modules):
+    """Hash del codigo fuente de los modulos de MLPipeline que usa una etapa"""
+    digest = hashlib.sha256()
+    for module in sorted(modules):
+        with open(os.path.join(MODULE_DIR, f"{module}.py"), "rb") as f:
+            digest.update(module.encode() + b"\0" + f.read())
+    return digest.hexdigest()
+
+def daily_json_fingerprint():
+    """Bucket/key/ETag del JSON diario en S3, sin descargarlo"""
+    from csv_compiler import get_daily_object, REGION_NAME
+
+    daily_object = get_daily_object()
+    if daily_object is None:
+        raise RuntimeError("La Lambda no devolvio el JSON diario")
+    bucket, key = daily_object
+    head = boto3.client('s3', region_name=REGION_NAME).head_object(Bucket=bucket, Key=key)
+    return {'bucket': bucket, 'key': key, 'etag': head['ETag'].strip('"')}
+
+# ─────────────── Etapas ───────────────
+class Stage:
+    """
+    Una etapa del pipeline. La huella combina el codigo de `code`, `params`,
+    las huellas de las etapas de `deps`, el contenido de los archivos de
+    `inputs` y lo que devuelva `source()` (datos externos, p.ej. S3).
+    Si coincide con la registrada y las salidas siguen intactas, se salta.
+    Con `source`, la etapa recibe como `source=` lo mismo que entro en la
+    huella, para que procese exactamente los datos que se huellaron.
+    """
+
+    def __init__(self, name, func, outputs, code, deps=(), inputs=(), params=None, source=None):
+        self.name = name
+        self.func = func
+        self.outputs = list(outputs)
+        self.code = list(code)
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.source = source
+        self.source_value = None
+
+    def fingerprint(self, dep_fingerprints, hasher):
+        self.source_value = self.source() if self.source else None
+        payload = {
+            'code': code_fingerprint(self.code),
+            'params': self.params,
+            'deps': {d: dep_fingerprints[d] for d in self.deps},
+            'inputs': {p: hasher(p) for p in self.inputs},
+            'source': self.source_value,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def run(self):
+        if self.source:
+            return self.func(source=self.source_value, **self.params)
+        return self.func(**self.params)
+
+def run_csv_compiler(source):
+    from csv_compiler import csv_compiler
+    # El objeto cuyo ETag entro en la huella, sin volver a preguntar a la Lambda
+    csv_compiler(source['bucket'], source['key'])
+
+def run_part_1(write_csv=False):
+    from preprocessing_part_1 import transform_part_1
+    from preprocessing_fused import save_intermediate
+
+    df = pd.read_csv(os.path.join(TEMP_DIR, 'all_data.csv'))
+    save_intermediate(transform_part_1(df), 'preprocessing_part_1', write_csv)
+
+def run_part_2(write_csv=False):
+    from preprocessing_part_2 import transform_part_2
+    from preprocessing_fused import save_intermediate
+
+    df = pd.read_parquet(os.path.join(TEMP_DIR, 'preprocessing_part_1.parquet'))
+    save_intermediate(transform_part_2(df), 'preprocessing_part_2', write_csv)
+
+def run_model(engine="numpy", warm_start=False):
+    from model_DENStream import model_DENStream
+    model_DENStream(engine=engine, streaming=True, warm_start=warm_start)
+
+def default_stages(write_csv=False, engine="numpy", warm_start=False):
+    """csv_compiler -> preprocessing_part_1 -> preprocessing_part_2 -> model_DENStream"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    part_1_csv = [os.path.join(TEMP_DIR, 'preprocessing_part_1.csv')] if write_csv else []
+    part_2_csv = [os.path.join(TEMP_DIR, 'preprocessing_part_2.csv')] if write_csv else []
+    return [
+        Stage('csv_compiler', run_csv_compiler,
+              outputs=[os.path.join(TEMP_DIR, 'all_data.csv')],
+              code=['csv_compiler'], source=daily_json_fingerprint),
+        Stage('preprocessing_part_1', run_part_1,
+              outputs=[os.path.join(TEMP_DIR, 'preprocessing_part_1.parquet')] + part_1_csv,
+              code=['preprocessing_part_1', 'preprocessing_fused'],
+              deps=['csv_compiler'], params={'write_csv': write_csv}),
+        # El scaler se versiona por dia: el dia forma parte de la huella
+        Stage('preprocessing_part_2', run_part_2,
+              outputs=[os.path.join(TEMP_DIR, 'preprocessing_part_2.parquet')] + part_2_csv,
+              code=['preprocessing_part_2', 'preprocessing_fused', 'projection', 'running_scaler'],
+              deps=['preprocessing_part_1'], params={'write_csv': write_csv, 'day': today}),
+        Stage('model_DENStream', run_model,
+              outputs=['/home/ubuntu/model/temp/DENStream.dsm'],
+              code=['model_DENStream', 'denstream_numpy', 'denstream_evaluation', 'denstream_format',
+                    'model_registry', 'running_scaler', 'stream_reader', 'buffered_mlflow'],
+              deps=['preprocessing_part_2'], params={'engine': engine, 'warm_start': warm_start, 'day': today}),
+    ]
+
+# ─────────────── Runner ───────────────
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {'stages': {}, 'files': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _outputs_intact(record, hasher):
+    try:
+        return all(hasher(p) == sha256 for p, sha256 in record['outputs'].items())
+    except FileNotFoundError:
+        return False
+
+def run_pipeline(stages=None, force=False, max_workers=4, manifest_path=MANIFEST_PATH):
+    """
+    Ejecuta las etapas respetando sus dependencias; las independientes
+    corren a la vez. Una etapa se salta si su huella coincide con la del
+    manifiesto y sus salidas no han cambiado. El manifiesto registra, por
+    etapa, la huella, el SHA-256 de cada salida y la duracion: asi se sabe
+    que produjo cada archivo de ~/datasets/temp.
+    """
+    stages = {s.name: s for s in (stages or default_stages())}
+    manifest = load_manifest(manifest_path)
+    hasher = FileHasher(manifest.get('files'))
+    fingerprints, timings = {}, {}
+    pending = dict(stages)
+    lock = threading.Lock()
+
+    def execute(stage):
+        start_time = time.time()
+        fingerprint = stage.fingerprint(fingerprints, hasher)
+        record = manifest['stages'].get(stage.name)
+        if not force and record and record['fingerprint'] == fingerprint and _outputs_intact(record, hasher):
+            status = 'cache'
+        else:
+            print(f"▶ {stage.name}")
+            stage.run()
+            missing = [p for p in stage.outputs if not os.path.exists(p)]
+            if missing:
+                raise RuntimeError(f"La etapa {stage.name} no genero {missing}")
+            record = {
+                'fingerprint': fingerprint,
+                'outputs': {p: hasher(p) for p in stage.outputs},
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+                'duration_sec': time.time() - start_time,
+            }
+            status = 'run'
+        with lock:
+            manifest['stages'][stage.name] = record
+            manifest['files'] = hasher.known
+            save_manifest(manifest, manifest_path)
+        return fingerprint, status, time.time() - start_time
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if all(d in fingerprints for d in stage.deps if d in stages):
+                    running[pool.submit(execute, stage)] = name
+                    del pending[name]
+            if not running:
+                # Nada en marcha y nada listo: las pendientes dependen unas de otras
+                raise RuntimeError(f"Dependencias circulares entre las etapas {sorted(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                fingerprint, status, duration = future.result()
+                fingerprints[name] = fingerprint
+                timings[name] = {'status': status, 'duration_sec': duration}
+                print(f"{'✅' if status == 'run' else '⏭'} {name}: {status} en {duration:.2f} s")
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline DenStream con cache por huella de contenido")
+    parser.add_argument("--force", action="store_true", help="Ejecutar todas las etapas aunque esten en cache")
+    parser.add_argument("--write_csv", action="store_true", help="Guardar tambien los CSV intermedios")
+    parser.add_argument("--engine", choices=["numpy", "river"], default="numpy")
+    parser.add_argument("--warm_start", action="store_true")
+    args = parser.parse_args()
+    run_pipeline(default_stages(args.write_csv, args.engine, args.warm_start), force=args.force)
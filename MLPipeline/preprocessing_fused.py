@@ -0,0 +1,48 @@
+import os
+import time
+import argparse
+import pandas as pd
+
+from preprocessing_part_1 import transform_part_1
+from preprocessing_part_2 import transform_part_2
+
+TEMP_DIR = os.path.expanduser('~/datasets/temp')
+
+def save_intermediate(df, name, write_csv=False):
+    """
+    Guarda un intermedio como Parquet tipado y, opcionalmente, como el CSV de
+    siempre. El CSV va primero para que el Parquet sea el mas reciente: los
+    lectores eligen por mtime (ver model_DENStream.dataset_path).
+    """
+    if write_csv:
+        csv_path = os.path.join(TEMP_DIR, f'{name}.csv')
+        df.to_csv(csv_path, index=False)
+        print(f"Guardado: {csv_path}")
+    parquet_path = os.path.join(TEMP_DIR, f'{name}.parquet')
+    df.to_parquet(parquet_path, index=False)
+    print(f"Guardado: {parquet_path}")
+
+def preprocessing_fused(write_csv=False):
+    """
+    Ejecuta preprocessing_part_1 y preprocessing_part_2 en memoria, sin
+    pasar por CSV entre etapas. Los intermedios se guardan en Parquet;
+    con write_csv=True tambien se generan los CSV anteriores.
+    """
+    start_time = time.time()
+
+    df = pd.read_csv(os.path.join(TEMP_DIR, 'all_data.csv'))
+    print("Se leyo correctametne el dataset")
+
+    df_part_1 = transform_part_1(df)
+    save_intermediate(df_part_1, 'preprocessing_part_1', write_csv)
+
+    df_part_2 = transform_part_2(df_part_1.reset_index(drop=True))
+    save_intermediate(df_part_2, 'preprocessing_part_2', write_csv)
+
+    print(f"Preprocesamiento completo en {time.time() - start_time:.2f} s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocesamiento fusionado (parte 1 + parte 2)")
+    parser.add_argument("--write_csv", action="store_true", help="Guardar tambien los CSV intermedios")
+    args = parser.parse_args()
+    preprocessing_fused(write_csv=args.write_csv)
@@ -2,10 +2,7 @@ import pandas as pd
 from matplotlib import pyplot as plt
 import numpy as np
 
-def preprocessing_part_1():
-    df = pd.read_csv('~/datasets/temp/all_data.csv')
-    print("Se leyo correctametne el dataset")
-
+def transform_part_1(df):
     df['timestamp_ingest'] = df['timestamp_ingest'].str.replace('Z', '', regex=False)
 
     df['timestamp_ingest'] = pd.to_datetime(df['timestamp_ingest'])
@@ -50,6 +47,14 @@ def preprocessing_part_1():
 
     df_complete['zone_id'] = (df_complete['lat_bin'].astype(str) + "_" + df_complete['lon_bin'].astype(str))
 
+    return df_complete
+
+def preprocessing_part_1():
+    df = pd.read_csv('~/datasets/temp/all_data.csv')
+    print("Se leyo correctametne el dataset")
+
+    df_complete = transform_part_1(df)
+
     print("Se guardara en local")
     df_complete.to_csv('~/datasets/temp/preprocessing_part_1.csv', index=False)
     print("Guardado existoso")
@@ -0,0 +1,82 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pyproj import Proj, Transformer
+
+UTM_20S = Proj(proj='utm', zone=20, south=True, ellps='WGS84').srs
+CHUNK_SIZE = 250_000
+
+_local = threading.local()
+
+def get_transformer():
+    """Transformer WGS84 -> UTM 20S, cacheado por hilo (PROJ no comparte contextos entre hilos)"""
+    transformer = getattr(_local, 'transformer', None)
+    if transformer is None:
+        transformer = Transformer.from_crs("EPSG:4326", UTM_20S, always_xy=True)
+        _local.transformer = transformer
+    return transformer
+
+def _project_chunk(x, y, start, stop):
+    # Las vistas se transforman in-place; PROJ libera el GIL durante el calculo
+    get_transformer().transform(x[start:stop], y[start:stop], inplace=True)
+
+def project_lonlat_km(longitude, latitude, chunk_size=CHUNK_SIZE, n_workers=None):
+    """
+    Proyecta lon/lat (grados) a UTM zona 20S en km directamente sobre arrays
+    NumPy. Para entradas grandes se procesa por bloques en varios hilos.
+    Devuelve (x_km, y_km), identicos a GeoDataFrame.to_crs.
+    """
+    x = np.array(longitude, dtype=np.float64)
+    y = np.array(latitude, dtype=np.float64)
+    n = len(x)
+
+    starts = range(0, n, chunk_size)
+    n_workers = n_workers or os.cpu_count() or 1
+    if n <= chunk_size or n_workers == 1:
+        for start in starts:
+            _project_chunk(x, y, start, min(start + chunk_size, n))
+    else:
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            futures = [pool.submit(_project_chunk, x, y, start, min(start + chunk_size, n)) for start in starts]
+            for future in futures:
+                future.result()
+
+    x /= 1_000
+    y /= 1_000
+    return x, y
+
+def project_lonlat_km_geopandas(longitude, latitude):
+    """Ruta anterior con GeoPandas; se mantiene como referencia para el benchmark"""
+    import geopandas as gpd
+    gdf = gpd.GeoDataFrame(
+        geometry=gpd.points_from_xy(longitude, latitude),
+        crs="EPSG:4326"
+    )
+    gdf = gdf.to_crs(UTM_20S)
+    return gdf.geometry.x.to_numpy() / 1_000, gdf.geometry.y.to_numpy() / 1_000
+
+def benchmark_projection(n_points=2_000_000, seed=42):
+    rng = np.random.default_rng(seed)
+    longitude = rng.uniform(-90.0, -30.0, n_points)
+    latitude = rng.uniform(-60.0, 15.0, n_points)
+
+    start_time = time.time()
+    x_ref, y_ref = project_lonlat_km_geopandas(longitude, latitude)
+    geopandas_sec = time.time() - start_time
+
+    project_lonlat_km(longitude[:1], latitude[:1])  # calienta el transformer
+    start_time = time.time()
+    x_km, y_km = project_lonlat_km(longitude, latitude)
+    numpy_sec = time.time() - start_time
+
+    identical = np.array_equal(x_ref, x_km) and np.array_equal(y_ref, y_km)
+    print(f"Puntos: {n_points}")
+    print(f"GeoPandas: {geopandas_sec:.3f} s")
+    print(f"Transformer + NumPy: {numpy_sec:.3f} s ({geopandas_sec / numpy_sec:.1f}x)")
+    print(f"Resultados identicos: {identical}")
+    return geopandas_sec, numpy_sec, identical
+
+if __name__ == "__main__":
+    benchmark_projection()
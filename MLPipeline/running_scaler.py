@@ -0,0 +1,154 @@
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import joblib
+
+SCALER_DIR = Path.home() / 'DENStream_scaler'
+LEGACY_SCALER_PATH = SCALER_DIR / 'scaler.pkl'
+# Un solo scaler para todo el pipeline: preprocessing_part_2 lo actualiza y
+# escala las features; DenStream entrena sobre ellas y el scoring lo reutiliza
+SCALER_NAME = 'preprocessing'
+
+class RunningScaler:
+    """
+    StandardScaler incremental basado en momentos (count, mean, M2).
+    Cada lote se resume y se combina con el historico en O(features)
+    (Chan et al.), sin volver a recorrer los datos anteriores.
+    Expone mean_, var_, scale_ y n_samples_seen_ como el de sklearn.
+    """
+
+    def __init__(self, feature_names=None):
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.n_samples_seen_ = 0
+        self.mean_ = None
+        self.m2_ = None
+
+    @classmethod
+    def from_standard_scaler(cls, scaler, feature_names=None):
+        """Convierte un StandardScaler ya ajustado en un RunningScaler equivalente"""
+        running = cls(feature_names)
+        running.n_samples_seen_ = int(np.max(scaler.n_samples_seen_))
+        running.mean_ = np.asarray(scaler.mean_, dtype=np.float64).copy()
+        running.m2_ = np.asarray(scaler.var_, dtype=np.float64) * running.n_samples_seen_
+        return running
+
+    def _as_array(self, X):
+        if hasattr(X, 'columns') and self.feature_names is not None:
+            X = X[self.feature_names]
+        return np.asarray(X, dtype=np.float64)
+
+    def merge_moments(self, n, mean, m2):
+        """Combina los momentos de un lote (n, mean, M2) con los acumulados"""
+        if n == 0:
+            return self
+        if self.n_samples_seen_ == 0:
+            self.n_samples_seen_ = n
+            self.mean_ = np.array(mean, dtype=np.float64)
+            self.m2_ = np.array(m2, dtype=np.float64)
+            return self
+        total = self.n_samples_seen_ + n
+        delta = mean - self.mean_
+        self.mean_ = self.mean_ + delta * n / total
+        self.m2_ = self.m2_ + m2 + delta ** 2 * self.n_samples_seen_ * n / total
+        self.n_samples_seen_ = total
+        return self
+
+    def partial_fit(self, X):
+        X = self._as_array(X)
+        n = X.shape[0]
+        if n == 0:
+            return self
+        mean = X.mean(axis=0)
+        m2 = ((X - mean) ** 2).sum(axis=0)
+        return self.merge_moments(n, mean, m2)
+
+    def fit(self, X):
+        self.n_samples_seen_ = 0
+        self.mean_ = None
+        self.m2_ = None
+        return self.partial_fit(X)
+
+    @property
+    def var_(self):
+        return self.m2_ / self.n_samples_seen_
+
+    @property
+    def scale_(self):
+        scale = np.sqrt(self.var_)
+        # Igual que sklearn: columnas constantes no se escalan
+        scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+        return scale
+
+    def transform(self, X):
+        return (self._as_array(X) - self.mean_) / self.scale_
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+    def inverse_transform(self, X):
+        return np.asarray(X, dtype=np.float64) * self.scale_ + self.mean_
+
+# ─────────────── Versionado diario ───────────────
+def _version_path(name, day):
+    return SCALER_DIR / f'{name}_{day}.pkl'
+
+def list_versions(name):
+    """Fechas (YYYY-MM-DD) con version guardada para el scaler dado, ordenadas"""
+    pattern = re.compile(rf'^{re.escape(name)}_(\d{{4}}-\d{{2}}-\d{{2}})\.pkl$')
+    if not SCALER_DIR.exists():
+        return []
+    days = [m.group(1) for m in (pattern.match(p.name) for p in SCALER_DIR.iterdir()) if m]
+    return sorted(days)
+
+def load_scaler(name, before=None):
+    """
+    Carga la ultima version del scaler. Con before='YYYY-MM-DD' solo se
+    consideran versiones anteriores a ese dia, para que reejecutar un dia
+    no cuente dos veces el mismo lote.
+    """
+    days = [d for d in list_versions(name) if before is None or d < before]
+    if not days:
+        return None
+    return joblib.load(_version_path(name, days[-1]))
+
+def scaler_for_day(name, day):
+    """Ultima version del scaler con fecha <= day (la que escalo los datos de ese dia)"""
+    next_day = (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    scaler = load_scaler(name, before=next_day)
+    if scaler is None:
+        raise FileNotFoundError(f"No hay version del scaler '{name}' para {day}")
+    return scaler
+
+def _base_scaler(name, day, feature_names, legacy_path):
+    scaler = load_scaler(name, before=day)
+    if scaler is None:
+        if legacy_path is not None and Path(legacy_path).exists():
+            print(f"Se parte del Scaler legado {legacy_path}")
+            scaler = RunningScaler.from_standard_scaler(joblib.load(legacy_path), feature_names)
+        else:
+            scaler = RunningScaler(feature_names)
+    return scaler
+
+def _save_version(scaler, name, day):
+    SCALER_DIR.mkdir(parents=True, exist_ok=True)
+    path = _version_path(name, day)
+    joblib.dump(scaler, path)
+    print(f"Scaler '{name}' actualizado ({scaler.n_samples_seen_} muestras) en {path}")
+
+def update_scaler(name, X, feature_names=None, day=None, legacy_path=None):
+    """
+    Actualiza el scaler `name` con el lote del dia y guarda la version
+    `<name>_<dia>.pkl`. Si no hay versiones previas y existe un
+    StandardScaler legado en legacy_path, se parte de sus estadisticas.
+    """
+    return update_scaler_from_chunks(name, [X], feature_names, day, legacy_path)
+
+def update_scaler_from_chunks(name, chunks, feature_names=None, day=None, legacy_path=None):
+    """Igual que update_scaler, pero el lote del dia llega como un iterable de bloques"""
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    scaler = _base_scaler(name, day, feature_names, legacy_path)
+    for chunk in chunks:
+        scaler.partial_fit(chunk)
+    _save_version(scaler, name, day)
+    return scaler
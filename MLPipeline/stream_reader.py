@@ -0,0 +1,89 @@
+import threading
+import queue
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+CHUNK_SIZE = 100_000
+
+def iter_chunks(path, columns, chunk_size=CHUNK_SIZE):
+    """Lee un Parquet o CSV por bloques de chunk_size filas, solo con las columnas pedidas"""
+    path = str(path)
+    if path.endswith(".parquet"):
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+            yield chunk
+
+def count_rows(path):
+    """Numero de filas de un Parquet (de los metadatos) o de un CSV (una pasada)"""
+    path = str(path)
+    if path.endswith(".parquet"):
+        return pq.ParquetFile(path).metadata.num_rows
+    return sum(len(chunk) for chunk in pd.read_csv(path, usecols=[0], chunksize=CHUNK_SIZE))
+
+_END = object()
+
+def prefetch(chunks, depth=2):
+    """
+    Consume el iterador `chunks` en un hilo de fondo, manteniendo hasta
+    `depth` bloques listos, para solapar la lectura con el entrenamiento.
+    Los errores del hilo lector se relanzan en el consumidor.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def reader():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                buffer.put(chunk)
+            buffer.put(_END)
+        except BaseException as e:
+            buffer.put(e)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Libera al lector si quedo bloqueado en put()
+        while thread.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                thread.join(timeout=0.1)
+
+class ReservoirSample:
+    """Muestra uniforme de tamaño fijo sobre un flujo de bloques (memoria constante)"""
+
+    def __init__(self, size, seed=42):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.keys = np.empty(0)
+        self.rows = None
+
+    def add(self, X):
+        keys = self.rng.random(len(X))
+        if self.rows is None:
+            self.rows = np.empty((0, X.shape[1]))
+        keys = np.concatenate([self.keys, keys])
+        rows = np.concatenate([self.rows, X])
+        if len(keys) > self.size:
+            keep = np.argpartition(keys, self.size)[:self.size]
+            keys, rows = keys[keep], rows[keep]
+        self.keys, self.rows = keys, rows
+
+    @property
+    def values(self):
+        return self.rows if self.rows is not None else np.empty((0, 0))